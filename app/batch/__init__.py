@@ -0,0 +1,105 @@
+import sys
+
+from typing import TextIO
+
+from app.calculation import CalculationFactory
+from app.tokenizer import INVALID_NUMBER, WRONG_FIELD_COUNT, parse_line
+
+'''
+Non-interactive batch mode for the calculator.
+Reads lines in the same <operation> <num1> <num2> format as the REPL and writes one result line per calculation,
+without prompts or banners. Lines are processed in fixed-size chunks, so memory use does not depend on the size of the input.
+'''
+
+# Number of characters of input read (and of output written) at a time
+CHUNK_SIZE = 1 << 20
+
+INVALID_FORMAT = 'Invalid input. Please follow the format: <operation> <num1> <num2>'
+DIVISION_BY_ZERO = 'Cannot divide by zero.'
+
+def evaluate_calculation(line: str) -> tuple:
+
+    # Evaluate one input line. Returns (calculation, None) on success, with the result already computed,
+    # and (None, error message) on failure, without raising.
+
+    parsed = parse_line(line)
+    if parsed == WRONG_FIELD_COUNT or parsed == INVALID_NUMBER:
+        return None, INVALID_FORMAT
+
+    try:
+        calc = CalculationFactory.create_calculation(*parsed)
+    except ValueError as e:
+        return None, str(e)
+
+    try:
+        calc.result
+    except ZeroDivisionError:
+        return None, DIVISION_BY_ZERO
+    except Exception as e:
+        return None, f'An error occurred during calculation: {e}'
+    return calc, None
+
+def evaluate_line(line: str) -> tuple:
+
+    # Evaluate one input line. Returns (True, result text) on success and (False, error message) on failure, without raising.
+
+    calc, error = evaluate_calculation(line)
+    if calc is None:
+        return False, error
+    return True, str(calc)
+
+def run_batch(source: TextIO, out: TextIO, errors: TextIO, chunk_size: int = CHUNK_SIZE) -> int:
+
+    # Evaluate every line of source. Results go to out, one per calculation, and errors go to errors as "line N: message".
+    # Blank lines are skipped. A bad line is reported and the job carries on. Returns the number of lines that failed.
+
+    line_number = 0
+    failed = 0
+    while True:
+        lines = source.readlines(chunk_size)
+        if not lines:
+            break
+
+        results = []
+        problems = []
+        for line in lines:
+            line_number += 1
+            if not line or line.isspace():
+                continue
+            ok, text = evaluate_line(line)
+            if ok:
+                results.append(text)
+            else:
+                problems.append(f'line {line_number}: {text}')
+
+        # One write per chunk instead of one per line
+        if results:
+            out.write('\n'.join(results) + '\n')
+        if problems:
+            errors.write('\n'.join(problems) + '\n')
+            failed += len(problems)
+
+    out.flush()
+    errors.flush()
+    return failed
+
+def batch_main(path: str) -> int:
+
+    # Entry point for main.py --batch FILE|-. "-" reads standard input.
+    # Exit code is 0 if every line succeeded, 1 if any line failed, and 2 if the input could not be opened.
+
+    try:
+        if path == '-':
+            source = open(sys.stdin.fileno(), buffering=CHUNK_SIZE, closefd=False)
+        else:
+            source = open(path, buffering=CHUNK_SIZE)
+    except OSError as e:
+        print(f'Cannot open batch input: {e}', file=sys.stderr)
+        return 2
+
+    sys.stdout.flush()
+    out = open(sys.stdout.fileno(), 'w', buffering=CHUNK_SIZE, closefd=False)
+    with source, out:
+        failed = run_batch(source, out, sys.stderr)
+
+    return 1 if failed else 0
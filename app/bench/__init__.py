@@ -0,0 +1,33 @@
+import time
+import tracemalloc
+
+from app.stats import format_table
+
+'''
+Shared helpers for the benchmarks in this package.
+Benchmarks only use the standard library, so they can run anywhere the calculator runs.
+Their tables are printed with app.stats.format_table, which the REPL's reports share.
+'''
+
+def time_call(function, repeat: int = 3) -> float:
+
+    # Run function() repeat times and return the best wall-clock time in seconds.
+    # The best run is the one least disturbed by other work on the machine.
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def allocated_bytes(function) -> tuple:
+
+    # Return (value returned by function(), bytes still allocated by it afterwards)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        value = function()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return value, after - before
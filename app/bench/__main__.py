@@ -0,0 +1,6 @@
+import sys
+
+from app.bench.suite import main
+
+# python -m app.bench runs the full benchmark suite
+sys.exit(main())
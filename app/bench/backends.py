@@ -0,0 +1,89 @@
+import argparse
+import random
+import sys
+
+from app.bench import format_table, time_call
+from app.bench.suite import DEFAULT_MIX
+from app.calculation import CalculationFactory
+
+'''
+Throughput of each numeric backend on the same workload of (operation, a, b) triples with operands as typed, e.g. '-123.45'.
+Parsing the operands and evaluating the calculations are timed separately, then together, through CalculationFactory.
+The int backend gets the same amounts in whole cents ('-12345'), since it only takes whole numbers.
+
+Run with: python -m app.bench.backends [--size N] [--repeat N] [--backends float,int,fraction,decimal,fixed]
+'''
+
+DEFAULT_BACKENDS = ('float', 'int', 'fraction', 'decimal', 'fixed')
+
+def make_text_workload(size: int, seed: int = 0) -> list:
+
+    # (operation, a, b) triples with two-decimal operands as text. Divisors are never zero.
+    rng = random.Random(seed)
+    operations = rng.choices(list(DEFAULT_MIX), k=size)
+    return [(operation, f'{rng.uniform(-1000, 1000):.2f}', f'{rng.uniform(1, 1000):.2f}') for operation in operations]
+
+def measure(backend: str, workload: list, repeat: int) -> dict:
+
+    previous = CalculationFactory.backend().name
+    parse = CalculationFactory.set_backend(backend).parse
+    evaluate = CalculationFactory.evaluate
+    try:
+        if backend == 'int':
+            workload = [(operation, a.replace('.', ''), b.replace('.', '')) for operation, a, b in workload]
+        parsed = [(operation, parse(a), parse(b)) for operation, a, b in workload]
+
+        def parse_all():
+            for _, a, b in workload:
+                parse(a)
+                parse(b)
+
+        def evaluate_all():
+            for operation, a, b in parsed:
+                evaluate(operation, a, b)
+
+        def both():
+            for operation, a, b in workload:
+                evaluate(operation, parse(a), parse(b))
+
+        size = len(workload)
+        parse_seconds = time_call(parse_all, repeat)
+        evaluate_seconds = time_call(evaluate_all, repeat)
+        total_seconds = time_call(both, repeat)
+    finally:
+        CalculationFactory.set_backend(previous)
+
+    return {
+        'backend': backend,
+        'parse_ns': parse_seconds / (2 * size) * 1e9,
+        'evaluate_ns': evaluate_seconds / size * 1e9,
+        'total_ns': total_seconds / size * 1e9,
+        'ops_per_second': size / total_seconds,
+    }
+
+def run(size: int = 100_000, repeat: int = 3, backends: tuple = DEFAULT_BACKENDS) -> list:
+
+    workload = make_text_workload(size)
+    results = [measure(backend, workload, repeat) for backend in backends]
+    baseline = results[0]['total_ns']
+    for result in results:
+        result['relative'] = result['total_ns'] / baseline
+    return results
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(prog='python -m app.bench.backends', description='Numeric backend throughput benchmark.')
+    parser.add_argument('--size', type=int, default=100_000, help='number of (operation, a, b) triples')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per measurement (the best one is reported)')
+    parser.add_argument('--backends', default=','.join(DEFAULT_BACKENDS), help='comma-separated backends; the first one is the baseline')
+    args = parser.parse_args(argv)
+
+    rows = [
+        [result['backend'], f"{result['parse_ns']:,.0f}", f"{result['evaluate_ns']:,.0f}", f"{result['total_ns']:,.0f}", f"{result['ops_per_second']:,.0f}", f"{result['relative']:.2f}x"]
+        for result in run(args.size, args.repeat, tuple(args.backends.split(',')))
+    ]
+    print(format_table(['backend', 'parse ns/operand', 'evaluate ns/op', 'total ns/op', 'ops/s', 'cost vs first'], rows))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main()) # pragma: no cover
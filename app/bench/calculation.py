@@ -0,0 +1,73 @@
+import argparse
+import sys
+
+from app.bench import allocated_bytes, format_table, time_call
+from app.calculation import AddCalculation
+from app.operation import Operation
+
+'''
+Micro-benchmark for Calculation objects: bytes per object and CPU time per str() render.
+"before" is a copy of the original Calculation design (a per-instance __dict__, and __str__ executing the calculation every time),
+"after" is the current slotted AddCalculation that keeps its result.
+
+Run with: python -m app.bench.calculation [--count N] [--renders N]
+'''
+
+class LegacyAddCalculation:
+
+    # The Calculation design before __slots__ and the cached result
+
+    def __init__(self, a: float, b: float) -> None:
+
+        self.a = a
+        self.b = b
+
+    def execute(self) -> float:
+
+        return Operation.addition(self.a, self.b)
+
+    def __str__(self) -> str:
+
+        return f'{self.__class__.__name__}: {self.a} {self.__class__.__name__.replace('Calculation', '')} {self.b} = {self.execute()}'
+
+def measure(calculation_class, count: int, renders: int) -> dict:
+
+    # Bytes per object, and microseconds per str() once every object has already been rendered once
+    objects, size = allocated_bytes(lambda: [calculation_class(float(i), 0.5) for i in range(count)])
+    for calc in objects:
+        str(calc)
+
+    def render_all():
+        for calc in objects:
+            str(calc)
+
+    seconds = time_call(render_all, repeat=renders)
+    return {
+        'bytes_per_object': size / count,
+        'render_us': seconds / count * 1e6,
+    }
+
+def run(count: int = 100_000, renders: int = 3) -> dict:
+
+    return {
+        'before': measure(LegacyAddCalculation, count, renders),
+        'after': measure(AddCalculation, count, renders),
+    }
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(prog='python -m app.bench.calculation', description='Calculation memory and render benchmark.')
+    parser.add_argument('--count', type=int, default=100_000, help='number of Calculation objects to create')
+    parser.add_argument('--renders', type=int, default=3, help='number of timed render passes (the best one is reported)')
+    args = parser.parse_args(argv)
+
+    results = run(args.count, args.renders)
+    rows = [
+        [name, f"{result['bytes_per_object']:.1f}", f"{result['render_us']:.3f}"]
+        for name, result in results.items()
+    ]
+    print(format_table(['design', 'bytes/object', 'us/render'], rows))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main()) # pragma: no cover
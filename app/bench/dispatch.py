@@ -0,0 +1,85 @@
+import argparse
+import sys
+
+from app.bench import format_table, time_call
+from app.bench.suite import make_workload
+from app.calculation import CalculationFactory
+
+'''
+Benchmark for CalculationFactory.evaluate against the create_calculation-then-execute path, on the same workload.
+Also times evaluate_code (op codes resolved once up front) and the unknown-operation error path.
+
+Run with: python -m app.bench.dispatch [--size N] [--repeat N]
+'''
+
+def run(size: int = 200_000, repeat: int = 3) -> list:
+
+    workload = make_workload(size)
+    codes = CalculationFactory.operation_codes()
+    coded = [(codes[operation], a, b) for operation, a, b in workload]
+    unknown = [('modulo', a, b) for _, a, b in workload[:max(1, size // 10)]]
+
+    create = CalculationFactory.create_calculation
+    evaluate = CalculationFactory.evaluate
+    evaluate_code = CalculationFactory.evaluate_code
+
+    def create_then_execute():
+        for operation, a, b in workload:
+            create(operation, a, b).execute()
+
+    def evaluate_all():
+        for operation, a, b in workload:
+            evaluate(operation, a, b)
+
+    def evaluate_codes():
+        for code, a, b in coded:
+            evaluate_code(code, a, b)
+
+    def unknown_create():
+        for operation, a, b in unknown:
+            try:
+                create(operation, a, b)
+            except ValueError:
+                pass
+
+    def unknown_evaluate():
+        for operation, a, b in unknown:
+            try:
+                evaluate(operation, a, b)
+            except ValueError:
+                pass
+
+    baseline = time_call(create_then_execute, repeat)
+    rows = [
+        ('create_calculation+execute', size, baseline),
+        ('evaluate', size, time_call(evaluate_all, repeat)),
+        ('evaluate_code', size, time_call(evaluate_codes, repeat)),
+        ('unknown op: create_calculation', len(unknown), time_call(unknown_create, repeat)),
+        ('unknown op: evaluate', len(unknown), time_call(unknown_evaluate, repeat)),
+    ]
+    return [
+        {
+            'path': path,
+            'ops_per_second': count / seconds,
+            'ns_per_op': seconds / count * 1e9,
+            'speedup': (baseline / size) / (seconds / count),
+        }
+        for path, count, seconds in rows
+    ]
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(prog='python -m app.bench.dispatch', description='CalculationFactory.evaluate vs create_calculation benchmark.')
+    parser.add_argument('--size', type=int, default=200_000, help='number of (operation, a, b) triples')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per path (the best one is reported)')
+    args = parser.parse_args(argv)
+
+    rows = [
+        [result['path'], f"{result['ops_per_second']:,.0f}", f"{result['ns_per_op']:,.0f}", f"{result['speedup']:.2f}x"]
+        for result in run(args.size, args.repeat)
+    ]
+    print(format_table(['path', 'ops/s', 'ns/op', 'vs create+execute'], rows))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main()) # pragma: no cover
@@ -0,0 +1,81 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from app.bench import format_table
+from app.parallel import evaluate_file
+
+'''
+Scaling benchmark for app.parallel.evaluate_file.
+Generates an input file of <operation> <num1> <num2> lines of the requested size, then evaluates it with 1..N worker processes
+and reports throughput and speedup relative to one worker. Use a multi-gigabyte --size to see scaling on a large input.
+
+Run with: python -m app.bench.parallel [--size BYTES] [--max-workers N] [--chunk-size BYTES] [--file PATH]
+'''
+
+OPERATIONS = ('add', 'subtract', 'multiply', 'divide')
+
+def generate_file(path: str, size: int, seed: int = 0) -> int:
+
+    # Write random calculation lines to path until it holds at least size bytes. Returns the number of lines written.
+    rng = random.Random(seed)
+    written = 0
+    lines = 0
+    with open(path, 'w', buffering=1 << 20) as file:
+        while written < size:
+            block = ''.join(
+                f'{rng.choice(OPERATIONS)} {rng.uniform(-1000, 1000):.3f} {rng.uniform(1, 1000):.3f}\n'
+                for _ in range(10_000)
+            )
+            file.write(block)
+            written += len(block)
+            lines += 10_000
+    return lines
+
+def run(path: str, max_workers: int, chunk_size: int) -> list:
+
+    # Time evaluate_file for 1..max_workers workers. Output goes to os.devnull so only the evaluation is measured.
+    with open(path, 'rb') as file:
+        lines = sum(1 for _ in file)
+    results = []
+    for workers in range(1, max_workers + 1):
+        with open(os.devnull, 'w') as out, open(os.devnull, 'w') as errors:
+            start = time.perf_counter()
+            evaluate_file(path, out, errors, workers=workers, chunk_size=chunk_size)
+            seconds = time.perf_counter() - start
+        results.append({
+            'workers': workers,
+            'seconds': seconds,
+            'lines_per_second': lines / seconds,
+            'speedup': results[0]['seconds'] / seconds if results else 1.0,
+        })
+    return results
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(prog='python -m app.bench.parallel', description='Multiprocess evaluation scaling benchmark.')
+    parser.add_argument('--size', type=int, default=64 << 20, help='bytes of input to generate (default 64 MiB)')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1, help='largest number of workers to try')
+    parser.add_argument('--chunk-size', type=int, default=16 << 20, help='bytes of input per shard')
+    parser.add_argument('--file', help='use this existing input file instead of generating one')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.file
+        if path is None:
+            path = os.path.join(directory, 'input.txt')
+            generate_file(path, args.size)
+        results = run(path, args.max_workers, args.chunk_size)
+
+    rows = [
+        [result['workers'], f"{result['seconds']:.2f}", f"{result['lines_per_second']:,.0f}", f"{result['speedup']:.2f}x"]
+        for result in results
+    ]
+    print(format_table(['workers', 'seconds', 'lines/s', 'speedup'], rows))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main()) # pragma: no cover
@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import sys
+import time
+
+from app.bench import format_table
+from app.server import CalculatorServer
+
+'''
+Local load test for app.server. Starts a CalculatorServer and a swarm of clients in the same process (so on one core),
+opens all of the connections at once, and has every client pipeline its requests before reading the replies.
+
+Run with: python -m app.bench.server [--connections N] [--requests N]
+'''
+
+def raise_file_limit(needed: int) -> None:
+
+    # Every connection uses two file descriptors here (client and server side), so raise the soft limit if the hard limit allows it
+    try:
+        import resource
+    except ImportError: # pragma: no cover - not available on Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        new_soft = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (new_soft, hard))
+
+async def client(host: str, port: int, requests: int) -> int:
+
+    # Send all requests in one go (pipelined), then read one reply line per request. Returns the number of error replies.
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(''.join(f'add {i} {i + 1}\n' for i in range(requests)).encode())
+    await writer.drain()
+    errors = 0
+    for _ in range(requests):
+        line = await reader.readline()
+        if not line or line.startswith(b'Error'):
+            errors += 1
+    writer.close()
+    await writer.wait_closed()
+    return errors
+
+async def load_test(connections: int, requests: int) -> dict:
+
+    server = CalculatorServer('127.0.0.1', 0)
+    await server.start()
+    try:
+        start = time.perf_counter()
+        errors = await asyncio.gather(*(client(server.host, server.port, requests) for _ in range(connections)))
+        seconds = time.perf_counter() - start
+    finally:
+        await server.close()
+
+    total = connections * requests
+    return {
+        'connections': connections,
+        'requests': total,
+        'errors': sum(errors),
+        'seconds': seconds,
+        'requests_per_second': total / seconds,
+    }
+
+def run(connections: int = 2000, requests: int = 50) -> dict:
+
+    raise_file_limit(2 * connections + 64)
+    return asyncio.run(load_test(connections, requests))
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(prog='python -m app.bench.server', description='Concurrent connection load test for the calculator server.')
+    parser.add_argument('--connections', type=int, default=2000, help='number of concurrent client connections')
+    parser.add_argument('--requests', type=int, default=50, help='pipelined requests per connection')
+    args = parser.parse_args(argv)
+
+    result = run(args.connections, args.requests)
+    rows = [[result['connections'], result['requests'], result['errors'], f"{result['seconds']:.2f}", f"{result['requests_per_second']:,.0f}"]]
+    print(format_table(['connections', 'requests', 'errors', 'seconds', 'requests/s'], rows))
+    return 0 if result['errors'] == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main()) # pragma: no cover
@@ -0,0 +1,78 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from app.bench import format_table
+
+'''
+Cold-start benchmark for the one-shot CLI (python main.py add 3 4), with a time budget.
+
+The command is started repeat times as a fresh process and timed wall-clock, so the numbers include interpreter start-up.
+One more run with -X importtime breaks the import time down by module. The benchmark fails (exit status 1)
+if the best cold start is over --budget-ms, so it can guard start-up time in CI.
+
+Run with: python -m app.bench.startup [--budget-ms MS] [--repeat N] [--args 'add 3 4']
+'''
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'main.py')
+
+def parse_importtime(stderr: str) -> list:
+
+    # Parse -X importtime output into (module, self microseconds, cumulative microseconds) tuples
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if not fields[0].strip().isdigit():
+            continue # The header line
+        imports.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return imports
+
+def run(arguments: list = None, repeat: int = 20, python: str = sys.executable) -> dict:
+
+    command = [python, MAIN, *(arguments or ['add', '3', '4'])]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+
+    profiled = subprocess.run([python, '-X', 'importtime', *command[1:]], check=True, capture_output=True, text=True)
+    imports = parse_importtime(profiled.stderr)
+    return {
+        'command': command,
+        'best_ms': min(times) * 1000,
+        'median_ms': statistics.median(times) * 1000,
+        'import_ms': sum(self_us for _, self_us, _ in imports) / 1000,
+        'modules': len(imports),
+        'imports': sorted(imports, key=lambda item: item[1], reverse=True),
+    }
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(prog='python -m app.bench.startup', description='One-shot CLI cold-start benchmark with a time budget.')
+    parser.add_argument('--budget-ms', type=float, default=30.0, help='fail if the best cold start takes longer than this (default 30 ms)')
+    parser.add_argument('--repeat', type=int, default=20, help='number of timed process starts (the best one is checked against the budget)')
+    parser.add_argument('--args', default='add 3 4', help="arguments for main.py (default 'add 3 4')")
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports to show')
+    args = parser.parse_args(argv)
+
+    result = run(args.args.split(), args.repeat)
+    rows = [[module, f'{self_us / 1000:.2f}', f'{cumulative_us / 1000:.2f}'] for module, self_us, cumulative_us in result['imports'][:args.top]]
+    print(format_table(['module', 'self ms', 'cumulative ms'], rows))
+    print()
+    print(f"imports    : {result['modules']} modules, {result['import_ms']:.2f} ms")
+    print(f"cold start : best {result['best_ms']:.2f} ms, median {result['median_ms']:.2f} ms (budget {args.budget_ms:.2f} ms)")
+
+    if result['best_ms'] > args.budget_ms:
+        print(f"FAIL: cold start is {result['best_ms'] - args.budget_ms:.2f} ms over budget.")
+        return 1
+    print('OK: cold start is within budget.')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main()) # pragma: no cover
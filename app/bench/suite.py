@@ -0,0 +1,178 @@
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import random
+import time
+import tracemalloc
+
+from app.bench import format_table
+from app.calculation import CalculationFactory
+from app.calculator import Calculator
+from app.operation import Operation
+from app.tokenizer import parse_line
+
+'''
+Throughput and latency benchmark suite for the calculator. Standard library only.
+
+Every benchmark runs over a synthetic workload of (operation, a, b) triples. The op mix and the operand distribution are configurable:
+'uniform' draws fresh operands for every triple, 'zipf' draws triples from a fixed pool with Zipf-distributed popularity, so hot triples repeat.
+
+Each benchmark is measured in three separate passes, so the measurements do not disturb each other:
+    throughput : the whole workload timed as one loop (ops/sec)
+    latency    : each call timed on its own over a sample of the workload (p50/p99, timer overhead subtracted)
+    memory     : peak memory allocated while running the workload, traced with tracemalloc
+
+Run with: python -m app.bench [--size N] [--mix add=1,divide=2] [--distribution uniform|zipf] [--history-sizes 1000,100000,1000000] [--json FILE]
+'''
+
+OPERATIONS = {
+    'add': Operation.addition,
+    'subtract': Operation.subtraction,
+    'multiply': Operation.multiplication,
+    'divide': Operation.division,
+}
+
+DEFAULT_MIX = {'add': 1, 'subtract': 1, 'multiply': 1, 'divide': 1}
+
+def parse_mix(text: str) -> dict:
+
+    # Parse an op mix such as 'add=3,divide=1' into {'add': 3.0, 'divide': 1.0}
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation in op mix: '{name}'. Available operations: {', '.join(OPERATIONS)}")
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+def make_workload(size: int, mix: dict = None, distribution: str = 'uniform', seed: int = 0, pool_size: int = 1000, zipf_s: float = 1.1) -> list:
+
+    # Build a list of size (operation, a, b) triples. Divisors are never zero, so every triple is a successful calculation.
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    names = list(mix)
+    op_weights = list(itertools.accumulate(mix[name] for name in names))
+
+    def draw(count):
+        operations = rng.choices(names, cum_weights=op_weights, k=count)
+        return [(operation, rng.uniform(-1000, 1000), rng.uniform(1, 1000)) for operation in operations]
+
+    if distribution == 'uniform':
+        return draw(size)
+    if distribution == 'zipf':
+        pool = draw(pool_size)
+        weights = list(itertools.accumulate(1 / rank ** zipf_s for rank in range(1, pool_size + 1)))
+        return rng.choices(pool, cum_weights=weights, k=size)
+    raise ValueError(f"Unknown operand distribution: '{distribution}'. Available distributions: uniform, zipf")
+
+def percentile(sorted_values: list, fraction: float) -> float:
+
+    # Nearest-rank percentile of an already sorted list
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def measure(name: str, call, items: list, units_per_call: int = 1, latency_sample: int = 10_000) -> dict:
+
+    # Run call(item) for every item in three passes: throughput, per-call latency and peak memory
+
+    start = time.perf_counter()
+    for item in items:
+        call(item)
+    seconds = time.perf_counter() - start
+
+    clock = time.perf_counter_ns
+    overhead = min(-clock() + clock() for _ in range(1000))
+    latencies = []
+    for item in items[:latency_sample]:
+        before = clock()
+        call(item)
+        latencies.append(max(0, clock() - before - overhead))
+    latencies.sort()
+
+    tracemalloc.start()
+    try:
+        for item in items:
+            call(item)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'benchmark': name,
+        'ops': len(items) * units_per_call,
+        'ops_per_second': len(items) * units_per_call / seconds if seconds else float('inf'),
+        'p50_ns': percentile(latencies, 0.50),
+        'p99_ns': percentile(latencies, 0.99),
+        'peak_memory_bytes': peak,
+    }
+
+def filled_calculator(workload: list, entries: int) -> Calculator:
+
+    # A Calculator whose history holds the given number of entries, taken from the workload
+    calc = Calculator()
+    for operation, a, b in itertools.islice(itertools.cycle(workload), entries):
+        calculation = CalculationFactory.create_calculation(operation, a, b)
+        calc.history.append(calculation, calculation.result)
+    return calc
+
+def run_suite(size: int = 100_000, mix: dict = None, distribution: str = 'uniform', history_sizes: tuple = (1_000, 100_000, 1_000_000), seed: int = 0) -> list:
+
+    workload = make_workload(size, mix, distribution, seed)
+    results = []
+
+    results.append(measure('operation', lambda item: OPERATIONS[item[0]](item[1], item[2]), workload))
+    results.append(measure('factory+execute', lambda item: CalculationFactory.create_calculation(*item).execute(), workload))
+    results.append(measure('factory.evaluate', lambda item: CalculationFactory.evaluate(*item), workload))
+
+    lines = [f'{operation} {a} {b}' for operation, a, b in workload]
+    results.append(measure('repl_parse', parse_line, lines))
+
+    calculations = [CalculationFactory.create_calculation(*item) for item in workload]
+    for calculation in calculations:
+        calculation.result
+    results.append(measure('str', str, calculations))
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for entries in history_sizes:
+            calc = filled_calculator(workload, entries)
+            results.append(measure(f'display_history[{entries}]', lambda _: calc.display_history(), [None] * 3, units_per_call=entries))
+
+    return results
+
+def format_results(results: list) -> str:
+
+    rows = [
+        [
+            result['benchmark'],
+            f"{result['ops_per_second']:,.0f}",
+            f"{result['p50_ns'] / 1000:,.2f}",
+            f"{result['p99_ns'] / 1000:,.2f}",
+            f"{result['peak_memory_bytes'] / 1024:,.1f}",
+        ]
+        for result in results
+    ]
+    return format_table(['benchmark', 'ops/s', 'p50 us', 'p99 us', 'peak KiB'], rows)
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(prog='python -m app.bench', description='Calculator throughput and latency benchmark suite.')
+    parser.add_argument('--size', type=int, default=100_000, help='number of (operation, a, b) triples in the workload')
+    parser.add_argument('--mix', type=parse_mix, default=None, help="op mix, e.g. 'add=3,divide=1' (default: all four equally)")
+    parser.add_argument('--distribution', choices=['uniform', 'zipf'], default='uniform', help='operand distribution')
+    parser.add_argument('--history-sizes', default='1000,100000,1000000', help='comma-separated history sizes for display_history')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the workload')
+    parser.add_argument('--json', metavar='FILE', help="also write the results as JSON to FILE ('-' for standard output)")
+    args = parser.parse_args(argv)
+
+    history_sizes = tuple(int(size) for size in args.history_sizes.split(',') if size)
+    results = run_suite(args.size, args.mix, args.distribution, history_sizes, args.seed)
+
+    print(format_results(results))
+    if args.json == '-':
+        print(json.dumps(results, indent=2))
+    elif args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0
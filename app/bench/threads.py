@@ -0,0 +1,59 @@
+import argparse
+import os
+import platform
+import sys
+
+from app.bench import format_table, time_call
+from app.bench.suite import make_workload
+from app.parallel import evaluate_calculations
+
+'''
+Thread scaling benchmark for app.parallel.evaluate_calculations, the thread-pool evaluator.
+Evaluates the same workload with 1..N threads and reports throughput and speedup over one thread.
+
+With the GIL only one thread runs Python code at a time, so expect no speedup (and some overhead). On a free-threaded build
+(e.g. python3.13t) the threads run in parallel, and because registry lookups take no lock they should scale with the cores.
+Run it under both interpreters to compare; the first line of the output says which kind is running.
+
+Run with: python -m app.bench.threads [--size N] [--max-workers N] [--chunk-size N] [--repeat N]
+'''
+
+def gil_enabled() -> bool:
+
+    # sys._is_gil_enabled only exists from Python 3.13; earlier versions always have the GIL
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+def run(size: int = 1_000_000, max_workers: int = os.cpu_count() or 1, chunk_size: int = 4096, repeat: int = 3) -> list:
+
+    workload = make_workload(size)
+    results = []
+    for workers in range(1, max_workers + 1):
+        seconds = time_call(lambda: evaluate_calculations(workload, workers, chunk_size), repeat)
+        results.append({
+            'workers': workers,
+            'seconds': seconds,
+            'ops_per_second': size / seconds,
+            'speedup': results[0]['seconds'] / seconds if results else 1.0,
+        })
+    return results
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(prog='python -m app.bench.threads', description='Thread-pool evaluator scaling benchmark.')
+    parser.add_argument('--size', type=int, default=1_000_000, help='number of (operation, a, b) triples')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1, help='largest number of threads to try')
+    parser.add_argument('--chunk-size', type=int, default=4096, help='triples per task')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per thread count (the best one is reported)')
+    args = parser.parse_args(argv)
+
+    print(f"Python {platform.python_version()} ({'GIL enabled' if gil_enabled() else 'free-threaded, GIL disabled'}), {os.cpu_count()} CPUs")
+    rows = [
+        [result['workers'], f"{result['seconds']:.3f}", f"{result['ops_per_second']:,.0f}", f"{result['speedup']:.2f}x"]
+        for result in run(args.size, args.max_workers, args.chunk_size, args.repeat)
+    ]
+    print(format_table(['threads', 'seconds', 'ops/s', 'speedup'], rows))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main()) # pragma: no cover
@@ -0,0 +1,98 @@
+import argparse
+import itertools
+import random
+import sys
+
+from app.bench import format_table, time_call
+from app.bench.suite import DEFAULT_MIX
+from app.calculation import CalculationFactory
+from app.tokenizer import INVALID_NUMBER, WRONG_FIELD_COUNT, LineParser
+
+'''
+Line parsing benchmark: LineParser against the parsing the REPL and batch mode did before it
+(split(), then the backend's parse in a try/except ValueError), on clean input and on input with a share of junk lines.
+Junk is mostly what real feeds carry: header rows, placeholders and typos in the numbers, plus some lines with the wrong field count.
+Each case is run with few distinct number literals and with many (prices or IDs that rarely repeat).
+
+Run with: python -m app.bench.tokenizer [--size N] [--junk 0,0.1,0.3] [--distinct 1000,1000000] [--repeat N]
+'''
+
+JUNK = ('operation a b', 'add N/A 2', 'multiply 3 x4', 'subtract 1.2.3 4', 'add 1e 5', 'divide - 7', 'add 1', 'divide 2 3 4')
+
+def make_lines(size: int, junk: float, distinct: int = 1000, seed: int = 0) -> list:
+
+    # Input lines, a junk share of them malformed. Numbers are drawn from distinct literals, as real feeds repeat values.
+    rng = random.Random(seed)
+    literals = [f'{rng.uniform(-1000, 1000):.2f}' for _ in range(distinct)]
+    operations = list(DEFAULT_MIX)
+    return [
+        rng.choice(JUNK) if rng.random() < junk else f'{rng.choice(operations)} {rng.choice(literals)} {rng.choice(literals)}'
+        for _ in range(size)
+    ]
+
+def parse_with_exceptions(line: str):
+
+    # The REPL's and batch mode's parsing before LineParser, with the same results as LineParser.parse
+    parts = line.split()
+    if len(parts) != 3:
+        return WRONG_FIELD_COUNT
+    parse = CalculationFactory.backend().parse
+    try:
+        return parts[0], parse(parts[1]), parse(parts[2])
+    except ValueError:
+        return INVALID_NUMBER
+
+def count_good(lines: list, parse) -> int:
+
+    good = 0
+    for line in lines:
+        if parse(line).__class__ is tuple:
+            good += 1
+    return good
+
+def run(size: int = 1_000_000, junk_shares: tuple = (0.0, 0.1, 0.3), distinct: tuple = (1000, 1_000_000), repeat: int = 3) -> list:
+
+    results = []
+    for literals, junk in itertools.product(distinct, junk_shares):
+        lines = make_lines(size, junk, literals)
+        assert count_good(lines, parse_with_exceptions) == count_good(lines, LineParser().parse)
+        exceptions_seconds = time_call(lambda: count_good(lines, parse_with_exceptions), repeat)
+        parser_seconds = time_call(lambda: count_good(lines, LineParser().parse), repeat)
+        results.append({
+            'distinct': literals,
+            'junk': junk,
+            'exceptions_ns': exceptions_seconds / size * 1e9,
+            'parser_ns': parser_seconds / size * 1e9,
+            'speedup': exceptions_seconds / parser_seconds,
+        })
+    return results
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(prog='python -m app.bench.tokenizer', description='Line parsing benchmark.')
+    parser.add_argument('--size', type=int, default=1_000_000, help='number of input lines')
+    parser.add_argument('--junk', default='0,0.1,0.3', help='comma-separated shares of malformed lines to try')
+    parser.add_argument('--distinct', default='1000,1000000', help='comma-separated numbers of distinct number literals to try')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per measurement (the best one is reported)')
+    args = parser.parse_args(argv)
+
+    rows = [
+        [
+            f"{result['distinct']:,}",
+            f"{result['junk']:.0%}",
+            f"{result['exceptions_ns']:,.0f}",
+            f"{result['parser_ns']:,.0f}",
+            f"{result['speedup']:.2f}x",
+        ]
+        for result in run(
+            args.size,
+            tuple(float(share) for share in args.junk.split(',')),
+            tuple(int(count) for count in args.distinct.split(',')),
+            args.repeat,
+        )
+    ]
+    print(format_table(['distinct', 'junk', 'try/except ns/line', 'LineParser ns/line', 'speedup'], rows))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main()) # pragma: no cover
@@ -0,0 +1,80 @@
+import argparse
+import random
+import sys
+import time
+
+from app.bench import format_table, time_call
+from app.workbook import Workbook
+
+'''
+Workbook benchmark: build a workbook of named cells, then change one input cell at a time and compare the incremental recompute
+(only the cells downstream of the change) with recomputing every cell, which is what re-entering a model line by line amounts to.
+
+The first inputs cells are numbers. Every other cell applies a random operation to a random earlier cell and a small constant,
+so the cells form a random forest under the inputs, and an edit to an input reaches on average size / inputs cells.
+
+Run with: python -m app.bench.workbook [--size N] [--inputs N] [--edits N] [--repeat N]
+'''
+
+OPERATIONS = ('add', 'subtract', 'multiply', 'divide')
+
+def build(size: int, inputs: int, seed: int = 0) -> Workbook:
+
+    rng = random.Random(seed)
+    workbook = Workbook()
+    for i in range(min(size, inputs)):
+        workbook.set(f'c{i}', f'{rng.uniform(-10, 10):.3f}')
+    for i in range(inputs, size):
+        workbook.set(f'c{i}', f'{rng.choice(OPERATIONS)} c{rng.randrange(i)} {rng.uniform(1, 2):.3f}')
+    return workbook
+
+def run(size: int = 100_000, inputs: int = 1000, edits: int = 1000, repeat: int = 3, seed: int = 0) -> dict:
+
+    start = time.perf_counter()
+    workbook = build(size, inputs, seed)
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(seed + 1)
+    changes = [(f'c{rng.randrange(min(size, inputs))}', f'{rng.uniform(-10, 10):.3f}') for _ in range(edits)]
+    recomputed = []
+
+    def edit_all():
+        recomputed.clear()
+        for name, formula in changes:
+            recomputed.append(len(workbook.set(name, formula)))
+
+    edit_seconds = time_call(edit_all, repeat)
+    full_seconds = time_call(workbook.recompute_all, repeat)
+    edit_us = edit_seconds / edits * 1e6
+    return {
+        'cells': size,
+        'build_seconds': build_seconds,
+        'edit_us': edit_us,
+        'cells_per_edit': sum(recomputed) / edits,
+        'full_us': full_seconds * 1e6,
+        'speedup': full_seconds * 1e6 / edit_us,
+    }
+
+def main(argv: list = None) -> int:
+
+    parser = argparse.ArgumentParser(prog='python -m app.bench.workbook', description='Workbook incremental recompute benchmark.')
+    parser.add_argument('--size', type=int, default=100_000, help='number of cells')
+    parser.add_argument('--inputs', type=int, default=1000, help='number of input (number) cells')
+    parser.add_argument('--edits', type=int, default=1000, help='number of single-cell edits timed')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per measurement (the best one is reported)')
+    args = parser.parse_args(argv)
+
+    result = run(args.size, args.inputs, args.edits, args.repeat)
+    rows = [[
+        f"{result['cells']:,}",
+        f"{result['build_seconds']:.2f}",
+        f"{result['edit_us']:,.1f}",
+        f"{result['cells_per_edit']:,.1f}",
+        f"{result['full_us']:,.0f}",
+        f"{result['speedup']:,.0f}x",
+    ]]
+    print(format_table(['cells', 'build s', 'us per edit', 'cells recomputed per edit', 'full recompute us', 'edit vs full'], rows))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main()) # pragma: no cover
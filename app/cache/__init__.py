@@ -0,0 +1,110 @@
+import threading
+
+from collections import OrderedDict
+
+class LRUCache:
+
+    '''
+    A size-bounded mapping that evicts the least recently used entry when it is full.
+
+    To stop a one-off scan of new keys from flushing out the entries that are used all the time, a new key is only admitted
+    into a full cache if it has been requested more often than the entry it would evict (a TinyLFU-style admission policy).
+    Request frequencies are counted in a separate table that is halved every few requests, so old popularity fades away.
+
+    get, put and clear hold a lock, so one cache can be shared between threads.
+    '''
+
+    def __init__(self, maxsize: int = 1024, admission: bool = True) -> None:
+
+        if maxsize < 1:
+            raise ValueError('Cache size must be at least 1.')
+
+        self.maxsize = maxsize
+        self.admission = admission
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # key -> number of recent requests, halved once sample_size requests have been counted
+        self._frequencies = {}
+        self._sample_size = 10 * maxsize
+        self._sampled = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def get(self, key, default=None):
+
+        # Return the value for key (marking it as recently used), or default if it is not cached
+        with self._lock:
+            if self.admission:
+                self._record(key)
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> bool:
+
+        # Add key to the cache. Returns False if the admission policy turned it away.
+        with self._lock:
+            entries = self._entries
+            if key in entries:
+                entries[key] = value
+                entries.move_to_end(key)
+                return True
+
+            if len(entries) >= self.maxsize:
+                victim = next(iter(entries))
+                if self.admission and self._frequencies.get(key, 0) <= self._frequencies.get(victim, 0):
+                    self.rejections += 1
+                    return False
+                del entries[victim]
+                self.evictions += 1
+
+            entries[key] = value
+            return True
+
+    def clear(self) -> None:
+
+        with self._lock:
+            self._entries.clear()
+            self._frequencies.clear()
+            self._sampled = 0
+
+    def __len__(self) -> int:
+
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+
+        return key in self._entries
+
+    def stats(self) -> dict:
+
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'rejections': self.rejections,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hit_rate': self.hits / requests if requests else 0.0,
+        }
+
+    def _record(self, key) -> None:
+
+        # Count a request for key. Every sample_size requests, halve all counts so the table stays small and recent.
+        frequencies = self._frequencies
+        frequencies[key] = frequencies.get(key, 0) + 1
+        self._sampled += 1
+        if self._sampled >= self._sample_size:
+            self._frequencies = {k: count // 2 for k, count in frequencies.items() if count > 1}
+            self._sampled = 0
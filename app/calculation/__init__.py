@@ -1,14 +1,44 @@
+import sys
+import threading
+
 from abc import ABC, abstractmethod
+from types import MappingProxyType
 
-from app.operation import Operation
+from app.cache import LRUCache
+from app.operation import Operation, numeric_backend
 
 class Calculation(ABC):
 
+    '''
+    A calculation is a small value object: its two operands plus its result, which is computed the first time it is needed and then kept.
+    The operands are read-only, so the kept result (and the hash) always match them.
+    __slots__ keeps each object free of a per-instance __dict__. Subclasses should declare __slots__ = () so they stay slotted.
+    '''
+
+    __slots__ = ('_a', '_b', '_result', '_error')
+
     def __init__(self, a: float, b: float) -> None:
 
         # All subclasses should have these same attributes, i.e. the two numbers that are being operated on
-        self.a = a
-        self.b = b
+        self._a = a
+        self._b = b
+
+    @property
+    def a(self) -> float:
+
+        return self._a
+
+    @property
+    def b(self) -> float:
+
+        return self._b
+
+    @classmethod
+    def operation(cls):
+
+        # The plain function (a, b) -> result that this type of calculation performs, for callers that do not need Calculation objects.
+        # By default it builds a calculation and executes it; the built-in subclasses return the current numeric backend's function directly.
+        return lambda a, b: cls(a, b).execute()
 
     @abstractmethod
     def execute(self) -> float:
@@ -17,28 +47,153 @@ class Calculation(ABC):
         # Performs the actual calculation.
         pass # pragma: no cover
 
+    @property
+    def result(self) -> float:
+
+        # Execute the calculation the first time the result is needed, and reuse it after that.
+        # An arithmetic error (e.g. division by zero) is kept too, and raised again on every access without executing again.
+        try:
+            return self._result
+        except AttributeError:
+            pass
+        try:
+            error = self._error
+        except AttributeError:
+            try:
+                self._result = self.execute()
+            except ArithmeticError as e:
+                self._error = e
+                raise
+            return self._result
+        raise error.with_traceback(None)
+
+    @classmethod
+    def from_result(cls, a: float, b: float, result: float) -> 'Calculation':
+
+        # Rebuild a calculation whose result is already known (e.g. from the history) without executing it again
+        calc = cls(a, b)
+        calc._result = result
+        return calc
+
     def __str__(self) -> str:
 
         # String representation of the object that describes the calculation
-        return f'{self.__class__.__name__}: {self.a} {self.__class__.__name__.replace('Calculation', '')} {self.b} = {self.execute()}'
+        return self.format(self.a, self.b, self.result)
+
+    @classmethod
+    def format(cls, a: float, b: float, result: float) -> str:
+
+        # Describe a calculation of this type, given its operands and result
+        return f'{cls.__name__}: {a} {cls.__name__.replace('Calculation', '')} {b} = {result}'
 
     def __repr__(self) -> str:
 
         # Return a printout of the object, including its class name and its data
         return f'{self.__class__.__name__}(a={self.a}, b={self.b})'
 
+    def __eq__(self, other: object) -> bool:
+
+        # Two calculations are equal if they are the same type of calculation on the same operands
+        if type(self) is not type(other):
+            return NotImplemented
+        return self.a == other.a and self.b == other.b
+
+    def __hash__(self) -> int:
+
+        return hash((type(self), self.a, self.b))
+
 class CalculationFactory:
 
     '''
     Allow dynamic creation of different Calculation subclasses, by storing a dictionary (_calculations) that maps operation to class name.
+
+    The registry is copy-on-write, so it can be used from many threads (including on free-threaded Python builds).
+    _calculations and _plugins are read-only snapshots: a change copies the current one, edits the copy and swaps it in while holding _lock.
+    Readers only load the current snapshot, so lookups and evaluate never take a lock and never see a half-made change.
     '''
 
-    _calculations = {}
+    _calculations = MappingProxyType({})
+
+    # Held by every change to the registry, the backend, and the tables built from them. Reentrant, because loading a plugin
+    # (which holds it) imports a module that may register its own classes.
+    _lock = threading.RLock()
+
+    # Incremented on every change to _calculations, so anything built from the registry can tell when it is out of date
+    _version = 0
+
+    # Optional result cache, see enable_cache
+    _cache = None
+
+    # Numeric backend (Operation or a subclass of it), see set_backend. The built-in operations call its functions.
+    _backend = Operation
+
+    # Frozen lookup tables for evaluate, built from _calculations on first use and thrown away whenever the registry changes:
+    # operation name -> function, op code -> function, operation name -> op code, and the "Available types" list for error messages.
+    _dispatch = None
+    _functions = ()
+    _codes = MappingProxyType({})
+    _valid_types = ''
+
+    # Entry point group that other packages use to provide operations, e.g. in their pyproject.toml:
+    #     [project.entry-points."calculator.operations"]
+    #     power = "calculator_power:PowerCalculation"
+    PLUGIN_GROUP = 'calculator.operations'
+
+    # Operation name -> entry point, for plugin operations that have not been imported yet.
+    # Installed plugins are looked up the first time an operation is not found among the registered ones.
+    _plugins = MappingProxyType({})
+    _plugins_discovered = False
 
     @classmethod
     def reset_calculations(cls):
 
-        cls._calculations.clear()
+        # Forget every operation, including plugins. Installed plugins are looked up again on the next miss, as at startup.
+        with cls._lock:
+            cls._calculations = MappingProxyType({})
+            cls._plugins = MappingProxyType({})
+            cls._plugins_discovered = False
+            cls._registry_changed()
+            if cls._cache is not None:
+                cls._cache.clear()
+
+    @classmethod
+    def enable_cache(cls, maxsize: int = 1024, admission: bool = True) -> None:
+
+        # Turn on memoization of create_calculation: repeated (operation, a, b) requests return the same Calculation object,
+        # whose result has already been computed. Division by zero is cached like any other outcome.
+        cls._cache = LRUCache(maxsize, admission)
+
+    @classmethod
+    def disable_cache(cls) -> None:
+
+        cls._cache = None
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+
+        # Hit, miss, eviction and rejection counters of the result cache, or None if it is disabled
+        if cls._cache is None:
+            return None
+        return cls._cache.stats()
+
+    @classmethod
+    def set_backend(cls, name: str) -> type:
+
+        # Switch every built-in operation to a numeric backend, e.g. 'fraction' or 'decimal:50' (see app.operation).
+        # The lookup tables for evaluate are rebuilt with the backend's functions, so a calculation does not check which backend is in use.
+        backend = numeric_backend(name)
+        with cls._lock:
+            if backend is not cls._backend:
+                cls._backend = backend
+                cls._registry_changed()
+                if cls._cache is not None:
+                    cls._cache.clear()
+        return backend
+
+    @classmethod
+    def backend(cls) -> type:
+
+        return cls._backend
 
     @classmethod
     def register_calculation(cls, calculation_type: str):
@@ -47,51 +202,230 @@ class CalculationFactory:
 
         def decorator(subclass):
 
-            if calculation_type.lower() in cls._calculations:
-                raise ValueError(f"Calculation type '{calculation_type}' is already registered.")
-            cls._calculations[calculation_type.lower()] = subclass
+            name = calculation_type.lower()
+            with cls._lock:
+                if name in cls._calculations:
+                    raise ValueError(f"Calculation type '{calculation_type}' is already registered.")
+                cls._calculations = MappingProxyType({**cls._calculations, name: subclass})
+                if name in cls._plugins:
+                    cls._plugins = MappingProxyType({key: value for key, value in cls._plugins.items() if key != name})
+                cls._registry_changed()
             return subclass
 
         return decorator
 
     @classmethod
-    def create_calculation(cls, calculation_type: str, a: float, b: float) -> Calculation:
+    def discover_plugins(cls, entry_points: list = None) -> list:
+
+        # Record the names of the plugin operations installed under PLUGIN_GROUP, without importing them, and return the new names.
+        # Each plugin module is imported the first time its operation is requested. Pass entry_points to use those instead of the installed ones.
+        if entry_points is None:
+            from importlib.metadata import entry_points as installed_entry_points
+            entry_points = installed_entry_points(group=cls.PLUGIN_GROUP)
+
+        with cls._lock:
+            cls._plugins_discovered = True
+            plugins = dict(cls._plugins)
+            names = []
+            for entry_point in entry_points:
+                name = entry_point.name.lower()
+                if name not in cls._calculations and name not in plugins:
+                    plugins[name] = entry_point
+                    names.append(name)
+            cls._plugins = MappingProxyType(plugins)
+            cls._registry_changed()
+        return names
 
-        # Access _calucations dictionary to instantiate an object of the type corresponding to calculation_type
+    @classmethod
+    def _load_plugin(cls, name: str) -> type:
+
+        # Import the plugin for operation name and register its Calculation class. Returns None if there is no such plugin.
+        # The lock is held throughout, so two threads asking for the same new operation load it only once.
+        with cls._lock:
+            if not cls._plugins_discovered:
+                cls.discover_plugins()
+            if name in cls._calculations:
+                return cls._calculations[name] # Another thread loaded it first
+            entry_point = cls._plugins.get(name)
+            if entry_point is None:
+                return None
+
+            try:
+                loaded = entry_point.load()
+            except (ImportError, AttributeError) as e:
+                raise ValueError(f"Could not load the plugin for calculation type '{name}': {e}") from None
+
+            # The plugin module may have registered its class itself when it was imported
+            if name not in cls._calculations:
+                if not (isinstance(loaded, type) and issubclass(loaded, Calculation)):
+                    raise ValueError(f"The plugin for calculation type '{name}' is not a Calculation class: {entry_point.value}")
+                cls.register_calculation(name)(loaded)
+            return cls._calculations[name]
+
+    @classmethod
+    def _registry_changed(cls) -> None:
+
+        # Called with _lock held
+        cls._version += 1
+        cls._dispatch = None
+
+    @classmethod
+    def _build_dispatch(cls) -> MappingProxyType:
+
+        # Precompute everything evaluate needs, so a call is one dict lookup plus one function call.
+        # Built under the lock, so a registry change cannot happen half-way through. _dispatch is published last,
+        # because readers take a non-None _dispatch to mean the other tables are ready.
+        with cls._lock:
+            if cls._dispatch is not None:
+                return cls._dispatch # Another thread built it first
+            calculations = cls._calculations
+            names = sorted(calculations)
+            functions = tuple(calculations[name].operation() for name in names)
+            cls._functions = functions
+            cls._codes = MappingProxyType({sys.intern(name): code for code, name in enumerate(names)})
+            cls._valid_types = ', '.join(sorted({*names, *cls._plugins}))
+            cls._dispatch = MappingProxyType({sys.intern(name): function for name, function in zip(names, functions)})
+            return cls._dispatch
+
+    @classmethod
+    def _unsupported(cls, calculation_type: str) -> ValueError:
+
+        if cls._dispatch is None:
+            cls._build_dispatch()
+        return ValueError(f"Unsupported calculation type: '{calculation_type}'. Available types: {cls._valid_types}")
+
+    @classmethod
+    def calculation_class(cls, calculation_type: str) -> type:
+
+        # Look up the Calculation subclass registered for calculation_type (case-insensitive)
 
         calculation_class = cls._calculations.get(calculation_type.lower())
         if not calculation_class:
-            valid_types = ', '.join(sorted(list(cls._calculations.keys())))
-            raise ValueError(f"Unsupported calculation type: '{calculation_type}'. Available types: {valid_types}")
+            calculation_class = cls._load_plugin(calculation_type.lower())
+            if calculation_class is None:
+                raise cls._unsupported(calculation_type)
+        return calculation_class
+
+    @classmethod
+    def calculation_type(cls, calculation_class: type) -> str:
+
+        # The reverse of calculation_class: the name a Calculation subclass is registered under
+        for calculation_type, registered in cls._calculations.items():
+            if registered is calculation_class:
+                return calculation_type
+        raise ValueError(f"Calculation class '{calculation_class.__name__}' is not registered.")
 
-        return calculation_class(a, b)
+    @classmethod
+    def evaluate(cls, calculation_type: str, a: float, b: float) -> float:
+
+        # Fast path for callers that only need the result: no Calculation object, no history, no result cache.
+        # The operation is looked up in a frozen table of the underlying functions, which is rebuilt only when the registry changes.
+
+        dispatch = cls._dispatch
+        if dispatch is None:
+            dispatch = cls._build_dispatch()
+        function = dispatch.get(calculation_type)
+        if function is None:
+            function = dispatch.get(calculation_type.lower())
+            if function is None:
+                # Not registered: load it as a plugin, or raise the unsupported-type error
+                function = cls.calculation_class(calculation_type).operation()
+        return function(a, b)
+
+    @classmethod
+    def operation_codes(cls) -> MappingProxyType:
+
+        # Read-only mapping of operation name -> op code, for use with evaluate_code.
+        # Codes are only valid until the registry next changes.
+        if cls._dispatch is None:
+            cls._build_dispatch()
+        return cls._codes
+
+    @classmethod
+    def evaluate_code(cls, code: int, a: float, b: float) -> float:
+
+        # Like evaluate, but with an op code from operation_codes, for callers that resolve the operation once for many operands
+        if cls._dispatch is None:
+            cls._build_dispatch()
+        return cls._functions[code](a, b)
+
+    @classmethod
+    def create_calculation(cls, calculation_type: str, a: float, b: float) -> Calculation:
+
+        # Access _calucations dictionary to instantiate an object of the type corresponding to calculation_type
+
+        operation = calculation_type.lower()
+        cache = cls._cache
+        if cache is not None:
+            key = _cache_key(operation, a, b)
+            calc = cache.get(key)
+            if calc is not None:
+                return calc
+
+        calc = cls.calculation_class(calculation_type)(a, b)
+        if cache is not None:
+            cache.put(key, calc)
+        return calc
+
+def _cache_key(operation: str, a: float, b: float) -> tuple:
+
+    # Key for the result cache. Operand types are part of the key because 1 and 1.0 print differently,
+    # and zeros are keyed by repr because 0.0 and -0.0 compare equal but give different results (0.0 * -1 is -0.0, -0.0 * -1 is 0.0).
+    if a and b:
+        return (operation, a, b, type(a), type(b))
+    return (operation, repr(a), repr(b))
 
 '''
 Create each Calculation subclass using CalculationFactory based on operation name (ex. add).
-Each subclass is the same, except that the execute method calls a different Operation.
+Each subclass is the same, except that the execute method calls a different operation of the current numeric backend
+(by default the float backend, which is Operation itself).
 '''
 
 @CalculationFactory.register_calculation('add')
 class AddCalculation(Calculation):
 
+    __slots__ = ()
+
+    @classmethod
+    def operation(cls):
+        return CalculationFactory._backend.addition
+
     def execute(self) -> float:
-        return Operation.addition(self.a, self.b)
+        return CalculationFactory._backend.addition(self.a, self.b)
 
 @CalculationFactory.register_calculation('subtract')
 class SubtractCalculation(Calculation):
 
+    __slots__ = ()
+
+    @classmethod
+    def operation(cls):
+        return CalculationFactory._backend.subtraction
+
     def execute(self) -> float:
-        return Operation.subtraction(self.a, self.b)
+        return CalculationFactory._backend.subtraction(self.a, self.b)
 
 @CalculationFactory.register_calculation('multiply')
 class MultiplyCalculation(Calculation):
 
+    __slots__ = ()
+
+    @classmethod
+    def operation(cls):
+        return CalculationFactory._backend.multiplication
+
     def execute(self) -> float:
-        return Operation.multiplication(self.a, self.b)
+        return CalculationFactory._backend.multiplication(self.a, self.b)
 
 @CalculationFactory.register_calculation('divide')
 class DivideCalculation(Calculation):
 
+    __slots__ = ()
+
+    @classmethod
+    def operation(cls):
+        return CalculationFactory._backend.division
+
     def execute(self) -> float:
-        # Division by 0 is handled in Operation.division
-        return Operation.division(self.a, self.b)
+        # Division by 0 raises ZeroDivisionError in every backend
+        return CalculationFactory._backend.division(self.a, self.b)
@@ -1,6 +1,15 @@
 import sys
 
 from app.calculation import CalculationFactory
+from app.export import export_history, import_history
+from app.expression import compile_expression
+from app.history import BaseHistory, History, PersistentHistory
+from app.output import OutputSink, TerminalSink
+from app.query import HistoryIndex, parse_query, query_page, top
+from app.reduction import REDUCTIONS, reduce_file, reduce_numbers, scan_numbers
+from app.stats import NULL_TIMER, Instrumentation, format_table
+from app.tokenizer import INVALID_NUMBER, WRONG_FIELD_COUNT, parse_line
+from app.workbook import Workbook
 
 class Calculator:
 
@@ -21,9 +30,35 @@ Usage:
         multiply  : Multiplies two numbers.
         divide    : Divides the first number by the second.
 
+    <reduction> <number1> <number2> ...
+    - Reduce any count of numbers to one result, e.g. 'sum 1 2 3'.
+    - Supported reductions:
+        sum       : Adds all the numbers, without rounding errors building up.
+        product   : Multiplies all the numbers.
+        mean      : Averages the numbers.
+        scan      : Shows the running sum after each number.
+    - '<reduction> from FILE' reduces the numbers in a file.
+
 Special Commands:
     help      : Display this help message.
     history   : Show the history of calculations.
+                'history tail N', 'history page K' and 'history range I J' show part of it.
+                'history where op=divide result>100 since 10m' finds calculations (fields: op, result, a, b),
+                'history top N by result' shows the N largest results (or a, b).
+                'history stats' shows the count, sum, mean, min, max and spread of the results.
+                'history export FILE [--format csv|jsonl|bin]' saves it to a file, and 'history import FILE' adds one back.
+    cache     : Show result cache statistics.
+                'cache on [SIZE]' turns the cache on, 'cache off' turns it off.
+    eval      : Evaluate an expression, e.g. 'eval 2 * (x + 1) / y where x=3 y=4'.
+                Supports + - * / and parentheses, and any operation called as e.g. add(x, 2).
+    cells     : Show the named cells. 'NAME = <operation> <operand1> <operand2>' (or 'NAME = <number>') sets a cell,
+                e.g. 'x = add 3 4' then 'y = multiply x 2'. Operands can name other cells,
+                and changing a cell recomputes only the cells that depend on it.
+    backend   : Show the numeric backend. 'backend NAME' switches to another one:
+                float (default), int, fraction, decimal[:DIGITS] or fixed[:PLACES].
+    stats     : Show how long each stage of a calculation takes.
+                'stats on' / 'stats off' turn timing on or off, 'stats reset' clears it,
+                'stats json [FILE]' and 'stats prometheus [FILE]' export it.
     exit      : Exit the calculator.
 
 Examples:
@@ -33,96 +68,459 @@ Examples:
     divide 20 4
 '''
 
-    def __init__(self) -> None:
+    # Number of entries shown by 'history page K'
+    page_size = 20
 
-        self.history = []
+    def __init__(self, history_path: str = None, sink: OutputSink = None, history: BaseHistory = None) -> None:
 
-    def run(self) -> None:
+        # With history_path, the history is kept in that file and is still there the next time the calculator starts.
+        # Or pass the history to use, e.g. a BoundedHistory to keep the memory of a long-running calculator flat.
+        if history is None:
+            history = History() if history_path is None else PersistentHistory(history_path)
+        self.history = history
+        self.history_index = HistoryIndex(self.history)
 
-        print('Welcome to the Professional Calculator REPL!')
-        print("Type 'help' for instructions or 'exit' to quit.\n")
+        # Everything the calculator shows goes through the sink (one line and flush at a time by default)
+        self.out = TerminalSink() if sink is None else sink
 
-        # Keep prompting the user for calculations until they type 'exit'
-        while True:
+        # Per-stage timing, off until 'stats on'
+        self.stats = None
 
-            try:
+        # Named cells ('x = add 3 4')
+        self.workbook = Workbook()
 
-                user_input: str = input(">> ").strip()
+    def run(self) -> None:
 
-                if user_input == 'exit':
-                    print('Exiting calculator. Goodbye!')
-                    sys.exit(0)
-                elif user_input == 'help':
-                    self.display_help()
-                    continue
-                elif user_input == 'history':
-                    self.display_history()
-                    continue
+        # Whatever ends the session, write out anything the sink is still holding
+        try:
+
+            self.out.write('Welcome to the Professional Calculator REPL!')
+            self.out.write("Type 'help' for instructions or 'exit' to quit.\n")
+
+            # Keep prompting the user for calculations until they type 'exit'
+            while True:
 
                 try:
-                    # Extract the parts of the user input (operation and 2 numbers)
-                    parts = user_input.split()
-                    if len(parts) != 3: # LBYL (look before you leap) error handling, by checking the number of inputs
-                        print('Invalid input. Please follow the format: <operation> <num1> <num2>')
+
+                    # Marks the end of each stage of the calculation. Does nothing unless timing is on.
+                    timer = NULL_TIMER if self.stats is None else self.stats.timer()
+
+                    user_input: str = self.out.read('>> ').strip()
+                    timer.mark('input')
+
+                    if user_input == 'exit':
+                        self.out.write('Exiting calculator. Goodbye!')
+                        self.close()
+                        sys.exit(0)
+                    elif user_input == 'help':
+                        self.display_help()
+                        continue
+                    elif user_input == 'history':
+                        self.display_history()
+                        continue
+                    elif user_input.startswith('history '):
+                        self.display_history_part(user_input.split()[1:])
+                        continue
+                    elif user_input == 'cache' or user_input.startswith('cache '):
+                        self.manage_cache(user_input.split()[1:])
+                        continue
+                    elif user_input.startswith('eval '):
+                        self.evaluate_expression(user_input[len('eval '):])
+                        continue
+                    elif user_input == 'stats' or user_input.startswith('stats '):
+                        self.manage_stats(user_input.split()[1:])
+                        continue
+                    elif user_input == 'backend' or user_input.startswith('backend '):
+                        self.manage_backend(user_input.split()[1:])
+                        continue
+                    elif user_input.split(' ', 1)[0] in REDUCTIONS:
+                        self.reduce(user_input.split())
+                        continue
+                    elif user_input == 'cells':
+                        self.display_cells()
+                        continue
+                    elif '=' in user_input:
+                        self.set_cell(user_input)
                         continue
-                    operation = parts[0]
-                    num_1 = float(parts[1])
-                    num_2 = float(parts[2])
-                except ValueError: # EAFP (Easier to Ask Forgiveness than Permission) - Handle any kinds of formatting issues
-                    print('Invalid input. Please follow the format: <operation> <num1> <num2>')
-                    print("Type 'help' for more information.\n")
-                    continue
-
-                # Initialize Calculation and prompt user if operation is invalid
-                try:
-                    calc = CalculationFactory.create_calculation(operation, num_1, num_2)
-                except ValueError as e:
-                    print(e)
-                    print("Type 'help' to see the list of supported operations.\n")
-                    continue
 
-                # Do the operation
-                try:
-                    calc.execute()
-                except ZeroDivisionError:
-                    print('Cannot divide by zero.')
-                    print('Please enter a non-zero divisor.\n')
-                    continue
-                except Exception as e:
-                    print(f'An error occurred during calculation: {e}')
-                    print('Please try again.\n')
-                    continue
+                    # Extract the parts of the user input (operation and 2 numbers). A bad line gives an error code, not an exception.
+                    parsed = parse_line(user_input)
+                    if parsed == WRONG_FIELD_COUNT:
+                        timer.fail('parse')
+                        self.out.write('Invalid input. Please follow the format: <operation> <num1> <num2>')
+                        continue
+                    if parsed == INVALID_NUMBER:
+                        timer.fail('parse')
+                        self.out.write('Invalid input. Please follow the format: <operation> <num1> <num2>')
+                        self.out.write("Type 'help' for more information.\n")
+                        continue
+                    operation, num_1, num_2 = parsed
+                    timer.mark('parse')
+
+                    # Initialize Calculation and prompt user if operation is invalid
+                    try:
+                        calc = CalculationFactory.create_calculation(operation, num_1, num_2)
+                        timer.mark('create')
+                    except ValueError as e:
+                        timer.fail('create')
+                        self.out.write(str(e))
+                        self.out.write("Type 'help' to see the list of supported operations.\n")
+                        continue
 
-                # Print the result in a nice format
-                result_str: str = f'{calc}'
-                print(f'Result: {result_str}\n')
+                    # Do the operation
+                    try:
+                        result = calc.result
+                        timer.mark('execute')
+                    except ZeroDivisionError:
+                        timer.fail('execute')
+                        self.out.write('Cannot divide by zero.')
+                        self.out.write('Please enter a non-zero divisor.\n')
+                        continue
+                    except Exception as e:
+                        timer.fail('execute')
+                        self.out.write(f'An error occurred during calculation: {e}')
+                        self.out.write('Please try again.\n')
+                        continue
 
-                # Save calculation to the history
-                self.history.append(calc)
+                    # Print the result in a nice format
+                    result_str: str = f'{calc}'
+                    timer.mark('format')
+                    self.out.result(result_str)
+                    timer.mark('output')
 
-            except KeyboardInterrupt:
+                    # Save calculation to the history
+                    self.history.append(calc, result)
+                    timer.mark('history')
+                    timer.finish(operation.lower())
 
-                print('\nKeyboard interrupt detected. Exiting calculator. Goodbye!')
-                sys.exit(0)
+                except KeyboardInterrupt:
+
+                    self.out.write('\nKeyboard interrupt detected. Exiting calculator. Goodbye!')
+                    self.close()
+                    sys.exit(0)
+
+                except EOFError:
+
+                    self.out.write('\nEOF detected. Exiting calculator. Goodbye!')
+                    self.close()
+                    sys.exit(0)
 
-            except EOFError:
+        finally:
 
-                print('\nEOF detected. Exiting calculator. Goodbye!')
-                sys.exit(0)
+            self.out.flush()
+
+    def close(self) -> None:
+
+        # Save the history and write out anything the sink is still holding
+        self.history.close()
+        self.out.close()
 
     def display_help(self) -> None:
 
         # Display usage instructions for the calculator
 
-        print(Calculator.help_message)
+        self.out.write(Calculator.help_message)
 
-    def display_history(self) -> None:
+    def display_history(self, start: int = 0, stop: int = None, title: str = 'Calculation History:') -> None:
 
-        # Show the commands that the user has entered
+        # Show the commands that the user has entered, or entries start..stop-1 of them.
+        # Lines are rendered as they are printed, so only the entries shown are ever rendered.
 
         if len(self.history) > 0:
-            print('Calculation History:')
-            for i, calc in enumerate(self.history, start=1):
-                print(f'{i}. {calc}')
+            self.out.write(title)
+            if self.history.evicted and start == 0:
+                evicted = self.history.evicted
+                self.out.write(f'({evicted} older calculation{"s were" if evicted > 1 else " was"} dropped to stay within the history limit.)')
+            for i, line in enumerate(self.history.lines(start, stop), start=start + 1):
+                self.out.write(f'{i}. {line}')
+        else:
+            self.out.write('No calculations performed yet.')
+
+    def display_history_part(self, arguments: list) -> None:
+
+        # 'history tail N', 'history page K' or 'history range I J'. Numbers are 1-based, like the numbers shown by 'history'.
+
+        command, numbers = arguments[0], arguments[1:]
+        if command in ('where', 'top'):
+            self.query_history(command, arguments[1:])
+            return
+        if command == 'stats' and len(numbers) == 0:
+            self.display_history_stats()
+            return
+        if command in ('export', 'import'):
+            self.transfer_history(command, arguments[1:])
+            return
+        try:
+            numbers = [int(number) for number in numbers]
+            if any(number < 1 for number in numbers):
+                raise ValueError
+        except ValueError:
+            numbers = None
+
+        count = len(self.history)
+        if command == 'tail' and numbers and len(numbers) == 1:
+            self.display_history(max(0, count - numbers[0]))
+        elif command == 'page' and numbers and len(numbers) == 1:
+            pages = max(1, -(-count // self.page_size))
+            if numbers[0] > pages:
+                self.out.write(f'Page {numbers[0]} does not exist. The history has {pages} page{"s" if pages > 1 else ""}.')
+                return
+            start = (numbers[0] - 1) * self.page_size
+            self.display_history(start, start + self.page_size, f'Calculation History (page {numbers[0]} of {pages}):')
+        elif command == 'range' and numbers and len(numbers) == 2 and numbers[0] <= numbers[1]:
+            if count and numbers[0] > count:
+                self.out.write(f'Entry {numbers[0]} does not exist. The history has {count} entr{"ies" if count > 1 else "y"}.')
+                return
+            self.display_history(numbers[0] - 1, numbers[1])
+        else:
+            self.out.write("Invalid history command. Use 'history', 'history tail N', 'history page K' or 'history range I J'.")
+
+    def query_history(self, command: str, arguments: list) -> None:
+
+        # 'history where CONDITION...' or 'history top N [by FIELD]', answered from the history indexes
+
+        if len(self.history) == 0:
+            self.out.write('No calculations performed yet.')
+            return
+
+        try:
+            if command == 'where':
+                matches, positions = query_page(self.history_index, parse_query(arguments), self.page_size)
+                title = f'Matching Calculations ({matches}):'
+                if matches > self.page_size:
+                    title = f'Matching Calculations (showing the last {self.page_size} of {matches}):'
+            else:
+                if len(arguments) not in (1, 3) or (len(arguments) == 3 and arguments[1] != 'by'):
+                    raise ValueError("Invalid history command. Use 'history top N' or 'history top N by FIELD'.")
+                count = int(arguments[0]) if arguments[0].isdigit() else 0
+                if count < 1:
+                    raise ValueError(f"Invalid count: '{arguments[0]}'. Please enter a positive whole number.")
+                field = arguments[2] if len(arguments) == 3 else 'result'
+                positions = top(self.history_index, count, field)
+                title = f'Top {len(positions)} Calculations by {field}:'
+        except ValueError as e:
+            self.out.write(str(e))
+            return
+
+        if not positions:
+            self.out.write('No matching calculations.')
+            return
+        self.out.write(title)
+        for position in positions:
+            self.out.write(f'{position + 1}. {self.history.render(position)}')
+
+    def display_history_stats(self) -> None:
+
+        # Aggregates of the results, overall and per operation. They are kept up to date as calculations are added,
+        # so this never reads the history itself.
+
+        overall = self.history.statistics()
+        if overall.count == 0:
+            self.out.write('No calculations performed yet.')
+            return
+
+        aggregates = [(CalculationFactory.calculation_type(calculation_class), aggregate) for calculation_class, aggregate in self.history.statistics_by_type().items()]
+        rows = [
+            [name, aggregate.count, *(f'{value:g}' for value in (aggregate.total, aggregate.mean, aggregate.min, aggregate.max, aggregate.stdev))]
+            for name, aggregate in aggregates + [('all', overall)]
+        ]
+        self.out.write(format_table(['operation', 'count', 'sum', 'mean', 'min', 'max', 'stdev'], rows))
+
+    def transfer_history(self, command: str, arguments: list) -> None:
+
+        # 'history export FILE [--format FORMAT]' or 'history import FILE [--format FORMAT]'.
+        # The format defaults to the file extension. Entries are streamed in chunks, so the history is never copied in memory.
+
+        if len(arguments) not in (1, 3) or (len(arguments) == 3 and arguments[1] != '--format'):
+            self.out.write(f"Invalid history command. Use 'history {command} FILE' or 'history {command} FILE --format csv|jsonl|bin'.")
+            return
+        path = arguments[0]
+        file_format = arguments[2] if len(arguments) == 3 else None
+        try:
+            if command == 'export':
+                count = export_history(self.history, path, file_format)
+                self.out.write(f"Exported {count} entr{'y' if count == 1 else 'ies'} to {path}.")
+            else:
+                count = import_history(self.history, path, file_format)
+                self.out.write(f"Imported {count} entr{'y' if count == 1 else 'ies'} from {path}.")
+        except OSError as e:
+            self.out.write(f"Could not {'write' if command == 'export' else 'read'} {path}: {e.strerror}.")
+        except ValueError as e:
+            self.out.write(str(e))
+
+    def manage_cache(self, arguments: list) -> None:
+
+        # Turn the CalculationFactory result cache on or off, or show its statistics
+
+        if arguments[:1] == ['on'] and len(arguments) <= 2:
+            try:
+                size = int(arguments[1]) if len(arguments) == 2 else 1024
+                CalculationFactory.enable_cache(size)
+            except ValueError:
+                self.out.write('Invalid cache size. Please enter a positive whole number.')
+                return
+            self.out.write(f'Result cache enabled (size {size}).')
+        elif arguments == ['off']:
+            CalculationFactory.disable_cache()
+            self.out.write('Result cache disabled.')
+        elif arguments:
+            self.out.write("Invalid cache command. Use 'cache', 'cache on [SIZE]' or 'cache off'.")
+        else:
+            stats = CalculationFactory.cache_stats()
+            if stats is None:
+                self.out.write("Result cache is disabled. Type 'cache on' to enable it.")
+                return
+            self.out.write('Result Cache:')
+            self.out.write(f"    hits       : {stats['hits']}")
+            self.out.write(f"    misses     : {stats['misses']}")
+            self.out.write(f"    hit rate   : {stats['hit_rate']:.1%}")
+            self.out.write(f"    evictions  : {stats['evictions']}")
+            self.out.write(f"    rejections : {stats['rejections']}")
+            self.out.write(f"    size       : {stats['size']}/{stats['maxsize']}")
+
+    def manage_backend(self, arguments: list) -> None:
+
+        # Show the numeric backend, or switch to another one, e.g. 'backend fraction' or 'backend decimal:50'.
+        # The workbook's numbers are parsed again by the new backend.
+
+        if len(arguments) > 1:
+            self.out.write("Invalid backend command. Use 'backend' or 'backend NAME'.")
+        elif arguments:
+            try:
+                self.workbook.set_backend(arguments[0])
+            except ValueError as e:
+                self.out.write(str(e))
+                return
+            self.out.write(f'Numeric backend set to {CalculationFactory.backend().name}.')
+        else:
+            self.out.write(f'Numeric backend: {CalculationFactory.backend().name}')
+
+    def manage_stats(self, arguments: list) -> None:
+
+        # Turn per-stage timing on or off, reset it, show it, or export it as JSON or Prometheus text
+
+        if arguments == ['on']:
+            if self.stats is None:
+                self.stats = Instrumentation()
+            self.out.write('Stage timing enabled.')
+        elif arguments == ['off']:
+            self.stats = None
+            self.out.write('Stage timing disabled.')
+        elif self.stats is None:
+            self.out.write("Stage timing is disabled. Type 'stats on' to enable it.")
+        elif arguments == ['reset']:
+            self.stats.reset()
+            self.out.write('Stage timing reset.')
+        elif arguments[:1] in (['json'], ['prometheus']) and len(arguments) <= 2:
+            text = self.stats.to_json() + '\n' if arguments[0] == 'json' else self.stats.to_prometheus()
+            if len(arguments) == 1:
+                self.out.write(text, end='')
+                return
+            try:
+                with open(arguments[1], 'w') as file:
+                    file.write(text)
+            except OSError as e:
+                self.out.write(f'Could not write {arguments[1]}: {e.strerror}.')
+                return
+            self.out.write(f'Stage timing written to {arguments[1]}.')
+        elif arguments:
+            self.out.write("Invalid stats command. Use 'stats', 'stats on', 'stats off', 'stats reset', 'stats json [FILE]' or 'stats prometheus [FILE]'.")
         else:
-            print('No calculations performed yet.')
+            rows = self.stats.rows()
+            if not rows:
+                self.out.write('No calculations timed yet.')
+                return
+            self.out.write(format_table(['stage', 'operation', 'count', 'mean us', 'p50 us', 'p99 us', 'max us'], rows))
+
+    def reduce(self, arguments: list) -> None:
+
+        # 'sum 1 2 3' (or product, mean, scan) reduces the numbers given, and 'sum from FILE' the numbers in a file.
+        # Reductions are not calculations of two numbers, so they are not added to the history.
+
+        operation, numbers = arguments[0], arguments[1:]
+        try:
+            if len(numbers) == 2 and numbers[0] == 'from':
+                if operation == 'scan':
+                    with open(numbers[1]) as file:
+                        self.display_reduction(operation, file)
+                else:
+                    # Shard by shard, as --reduce does, so the result is the same as with any number of workers
+                    self.out.result(f'{operation} = {reduce_file(operation, numbers[1], workers=1)}')
+                return
+            usage = f'Invalid input. Please follow the format: {operation} <num1> <num2> ... or {operation} from FILE'
+            if not numbers:
+                raise ValueError(usage)
+            try:
+                self.display_reduction(operation, [' '.join(numbers)])
+            except ValueError:
+                raise ValueError(usage) from None
+        except OSError as e:
+            self.out.write(f'Could not read {numbers[1]}: {e.strerror}.')
+        except ValueError as e:
+            self.out.write(str(e))
+            self.out.write("Type 'help' for more information.\n")
+
+    def display_reduction(self, operation: str, lines) -> None:
+
+        if operation == 'scan':
+            sums = list(scan_numbers(lines))
+            self.out.result(f'scan of {len(sums)} numbers = {", ".join(map(str, sums))}')
+        else:
+            self.out.result(f'{operation} = {reduce_numbers(operation, lines)}')
+
+    def set_cell(self, text: str) -> None:
+
+        # 'NAME = FORMULA': define or change a cell, then show it and how many cells downstream of it were recomputed.
+        # Like reductions, cells are not added to the history.
+
+        name, _, formula = text.partition('=')
+        try:
+            recomputed = self.workbook.set(name.strip(), formula)
+        except ValueError as e:
+            self.out.write(str(e))
+            self.out.write("Type 'help' for more information.\n")
+            return
+
+        self.out.write(str(self.workbook[recomputed[0]]))
+        if len(recomputed) > 1:
+            self.out.write(f"Recomputed {len(recomputed) - 1} dependent cell{'s' if len(recomputed) > 2 else ''}.")
+        self.out.write()
+
+    def display_cells(self) -> None:
+
+        if len(self.workbook) == 0:
+            self.out.write('No cells defined yet.')
+            return
+        self.out.write('Cells:')
+        for cell in self.workbook:
+            self.out.write(str(cell))
+
+    def evaluate_expression(self, text: str) -> None:
+
+        # Evaluate 'EXPRESSION [where NAME=VALUE ...]'. Compiled expressions are cached, so a repeated formula is not parsed again.
+
+        source, _, where = text.partition(' where ')
+        try:
+            bindings = {}
+            for binding in where.split():
+                name, separator, value = binding.partition('=')
+                if not separator:
+                    raise ValueError(f"Invalid variable binding: '{binding}'. Please use NAME=VALUE.")
+                try:
+                    bindings[name] = CalculationFactory.backend().parse(value)
+                except ValueError:
+                    raise ValueError(f"Invalid value for variable '{name}': '{value}'.") from None
+            result = compile_expression(source)(**bindings)
+        except ZeroDivisionError:
+            self.out.write('Cannot divide by zero.\n')
+            return
+        except (RecursionError, SyntaxError):
+            self.out.write('Invalid expression: the expression is too long or nested too deeply.')
+            self.out.write("Type 'help' for more information.\n")
+            return
+        except ValueError as e:
+            self.out.write(str(e))
+            self.out.write("Type 'help' for more information.\n")
+            return
+
+        self.out.result(str(result))
@@ -0,0 +1,50 @@
+import operator
+import sys
+
+'''
+One-shot mode: python main.py <operation> <num1> <num2> prints just the result and exits, for scripts that call the calculator many times.
+
+Start-up time dominates a one-shot call, so this module imports nothing from the rest of the calculator. The built-in operations
+are the same arithmetic as the Operation methods, taken from the operator module, since importing app.operation also loads array and
+collections for its batch functions. Any other operation name falls back to the CalculationFactory registry, which is only imported then.
+'''
+
+# operator.truediv raises ZeroDivisionError for a zero divisor, like Operation.division
+BUILTIN_OPERATIONS = {
+    'add': operator.add,
+    'subtract': operator.sub,
+    'multiply': operator.mul,
+    'divide': operator.truediv,
+}
+
+def one_shot_main(argv: list) -> int:
+
+    # Entry point for main.py <operation> <num1> <num2>. Returns the exit status: 0 on success, 1 for a failed calculation, 2 for bad usage.
+    if len(argv) != 3:
+        print('Usage: main.py <operation> <num1> <num2>', file=sys.stderr)
+        return 2
+
+    operation, num_1, num_2 = argv
+    try:
+        a = float(num_1)
+        b = float(num_2)
+    except ValueError:
+        print('Invalid input. Please follow the format: <operation> <num1> <num2>', file=sys.stderr)
+        return 2
+
+    function = BUILTIN_OPERATIONS.get(operation.lower())
+    try:
+        if function is not None:
+            result = function(a, b)
+        else:
+            from app.calculation import CalculationFactory
+            result = CalculationFactory.evaluate(operation, a, b)
+    except ZeroDivisionError:
+        print('Cannot divide by zero.', file=sys.stderr)
+        return 1
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    print(result)
+    return 0
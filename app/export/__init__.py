@@ -0,0 +1,164 @@
+import csv
+import itertools
+import json
+import mmap
+import os
+
+from typing import Iterator
+
+from app.calculation import CalculationFactory
+from app.history import HEADER_SIZE, RECORD, PersistentHistory, read_header
+
+'''
+Export a calculation history to a file, and import one back, in one of three formats:
+
+    csv   : a header row, then one operation,a,b,result,timestamp row per entry
+    jsonl : one {"operation": ..., "a": ..., "b": ..., "result": ..., "timestamp": ...} object per line
+    bin   : the binary history file format of PersistentHistory (a file that can also be opened with --history)
+
+Entries are streamed in chunks of chunk_size entries in both directions, so memory use does not depend on the size of the history
+or of the file. An import appends to the history one chunk at a time through history.extend, so no Calculation is created per entry
+and results are stored as they are in the file, not computed again. If a line of the file is invalid, the import stops with an error
+and the chunks before it stay imported.
+'''
+
+FORMATS = ('csv', 'jsonl', 'bin')
+FIELDS = ('operation', 'a', 'b', 'result', 'timestamp')
+
+# Entries read or written at a time
+CHUNK_SIZE = 1 << 14
+
+def format_for(path: str, file_format: str = None) -> str:
+
+    # The given format, or the one named by the file extension (csv if there is none)
+    if file_format is None:
+        extension = os.path.splitext(path)[1].lstrip('.').lower()
+        file_format = extension if extension in FORMATS else 'csv'
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format: '{file_format}'. Use one of: {', '.join(FORMATS)}.")
+    return file_format
+
+def history_chunks(history, chunk_size: int = CHUNK_SIZE) -> Iterator[list]:
+
+    # (Calculation subclass, a, b, result, timestamp) entries of the history, chunk_size at a time
+    types = history.operation_types
+    for start in range(0, len(history), chunk_size):
+        records = history.record_range(start, start + chunk_size)
+        yield [(types[code], a, b, result, timestamp) for code, a, b, result, timestamp in records]
+
+def _check_not_own_file(history, path: str) -> None:
+
+    # Exporting over (or importing from) the file a PersistentHistory is kept in would destroy it or never end
+    own_path = getattr(history, 'path', None)
+    if own_path is not None and os.path.exists(path) and os.path.samefile(own_path, path):
+        raise ValueError(f"'{path}' is the file this history is kept in.")
+
+def export_history(history, path: str, file_format: str = None, chunk_size: int = CHUNK_SIZE) -> int:
+
+    # Write every entry of history to path, replacing the file. Returns the number of entries written.
+    file_format = format_for(path, file_format)
+    _check_not_own_file(history, path)
+    count = 0
+    if file_format == 'bin':
+        with open(path, 'wb'):
+            pass
+        with PersistentHistory(path) as target:
+            for chunk in history_chunks(history, chunk_size):
+                target.extend(chunk)
+                count += len(chunk)
+        return count
+
+    names = {}
+    with open(path, 'w', newline='') as file:
+        if file_format == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(FIELDS)
+        for chunk in history_chunks(history, chunk_size):
+            rows = []
+            for calculation_class, a, b, result, timestamp in chunk:
+                name = names.get(calculation_class)
+                if name is None:
+                    name = names[calculation_class] = CalculationFactory.calculation_type(calculation_class)
+                rows.append((name, a, b, result, timestamp))
+            if file_format == 'csv':
+                writer.writerows(rows)
+            else:
+                file.write(''.join(json.dumps(dict(zip(FIELDS, row))) + '\n' for row in rows))
+            count += len(chunk)
+    return count
+
+def _entry(path: str, line_number: int, fields: list, classes: dict) -> tuple:
+
+    # (Calculation subclass, a, b, result, timestamp) for one row of a csv or jsonl file
+    try:
+        name, *numbers = fields
+        calculation_class = classes.get(name)
+        if calculation_class is None:
+            calculation_class = classes[name] = CalculationFactory.calculation_class(name)
+        a, b, result, timestamp = map(float, numbers)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid entry on line {line_number} of '{path}'.") from None
+    return calculation_class, a, b, result, timestamp
+
+def _text_chunks(path: str, file_format: str, chunk_size: int) -> Iterator[list]:
+
+    classes = {}
+    with open(path, newline='') as file:
+        if file_format == 'csv':
+            rows = csv.reader(file)
+            if next(rows, None) != list(FIELDS):
+                raise ValueError(f"'{path}' is not a history export: the first line must be {','.join(FIELDS)}.")
+            line_number = 1
+        else:
+            rows = (_json_fields(line) for line in file)
+            line_number = 0
+        while True:
+            chunk = []
+            for fields in itertools.islice(rows, chunk_size):
+                line_number += 1
+                if fields != []:
+                    chunk.append(_entry(path, line_number, fields, classes))
+            if not chunk:
+                return
+            yield chunk
+
+def _json_fields(line: str) -> list:
+
+    # The fields of one jsonl line in FIELDS order, [] for a blank line and None for one that is not a JSON object
+    if not line.strip():
+        return []
+    try:
+        entry = json.loads(line)
+        return [entry[field] for field in FIELDS]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def _binary_chunks(path: str, chunk_size: int) -> Iterator[list]:
+
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < HEADER_SIZE:
+            raise ValueError(f"'{path}' is not a calculator history file.")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            count, names = read_header(mapping, path)
+            types = [CalculationFactory.calculation_class(name) for name in names]
+            for start in range(0, count, chunk_size):
+                data = mapping[HEADER_SIZE + start * RECORD.size:HEADER_SIZE + min(count, start + chunk_size) * RECORD.size]
+                yield [(types[code], a, b, result, timestamp) for code, a, b, result, timestamp in RECORD.iter_unpack(data)]
+
+def file_chunks(path: str, file_format: str = None, chunk_size: int = CHUNK_SIZE) -> Iterator[list]:
+
+    # (Calculation subclass, a, b, result, timestamp) entries of an exported file, chunk_size at a time
+    file_format = format_for(path, file_format)
+    if file_format == 'bin':
+        return _binary_chunks(path, chunk_size)
+    return _text_chunks(path, file_format, chunk_size)
+
+def import_history(history, path: str, file_format: str = None, chunk_size: int = CHUNK_SIZE) -> int:
+
+    # Append every entry of the file at path to history. Returns the number of entries imported.
+    _check_not_own_file(history, path)
+    count = 0
+    for chunk in file_chunks(path, file_format, chunk_size):
+        history.extend(chunk)
+        count += len(chunk)
+    return count
@@ -0,0 +1,319 @@
+import re
+
+from app.cache import LRUCache
+from app.calculation import CalculationFactory
+
+'''
+Expression mode for the calculator: nested infix expressions such as "2 * (x + 1.5) / y" or "add(x, multiply(y, 3))".
+
+An expression is parsed into a small AST whose operator nodes are the registered Calculation types (+ is 'add', - is 'subtract',
+* is 'multiply' and / is 'divide', and any registered type can be called by name). Constant subexpressions are folded at compile time,
+and what is left is compiled into a plain Python function that calls each operation directly, with no parsing or Calculation objects
+at evaluation time. Compiled expressions are cached by source text in a bounded LRU, so evaluating the same formula again with
+different variable values skips parsing entirely.
+'''
+
+# Deepest nesting of parentheses and calls accepted. The parser recurses once per level, so this keeps it well inside the recursion limit.
+MAX_DEPTH = 100
+
+INFIX_OPERATIONS = {
+    '+': 'add',
+    '-': 'subtract',
+    '*': 'multiply',
+    '/': 'divide',
+}
+
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<name>[A-Za-z_]\w*)
+      | (?P<symbol>[-+*/(),])
+    )''', re.VERBOSE)
+
+class Constant:
+
+    __slots__ = ('value',)
+
+    def __init__(self, value: float) -> None:
+
+        self.value = value
+
+    def __repr__(self) -> str:
+
+        return f'Constant({self.value!r})'
+
+class Variable:
+
+    __slots__ = ('name',)
+
+    def __init__(self, name: str) -> None:
+
+        self.name = name
+
+    def __repr__(self) -> str:
+
+        return f'Variable({self.name!r})'
+
+class Apply:
+
+    # A registered Calculation type applied to two subexpressions
+
+    __slots__ = ('calculation_class', 'left', 'right')
+
+    def __init__(self, calculation_class: type, left, right) -> None:
+
+        self.calculation_class = calculation_class
+        self.left = left
+        self.right = right
+
+    def __repr__(self) -> str:
+
+        return f'Apply({self.calculation_class.__name__}, {self.left!r}, {self.right!r})'
+
+def tokenize(source: str) -> list:
+
+    # Split source into (kind, text, position) tokens, where kind is 'number', 'name' or 'symbol'
+    tokens = []
+    position = 0
+    source = source.rstrip()
+    while position < len(source):
+        match = _TOKEN.match(source, position)
+        if match is None:
+            bad = source[position:].lstrip()
+            raise ValueError(f"Invalid expression: unexpected '{bad[0]}' at position {len(source) - len(bad)}.")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind), match.start(kind)))
+        position = match.end()
+    return tokens
+
+class _Parser:
+
+    '''
+    Recursive-descent parser with the usual precedence:
+        expression := term (('+' | '-') term)*
+        term       := unary (('*' | '/') unary)*
+        unary      := ('-' | '+')* primary
+        primary    := number | name | name '(' expression ',' expression ')' | '(' expression ')'
+    Runs of terms and of signs are parsed in loops, so only parentheses and calls recurse, at most MAX_DEPTH levels deep.
+    '''
+
+    def __init__(self, source: str) -> None:
+
+        self.tokens = tokenize(source)
+        self.index = 0
+        self.depth = 0
+
+    def parse(self):
+
+        if not self.tokens:
+            raise ValueError('Invalid expression: the expression is empty.')
+        node = self.expression()
+        if self.index < len(self.tokens):
+            self.fail()
+        return node
+
+    def peek(self) -> str:
+
+        if self.index < len(self.tokens):
+            return self.tokens[self.index][1]
+        return None
+
+    def take(self, expected: str = None) -> tuple:
+
+        if self.index >= len(self.tokens):
+            raise ValueError('Invalid expression: unexpected end of expression.')
+        token = self.tokens[self.index]
+        if expected is not None and token[1] != expected:
+            self.fail()
+        self.index += 1
+        return token
+
+    def fail(self):
+
+        _, text, position = self.tokens[self.index]
+        raise ValueError(f"Invalid expression: unexpected '{text}' at position {position}.")
+
+    def expression(self):
+
+        node = self.term()
+        while self.peek() in ('+', '-'):
+            operation = INFIX_OPERATIONS[self.take()[1]]
+            node = _apply(operation, node, self.term())
+        return node
+
+    def term(self):
+
+        node = self.unary()
+        while self.peek() in ('*', '/'):
+            operation = INFIX_OPERATIONS[self.take()[1]]
+            node = _apply(operation, node, self.unary())
+        return node
+
+    def unary(self):
+
+        negations = 0
+        while self.peek() in ('-', '+'):
+            negations += self.take()[1] == '-'
+        node = self.primary()
+        for _ in range(negations):
+            # Negation is multiplication by -1, which also gives the right sign for zero
+            node = _apply('multiply', Constant(CalculationFactory.backend().parse('-1')), node)
+        return node
+
+    def nested(self):
+
+        # An expression inside parentheses or a call
+        if self.depth >= MAX_DEPTH:
+            raise ValueError(f'Invalid expression: nested more than {MAX_DEPTH} levels deep.')
+        self.depth += 1
+        node = self.expression()
+        self.depth -= 1
+        return node
+
+    def primary(self):
+
+        kind, text, _ = self.take()
+        if kind == 'number':
+            return Constant(CalculationFactory.backend().parse(text))
+        if kind == 'name':
+            if self.peek() != '(':
+                return Variable(text)
+            self.take('(')
+            left = self.nested()
+            self.take(',')
+            right = self.nested()
+            self.take(')')
+            return _apply(text, left, right)
+        if text == '(':
+            node = self.nested()
+            self.take(')')
+            return node
+        self.index -= 1
+        self.fail()
+
+def _apply(operation: str, left, right):
+
+    # Build an Apply node, folding it into a Constant when both sides are constants.
+    # A fold that fails (e.g. division by zero) is left in place, so the error happens when the expression is evaluated.
+    calculation_class = CalculationFactory.calculation_class(operation)
+    if isinstance(left, Constant) and isinstance(right, Constant):
+        try:
+            return Constant(calculation_class(left.value, right.value).result)
+        except ArithmeticError:
+            pass
+    return Apply(calculation_class, left, right)
+
+def parse_expression(source: str):
+
+    # Parse source into an AST of Constant, Variable and Apply nodes, with constant subexpressions already folded
+    return _Parser(source).parse()
+
+class CompiledExpression:
+
+    '''
+    A compiled expression. Call it with the variable values, by keyword or in the order given by .variables:
+
+        compiled = compile_expression('x * 2 + y')
+        compiled(x=3, y=1)    # 7.0
+        compiled(3, 1)        # 7.0
+    '''
+
+    def __init__(self, source: str, tree) -> None:
+
+        self.source = source
+        self.tree = tree
+        self.variables = ()
+        self._function = self._compile(tree)
+
+    def __call__(self, *args, **bindings) -> float:
+
+        if bindings or len(args) != len(self.variables):
+            args = self._bind(args, bindings)
+        return self._function(*args)
+
+    def _bind(self, args: tuple, bindings: dict) -> list:
+
+        # Line up positional and keyword values with self.variables
+        if len(args) > len(self.variables):
+            raise ValueError(f'Expected {len(self.variables)} values but got {len(args)}.')
+        values = list(args)
+        for name in self.variables[len(args):]:
+            if name not in bindings:
+                raise ValueError(f"Missing value for variable '{name}'.")
+            values.append(bindings[name])
+        return values
+
+    def __repr__(self) -> str:
+
+        return f'CompiledExpression({self.source!r})'
+
+    def _compile(self, tree):
+
+        # Turn the tree into the source of one Python function with one flat statement per operation, e.g. for (x + 0.5) * y
+        #     def _expression(_v0, _v1):
+        #         _t0 = _f0(_v0, _c1)
+        #         _t1 = _f2(_t0, _v1)
+        #         return _t1
+        # where each _v is a variable (in order of first appearance), each _f is the plain function of a Calculation type, each _c is
+        # a constant and each _t is an intermediate result. Flat statements keep any length of expression within the limits of the
+        # Python compiler, and the tree is walked with a stack rather than recursion.
+        # Generated names are used for variables too, so a variable called e.g. 'lambda' cannot break the generated code.
+        namespace = {}
+        functions = {}
+        variables = {}
+        statements = []
+
+        def leaf(node) -> str:
+            if isinstance(node, Constant):
+                name = f'_c{len(namespace)}'
+                namespace[name] = node.value
+                return name
+            return f'_v{variables.setdefault(node.name, len(variables))}'
+
+        # Post-order walk: a node is emitted after both of its operands, whose names are on the results stack
+        results = []
+        stack = [(tree, False)]
+        while stack:
+            node, operands_done = stack.pop()
+            if not isinstance(node, Apply):
+                results.append(leaf(node))
+            elif not operands_done:
+                stack.extend(((node, True), (node.right, False), (node.left, False)))
+            else:
+                function = functions.get(node.calculation_class)
+                if function is None:
+                    function = functions[node.calculation_class] = f'_f{len(namespace)}'
+                    namespace[function] = node.calculation_class.operation()
+                right = results.pop()
+                left = results.pop()
+                name = f'_t{len(statements)}'
+                statements.append(f'    {name} = {function}({left}, {right})\n')
+                results.append(name)
+
+        self.variables = tuple(variables)
+        parameters = ', '.join(f'_v{index}' for index in range(len(variables)))
+        exec(f'def _expression({parameters}):\n{"".join(statements)}    return {results[0]}\n', namespace)
+        return namespace['_expression']
+
+# Compiled expressions by source text, together with the registry version they were compiled against
+_compiled = LRUCache(256, admission=False)
+
+def compile_expression(source: str) -> CompiledExpression:
+
+    # Return the compiled form of source, from the cache when possible.
+    # Entries compiled before the CalculationFactory registry last changed are compiled again.
+    cached = _compiled.get(source)
+    if cached is not None and cached[0] == CalculationFactory._version:
+        return cached[1]
+
+    compiled = CompiledExpression(source, parse_expression(source))
+    _compiled.put(source, (CalculationFactory._version, compiled))
+    return compiled
+
+def expression_cache_stats() -> dict:
+
+    return _compiled.stats()
+
+def evaluate_expression(source: str, **bindings) -> float:
+
+    return compile_expression(source)(**bindings)
@@ -0,0 +1,873 @@
+import math
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+
+from abc import ABC, abstractmethod
+from array import array
+from typing import Iterator
+
+from app.calculation import Calculation, CalculationFactory
+
+def _doubles(*values) -> list:
+
+    # The history stores numbers as doubles. Numbers from the exact numeric backends are rounded to the nearest double when they are stored,
+    # and integers too large for a double are stored as infinity.
+    doubles = []
+    for value in values:
+        try:
+            doubles.append(float(value))
+        except OverflowError:
+            doubles.append(math.inf if value > 0 else -math.inf)
+    return doubles
+
+class RunningStats:
+
+    '''
+    Count, sum, mean, min, max and variance of a stream of numbers, updated in O(1) per number with Welford's method,
+    which keeps the mean and the sum of squared differences from it instead of a sum of squares, so the variance does not lose
+    its precision to cancellation when the numbers are large and close together. Variance is the population variance.
+    '''
+
+    __slots__ = ('count', 'total', 'mean', 'min', 'max', '_m2')
+
+    def __init__(self) -> None:
+
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.min = None
+        self.max = None
+        self._m2 = 0.0
+
+    def add(self, value: float) -> None:
+
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def variance(self) -> float:
+
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def stdev(self) -> float:
+
+        return math.sqrt(self.variance)
+
+    def summary(self) -> dict:
+
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.mean,
+            'min': self.min,
+            'max': self.max,
+            'variance': self.variance,
+            'stdev': self.stdev,
+        }
+
+class BaseHistory(ABC):
+
+    '''
+    Behaviour shared by the history stores. Every entry is a record of (op code, a, b, result, timestamp),
+    where the op code is an index into operation_types, which holds the Calculation subclass for each code.
+    Subclasses store the records and provide __len__, record, append and clear.
+
+    Aggregate statistics of the results (overall and per calculation type) are updated as each entry is appended,
+    so statistics() costs the same however long the history is.
+    '''
+
+    def __init__(self) -> None:
+
+        # op code -> Calculation subclass, and the reverse mapping
+        self._types = []
+        self._codes = {}
+        self._reset_statistics()
+
+        # Entries dropped from the front of the history to keep it within a limit. The positions of the entries after them
+        # move down as they are dropped.
+        self.evicted = 0
+
+    @abstractmethod
+    def __len__(self) -> int:
+
+        pass # pragma: no cover
+
+    @abstractmethod
+    def record(self, index: int) -> tuple:
+
+        # Return (op code, a, b, result, timestamp) for one entry
+        pass # pragma: no cover
+
+    @abstractmethod
+    def record_range(self, start: int, stop: int) -> list:
+
+        # Return the records of entries start..stop-1, read in one go
+        pass # pragma: no cover
+
+    @abstractmethod
+    def append(self, calc: Calculation, result: float = None, timestamp: float = None) -> None:
+
+        pass # pragma: no cover
+
+    @abstractmethod
+    def extend(self, entries) -> None:
+
+        # Bulk-load (Calculation subclass, a, b, result, timestamp) entries, without creating a Calculation for each one
+        pass # pragma: no cover
+
+    @abstractmethod
+    def clear(self) -> None:
+
+        pass # pragma: no cover
+
+    @property
+    def spilled(self) -> int:
+
+        # Entries at the front of the history that are kept on disk instead of in memory (see BoundedHistory)
+        return 0
+
+    def flush(self) -> None:
+
+        # Make every appended entry durable. Nothing to do for an in-memory store.
+        pass
+
+    def close(self) -> None:
+
+        self.flush()
+
+    def __enter__(self) -> 'BaseHistory':
+
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+
+        self.close()
+
+    def __getitem__(self, index: int) -> Calculation:
+
+        # Rebuild the Calculation object for one entry, including its stored result
+        op_code, a, b, result, _ = self.record(index)
+        return self._types[op_code].from_result(a, b, result)
+
+    def __iter__(self) -> Iterator[Calculation]:
+
+        for index in range(len(self)):
+            yield self[index]
+
+    def render(self, index: int) -> str:
+
+        # Same text as str(calculation), but using the stored result instead of executing the calculation again
+        op_code, a, b, result, _ = self.record(index)
+        return self._types[op_code].format(a, b, result)
+
+    def lines(self, start: int = 0, stop: int = None) -> Iterator[str]:
+
+        # Render entries start..stop-1 lazily, one at a time, so showing part of a long history only costs the part shown
+        for index in range(*slice(start, stop).indices(len(self))):
+            yield self.render(index)
+
+    def statistics(self, calculation_class: type = None) -> RunningStats:
+
+        # Aggregates of the results of every entry, or of the entries of one calculation type
+        self._catch_up()
+        if calculation_class is None:
+            return self._overall
+        code = self._codes.get(calculation_class)
+        return RunningStats() if code is None else self._by_code.get(code, RunningStats())
+
+    def statistics_by_type(self) -> dict:
+
+        # Calculation subclass -> aggregates of its results, for each type in the history, in op code order
+        self._catch_up()
+        return {self._types[code]: self._by_code[code] for code in sorted(self._by_code)}
+
+    def _reset_statistics(self) -> None:
+
+        self._overall = RunningStats()
+        self._by_code = {}
+        self._aggregated = 0
+
+    def _aggregate(self, code: int, result: float) -> None:
+
+        # Add the entry just appended to the aggregates. If earlier entries were never added (a reopened history file),
+        # leave it to _catch_up, which adds them all in order.
+        if self._aggregated == len(self) - 1:
+            self._add_to_statistics(code, result)
+
+    def _aggregate_all(self, start: int, codes, results) -> None:
+
+        # Add a bulk-loaded run of entries, which starts at entry start, to the aggregates (if they are up to date)
+        if self._aggregated == start:
+            for code, result in zip(codes, results):
+                self._add_to_statistics(code, result)
+
+    def _add_to_statistics(self, code: int, result: float) -> None:
+
+        self._overall.add(result)
+        aggregate = self._by_code.get(code)
+        if aggregate is None:
+            aggregate = self._by_code[code] = RunningStats()
+        aggregate.add(result)
+        self._aggregated += 1
+
+    def _catch_up(self) -> None:
+
+        # Add the entries the aggregates have not seen yet. Only a reopened history file has any; it pays for one pass over them.
+        for index in range(self._aggregated, len(self)):
+            record = self.record(index)
+            self._add_to_statistics(record[0], record[3])
+
+    @property
+    def operation_types(self) -> tuple:
+
+        return tuple(self._types)
+
+    def _code_for(self, calculation_class: type) -> int:
+
+        # Look up the op code for a Calculation subclass, assigning the next free code the first time it is seen
+        code = self._codes.get(calculation_class)
+        if code is None:
+            code = len(self._types)
+            if code > 255:
+                raise ValueError('History supports at most 256 different calculation types.')
+            self._types.append(calculation_class)
+            self._codes[calculation_class] = code
+        return code
+
+class History(BaseHistory):
+
+    '''
+    Columnar store for the calculations performed by the Calculator.
+    Instead of keeping one Calculation object per entry, each entry is split across five typed arrays:
+    a uint8 op code, and float64 a, b, result and timestamp columns (33 bytes per entry).
+
+    The columns are exposed through the buffer protocol (memoryview), so they can be read without copying,
+    e.g. numpy.frombuffer(history.results, dtype='float64').
+    Release any views (view.release() or a with block) before appending again, since an array cannot grow while it is being viewed.
+    '''
+
+    def __init__(self) -> None:
+
+        super().__init__()
+        self._op_codes = array('B')
+        self._a = array('d')
+        self._b = array('d')
+        self._results = array('d')
+        self._timestamps = array('d')
+
+    def append(self, calc: Calculation, result: float = None, timestamp: float = None) -> None:
+
+        # Add a calculation to the history. Pass result if it is already known, to avoid executing the calculation again.
+        if result is None:
+            result = calc.result
+
+        code = self._code_for(type(calc))
+        try:
+            self._a.append(calc.a)
+            self._b.append(calc.b)
+            self._results.append(result)
+        except OverflowError:
+            # A number from an exact backend beyond the float range: undo the partial append and store it via _doubles
+            count = len(self._op_codes)
+            for column, value in zip((self._a, self._b, self._results), _doubles(calc.a, calc.b, result)):
+                del column[count:]
+                column.append(value)
+        self._op_codes.append(code)
+        self._timestamps.append(time.time() if timestamp is None else timestamp)
+        self._aggregate(code, self._results[-1])
+
+    def extend(self, entries) -> None:
+
+        # One array extend per column, instead of five appends per entry
+        entries = list(entries)
+        start = len(self._op_codes)
+        codes = [self._code_for(calculation_class) for calculation_class, *_ in entries]
+        _, a, b, results, timestamps = zip(*entries) if entries else ((),) * 5
+        columns = (self._a, self._b, self._results)
+        try:
+            for column, values in zip(columns, (a, b, results)):
+                column.extend(values)
+        except OverflowError:
+            # As in append: undo the partial extend and store the numbers via _doubles
+            a, b, results = (_doubles(*values) for values in (a, b, results))
+            for column, values in zip(columns, (a, b, results)):
+                del column[start:]
+                column.extend(values)
+        self._timestamps.extend(timestamps)
+        self._op_codes.extend(codes)
+        self._aggregate_all(start, codes, results)
+
+    def clear(self) -> None:
+
+        del self._op_codes[:]
+        del self._a[:]
+        del self._b[:]
+        del self._results[:]
+        del self._timestamps[:]
+        self._reset_statistics()
+
+    def __len__(self) -> int:
+
+        return len(self._op_codes)
+
+    def record(self, index: int) -> tuple:
+
+        return self._op_codes[index], self._a[index], self._b[index], self._results[index], self._timestamps[index]
+
+    def record_range(self, start: int, stop: int) -> list:
+
+        return list(zip(self._op_codes[start:stop], self._a[start:stop], self._b[start:stop], self._results[start:stop], self._timestamps[start:stop]))
+
+    @property
+    def op_codes(self) -> memoryview:
+
+        return memoryview(self._op_codes).toreadonly()
+
+    @property
+    def a(self) -> memoryview:
+
+        return memoryview(self._a).toreadonly()
+
+    @property
+    def b(self) -> memoryview:
+
+        return memoryview(self._b).toreadonly()
+
+    @property
+    def results(self) -> memoryview:
+
+        return memoryview(self._results).toreadonly()
+
+    @property
+    def timestamps(self) -> memoryview:
+
+        return memoryview(self._timestamps).toreadonly()
+
+'''
+Binary history file used by PersistentHistory:
+
+    header  (HEADER_SIZE bytes): magic, format version, record size, committed entry count, and the op table
+                                 (the registered operation name for each op code, newline-separated)
+    records (RECORD.size bytes each): op code, 7 bytes of padding, then a, b, result and timestamp as little-endian float64
+
+The file is grown in large steps, so it is usually longer than header + count * record size; only the first count records are valid.
+'''
+
+MAGIC = b'CALCHIST'
+FORMAT_VERSION = 1
+HEADER_SIZE = 4096
+HEADER = struct.Struct('<8sIIQI')
+RECORD = struct.Struct('<B7xdddd')
+
+# Initial room for records, and the smallest step the file grows by
+_MIN_CAPACITY = 1 << 20
+
+def read_header(buffer, path: str) -> tuple:
+
+    # Check the header of a history file and return (entry count, registered operation name for each op code)
+    if len(buffer) < HEADER_SIZE:
+        raise ValueError(f"'{path}' is not a calculator history file.")
+    magic, version, record_size, count, table_size = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"'{path}' is not a calculator history file.")
+    if version != FORMAT_VERSION or record_size != RECORD.size:
+        raise ValueError(f"'{path}' uses an unsupported history format (version {version}).")
+
+    table = bytes(buffer[HEADER.size:HEADER.size + table_size]).decode()
+    return count, table.split('\n') if table else []
+
+class _RecordColumn:
+
+    # Read-only sequence over one field of the records in a PersistentHistory, read straight from the mapping
+
+    def __init__(self, history: 'PersistentHistory', field: struct.Struct, offset: int) -> None:
+
+        self._history = history
+        self._field = field
+        self._offset = offset
+
+    def __len__(self) -> int:
+
+        return len(self._history)
+
+    def __getitem__(self, index: int):
+
+        index = self._history._position(index)
+        return self._field.unpack_from(self._history._mmap, HEADER_SIZE + index * RECORD.size + self._offset)[0]
+
+    def __iter__(self):
+
+        for index in range(len(self)):
+            yield self[index]
+
+    def tolist(self) -> list:
+
+        # Read the whole column at once, through a strided view of the records
+        size = self._field.size
+        with self._history.records as records, records.cast(self._field.format[-1]) as values:
+            return values[self._offset // size::RECORD.size // size].tolist()
+
+class PersistentHistory(BaseHistory):
+
+    '''
+    Append-only history stored in a binary file of fixed-size records, written and read through mmap.
+
+    Reopening a file only reads its header, so a history of any size is available immediately, served straight from the mapping
+    without parsing or creating objects. Appends are group-committed: the header's entry count is only advanced (and both records
+    and header flushed to disk) every commit_every entries, after commit_interval seconds, or on flush/close. After a crash the file
+    holds every committed entry; entries appended since the last commit may be lost, but a partly written record is never visible.
+
+    Op codes are stored in the file with the name each Calculation type is registered under, so types must be registered with
+    CalculationFactory both when appending and when reopening.
+    '''
+
+    def __init__(self, path: str, commit_every: int = 1024, commit_interval: float = 1.0) -> None:
+
+        super().__init__()
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = os.fdopen(fd, 'r+b')
+        try:
+            if os.fstat(fd).st_size == 0:
+                self._file.truncate(HEADER_SIZE + _MIN_CAPACITY)
+                self._mmap = mmap.mmap(fd, 0)
+                self._count = 0
+                self._write_header()
+            else:
+                self._mmap = mmap.mmap(fd, 0)
+                self._count = self._read_header()
+        except BaseException:
+            self._file.close()
+            raise
+
+        self._committed = self._count
+        self._last_commit = time.monotonic()
+
+    def _read_header(self) -> int:
+
+        count, names = read_header(self._mmap, self.path)
+        for name in names:
+            self._code_for(CalculationFactory.calculation_class(name))
+        return count
+
+    def _write_header(self) -> None:
+
+        table = '\n'.join(CalculationFactory.calculation_type(calculation_class) for calculation_class in self._types).encode()
+        if HEADER.size + len(table) > HEADER_SIZE:
+            raise ValueError('Too many calculation types to store in the history file header.')
+        self._mmap[HEADER.size:HEADER.size + len(table)] = table
+        HEADER.pack_into(self._mmap, 0, MAGIC, FORMAT_VERSION, RECORD.size, self._count, len(table))
+
+    def __len__(self) -> int:
+
+        return self._count
+
+    def _position(self, index: int) -> int:
+
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('history index out of range')
+        return index
+
+    def record(self, index: int) -> tuple:
+
+        return RECORD.unpack_from(self._mmap, HEADER_SIZE + self._position(index) * RECORD.size)
+
+    def record_range(self, start: int, stop: int) -> list:
+
+        start, stop, _ = slice(start, stop).indices(self._count)
+        return list(RECORD.iter_unpack(self._mmap[HEADER_SIZE + start * RECORD.size:HEADER_SIZE + max(start, stop) * RECORD.size]))
+
+    def append(self, calc: Calculation, result: float = None, timestamp: float = None) -> None:
+
+        if result is None:
+            result = calc.result
+
+        calculation_class = type(calc)
+        code = self._codes.get(calculation_class)
+        if code is None:
+            CalculationFactory.calculation_type(calculation_class) # Fail now if the type cannot be stored by name
+            code = self._code_for(calculation_class)
+
+        offset = HEADER_SIZE + self._count * RECORD.size
+        if offset + RECORD.size > len(self._mmap):
+            self._grow()
+        timestamp = time.time() if timestamp is None else timestamp
+        try:
+            RECORD.pack_into(self._mmap, offset, code, calc.a, calc.b, result, timestamp)
+            result = float(result)
+        except (OverflowError, struct.error): # struct reports an int too large for a double as struct.error
+            a, b, result = _doubles(calc.a, calc.b, result)
+            RECORD.pack_into(self._mmap, offset, code, a, b, result, timestamp)
+        self._count += 1
+        self._aggregate(code, result)
+
+        if self._count - self._committed >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self.flush()
+
+    def extend(self, entries) -> None:
+
+        entries = list(entries)
+        start = self._count
+        codes = []
+        for calculation_class, *_ in entries:
+            code = self._codes.get(calculation_class)
+            if code is None:
+                CalculationFactory.calculation_type(calculation_class) # Fail now if the type cannot be stored by name
+                code = self._code_for(calculation_class)
+            codes.append(code)
+
+        while HEADER_SIZE + (start + len(entries)) * RECORD.size > len(self._mmap):
+            self._grow()
+        pack_into = RECORD.pack_into
+        mapping = self._mmap
+        offset = HEADER_SIZE + start * RECORD.size
+        results = []
+        for code, (_, a, b, result, timestamp) in zip(codes, entries):
+            try:
+                pack_into(mapping, offset, code, a, b, result, timestamp)
+            except (OverflowError, struct.error):
+                a, b, result = _doubles(a, b, result)
+                pack_into(mapping, offset, code, a, b, result, timestamp)
+            results.append(result)
+            offset += RECORD.size
+        self._count += len(entries)
+        self._aggregate_all(start, codes, results)
+
+        if self._count - self._committed >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self.flush()
+
+    def _grow(self) -> None:
+
+        # Double the room for records (at least _MIN_CAPACITY more bytes). Views of the mapping must be released first.
+        size = len(self._mmap)
+        self._mmap.resize(size + max(size - HEADER_SIZE, _MIN_CAPACITY))
+
+    def flush(self) -> None:
+
+        # Commit: write the new records to disk, then advance the count in the header and write that to disk
+        if self._count == self._committed:
+            return
+
+        start = (HEADER_SIZE + self._committed * RECORD.size) // mmap.PAGESIZE * mmap.PAGESIZE
+        end = HEADER_SIZE + self._count * RECORD.size
+        self._mmap.flush(start, end - start)
+
+        self._write_header()
+        self._mmap.flush(0, HEADER_SIZE)
+        self._committed = self._count
+        self._last_commit = time.monotonic()
+
+    def clear(self) -> None:
+
+        self._count = 0
+        self._committed = -1 # Force the next flush to write the header
+        self._reset_statistics()
+        self.flush()
+
+    def close(self) -> None:
+
+        # Commit, then trim the unused room at the end of the file
+        if self._mmap.closed:
+            return
+        self.flush()
+        self._mmap.close()
+        self._file.truncate(HEADER_SIZE + self._count * RECORD.size)
+        self._file.close()
+
+    @property
+    def records(self) -> memoryview:
+
+        # Read-only view of the raw records, e.g. for numpy.frombuffer(history.records, dtype=[('op', 'u1'), ('pad', 'V7'), ('a', '<f8'), ...])
+        return memoryview(self._mmap)[HEADER_SIZE:HEADER_SIZE + self._count * RECORD.size].toreadonly()
+
+    @property
+    def op_codes(self) -> _RecordColumn:
+
+        return _RecordColumn(self, struct.Struct('<B'), 0)
+
+    @property
+    def a(self) -> _RecordColumn:
+
+        return _RecordColumn(self, struct.Struct('<d'), 8)
+
+    @property
+    def b(self) -> _RecordColumn:
+
+        return _RecordColumn(self, struct.Struct('<d'), 16)
+
+    @property
+    def results(self) -> _RecordColumn:
+
+        return _RecordColumn(self, struct.Struct('<d'), 24)
+
+    @property
+    def timestamps(self) -> _RecordColumn:
+
+        return _RecordColumn(self, struct.Struct('<d'), 32)
+
+# Bytes of memory per entry in the columns of a History or BoundedHistory: a uint8 op code and four float64s
+ENTRY_SIZE = 33
+
+_LIMIT = re.compile(r'(\d+)([kmg]?)(i?b)?')
+_UNITS = {'': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+
+def parse_limit(text: str) -> tuple:
+
+    # (capacity, max_bytes) for a history limit: a number of entries ('100000'), or a size in bytes ('64MB', '512K', '1G')
+    match = _LIMIT.fullmatch(text.strip().lower())
+    if match is None:
+        raise ValueError(f"Invalid history limit: '{text}'. Use a number of entries, or a size such as 64MB.")
+    number, unit, suffix = match.groups()
+    if not unit and not suffix:
+        return int(number), None
+    return None, int(number) * _UNITS[unit]
+
+class _RingColumn:
+
+    # Read-only sequence over one field of the records in a BoundedHistory, in history order
+
+    def __init__(self, history: 'BoundedHistory', field: int) -> None:
+
+        self._history = history
+        self._field = field
+
+    def __len__(self) -> int:
+
+        return len(self._history)
+
+    def __getitem__(self, index: int):
+
+        return self._history.record(index)[self._field]
+
+    def __iter__(self):
+
+        for index in range(len(self)):
+            yield self[index]
+
+    def tolist(self) -> list:
+
+        return self._history._column(self._field)
+
+class BoundedHistory(BaseHistory):
+
+    '''
+    History with a fixed amount of memory, for long unattended sessions. The latest capacity entries are kept in a ring buffer:
+    five columns like those of History, allocated once at full size, where each append past capacity overwrites the oldest entry.
+    The capacity is given as a number of entries, or as max_bytes, a budget for the columns (ENTRY_SIZE bytes per entry).
+
+    Without spill_dir, the oldest entries are dropped: the history holds the latest capacity entries, and evicted counts the
+    dropped ones. Their results stay in statistics(), which is kept as entries are appended.
+
+    With spill_dir, evicted entries are packed as RECORD structs into segments of segment_size entries, and each full segment is
+    compressed with zlib and written to a file in a directory of its own under spill_dir. The history then still holds every entry,
+    in order: older entries are read back from their segment on demand, keeping only the last segment read in memory, so memory
+    stays flat however many entries spill. The segments only extend this history's memory; they are deleted by clear and close
+    (which drops their entries). To keep a history between sessions, use PersistentHistory.
+    The history indexes (app.query) only cover the entries in the ring; queries read the spilled entries back instead.
+    '''
+
+    def __init__(self, capacity: int = None, max_bytes: int = None, spill_dir: str = None, segment_size: int = 4096) -> None:
+
+        super().__init__()
+        if (capacity is None) == (max_bytes is None):
+            raise ValueError('Give the history limit as either a number of entries or a number of bytes.')
+        if capacity is None:
+            capacity = max_bytes // ENTRY_SIZE
+        if capacity < 1:
+            raise ValueError(f'History limit is too small: it must hold at least one entry ({ENTRY_SIZE} bytes).')
+        if segment_size < 1:
+            raise ValueError('Spill segments must hold at least one entry.')
+
+        self.capacity = capacity
+        self.segment_size = segment_size
+        self.spill_dir = spill_dir
+        self._op_codes = array('B', bytes(capacity))
+        self._a = array('d', bytes(8 * capacity))
+        self._b = array('d', bytes(8 * capacity))
+        self._results = array('d', bytes(8 * capacity))
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._columns = (self._op_codes, self._a, self._b, self._results, self._timestamps)
+
+        # The oldest entry in the ring is at _head, and the ring holds _size entries
+        self._head = 0
+        self._size = 0
+
+        # Evicted entries waiting for a full segment, the number of segments written, and the last segment read back
+        self._pending = bytearray()
+        self._segments = 0
+        self._cached = (None, b'')
+        self._spill_path = None if spill_dir is None else tempfile.mkdtemp(prefix='history-', dir=spill_dir)
+
+    def __len__(self) -> int:
+
+        return self._segments * self.segment_size + len(self._pending) // RECORD.size + self._size
+
+    @property
+    def spilled(self) -> int:
+
+        return self._segments * self.segment_size + len(self._pending) // RECORD.size
+
+    def append(self, calc: Calculation, result: float = None, timestamp: float = None) -> None:
+
+        if result is None:
+            result = calc.result
+        code = self._code_for(type(calc))
+        try:
+            a, b, result = float(calc.a), float(calc.b), float(result)
+        except OverflowError:
+            a, b, result = _doubles(calc.a, calc.b, result)
+        self._push(code, a, b, result, time.time() if timestamp is None else timestamp)
+
+    def extend(self, entries) -> None:
+
+        for calculation_class, a, b, result, timestamp in entries:
+            code = self._code_for(calculation_class)
+            try:
+                self._push(code, a, b, result, timestamp)
+            except OverflowError:
+                # As in append. The failed push stored nothing, so this one takes the same place in the ring.
+                self._push(code, *_doubles(a, b, result), timestamp)
+
+    def _push(self, code: int, a: float, b: float, result: float, timestamp: float) -> None:
+
+        if self._size == self.capacity:
+            self._evict()
+        position = (self._head + self._size) % self.capacity
+        self._op_codes[position] = code
+        self._a[position] = a
+        self._b[position] = b
+        self._results[position] = result
+        self._timestamps[position] = timestamp
+        self._size += 1
+        self._add_to_statistics(code, result)
+
+    def _evict(self) -> None:
+
+        # Drop the oldest entry from the ring, or move it to the pending segment, writing the segment out once it is full
+        head = self._head
+        if self._spill_path is None:
+            self.evicted += 1
+        else:
+            self._pending += RECORD.pack(*(column[head] for column in self._columns))
+            if len(self._pending) == self.segment_size * RECORD.size:
+                with open(self._segment_path(self._segments), 'wb') as file:
+                    file.write(zlib.compress(self._pending, 1))
+                self._segments += 1
+                self._pending = bytearray()
+        self._head = (head + 1) % self.capacity
+        self._size -= 1
+
+    def _segment_path(self, number: int) -> str:
+
+        return os.path.join(self._spill_path, f'{number:08d}.seg')
+
+    def _segment(self, number: int) -> bytes:
+
+        # The records of one spilled segment, decompressed. Only the last segment read is kept.
+        if self._cached[0] != number:
+            with open(self._segment_path(number), 'rb') as file:
+                self._cached = (number, zlib.decompress(file.read()))
+        return self._cached[1]
+
+    def record(self, index: int) -> tuple:
+
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('history index out of range')
+
+        spilled = self._segments * self.segment_size
+        ring_start = spilled + len(self._pending) // RECORD.size
+        if index >= ring_start:
+            position = (self._head + index - ring_start) % self.capacity
+            return tuple(column[position] for column in self._columns)
+        if index >= spilled:
+            return RECORD.unpack_from(self._pending, (index - spilled) * RECORD.size)
+        number, offset = divmod(index, self.segment_size)
+        return RECORD.unpack_from(self._segment(number), offset * RECORD.size)
+
+    def record_range(self, start: int, stop: int) -> list:
+
+        return [self.record(index) for index in range(*slice(start, stop).indices(len(self)))]
+
+    def _column(self, field: int) -> list:
+
+        # Every value of one field, in history order: the spilled segments one at a time, the pending segment, then the ring
+        values = []
+        for number in range(self._segments):
+            values.extend(record[field] for record in RECORD.iter_unpack(self._segment(number)))
+        values.extend(record[field] for record in RECORD.iter_unpack(self._pending))
+        column = self._columns[field]
+        end = self._head + self._size
+        values.extend(column[self._head:min(end, self.capacity)])
+        values.extend(column[:max(0, end - self.capacity)])
+        return values
+
+    def clear(self) -> None:
+
+        self._head = 0
+        self._size = 0
+        self.evicted = 0
+        self._pending = bytearray()
+        self._cached = (None, b'')
+        for number in range(self._segments):
+            os.remove(self._segment_path(number))
+        self._segments = 0
+        self._reset_statistics()
+
+    def close(self) -> None:
+
+        # Delete the spilled segments. Their entries are dropped and counted in evicted, as if the history had never spilled,
+        # so it can still be used after close (without spilling).
+        if self._spill_path is not None:
+            shutil.rmtree(self._spill_path, ignore_errors=True)
+            self._spill_path = None
+            self.evicted += self.spilled
+            self._segments = 0
+            self._pending = bytearray()
+            self._cached = (None, b'')
+
+    @property
+    def op_codes(self) -> _RingColumn:
+
+        return _RingColumn(self, 0)
+
+    @property
+    def a(self) -> _RingColumn:
+
+        return _RingColumn(self, 1)
+
+    @property
+    def b(self) -> _RingColumn:
+
+        return _RingColumn(self, 2)
+
+    @property
+    def results(self) -> _RingColumn:
+
+        return _RingColumn(self, 3)
+
+    @property
+    def timestamps(self) -> _RingColumn:
+
+        return _RingColumn(self, 4)
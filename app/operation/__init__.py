@@ -1,5 +1,20 @@
+import math
+import operator
+import sys
+
+from array import array
+
 class Operation:
 
+    '''
+    The four operations on floats. This class is also the float numeric backend: subclasses made by numeric_backend
+    work in other number types by overriding parse and the operations that differ (see below).
+    '''
+
+    # Backend name, and the function that turns an operand as typed into a number of this backend
+    name = 'float'
+    parse = staticmethod(float)
+
     @staticmethod
     def addition(a: float, b: float) -> float:
 
@@ -26,3 +41,303 @@ class Operation:
             raise ZeroDivisionError('Division by zero is not allowed.')
 
         return a / b
+
+    '''
+    Batch versions of the operations above.
+    Each one takes two equally long sequences of operands (lists, array('d'), memoryviews, or NumPy arrays) and returns all of the results at once.
+    NumPy arrays in give a NumPy array out; anything else gives an array('d') out.
+    '''
+
+    @staticmethod
+    def batch_addition(a, b):
+
+        # Add a[i] and b[i] for every i
+        return _batch(operator.add, a, b)
+
+    @staticmethod
+    def batch_subtraction(a, b):
+
+        # Subtract b[i] from a[i] for every i
+        return _batch(operator.sub, a, b)
+
+    @staticmethod
+    def batch_multiplication(a, b):
+
+        # Multiply a[i] and b[i] for every i
+        return _batch(operator.mul, a, b)
+
+    @staticmethod
+    def batch_division(a, b, zero_division: str = 'nan'):
+
+        # Divide a[i] by b[i] for every i.
+        # zero_division decides what happens to elements with a zero divisor:
+        #   'nan'   : the result for that element is NaN (default)
+        #   'raise' : raise ZeroDivisionError naming the first bad element
+        # Use Operation.zero_divisor_mask to find out which elements had a zero divisor.
+        if zero_division not in ('nan', 'raise'):
+            raise ValueError(f"Unsupported zero_division policy: '{zero_division}'. Available policies: nan, raise")
+
+        _check_lengths(a, b)
+        numpy = _numpy_for(a, b)
+        if numpy is not None: # pragma: no cover - NumPy is optional
+            mask = numpy.asarray(b) == 0
+            if zero_division == 'raise' and mask.any():
+                raise ZeroDivisionError(f'Division by zero is not allowed (element {int(mask.argmax())}).')
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                result = numpy.true_divide(a, b, dtype=numpy.float64)
+            result[mask] = math.nan
+            return result
+
+        divisors = b if isinstance(b, array) else array('d', b)
+        if 0.0 not in divisors:
+            # Fast path: no zero divisors, so the whole batch is done in C
+            return array('d', map(operator.truediv, a, divisors))
+
+        if zero_division == 'raise':
+            raise ZeroDivisionError(f'Division by zero is not allowed (element {divisors.index(0.0)}).')
+
+        nan = math.nan
+        return array('d', [x / y if y else nan for x, y in zip(a, divisors)])
+
+    @staticmethod
+    def zero_divisor_mask(b):
+
+        # Return 1 for every element of b that is zero (i.e. would fail in Operation.division) and 0 otherwise
+        numpy = _numpy_for(b)
+        if numpy is not None: # pragma: no cover - NumPy is optional
+            return numpy.asarray(b) == 0
+
+        return array('B', [y == 0 for y in b])
+
+def _numpy_for(*operands):
+
+    # Return the numpy module if any operand is a NumPy array, so NumPy is never imported just for this check
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and any(isinstance(operand, numpy.ndarray) for operand in operands):
+        return numpy # pragma: no cover - NumPy is optional
+    return None
+
+def _check_lengths(a, b) -> None:
+
+    if len(a) != len(b):
+        raise ValueError(f'Operand sequences must be the same length (got {len(a)} and {len(b)}).')
+
+def _batch(function, a, b):
+
+    # Apply function element by element. map() with an operator function keeps the whole loop in C.
+    _check_lengths(a, b)
+    numpy = _numpy_for(a, b)
+    if numpy is not None: # pragma: no cover - NumPy is optional
+        return function(numpy.asarray(a, dtype=numpy.float64), numpy.asarray(b, dtype=numpy.float64))
+
+    return array('d', map(function, a, b))
+
+'''
+Numeric backends: the number type the calculator works in. A backend is Operation or a subclass of it, chosen by name with numeric_backend():
+
+    float          : Python floats, the default. This is Operation itself.
+    int            : exact integers of any size. Division gives an int when it is exact, and a Fraction otherwise.
+    fraction       : exact rationals (fractions.Fraction). Operands can be written as 0.1 or 1/3.
+    decimal[:P]    : decimal.Decimal rounded to P significant digits (default 28). The operations are the methods of one decimal
+                     Context created with the backend, so they do not look up the thread's current context on every call.
+    fixed[:N]      : fixed point with N decimal places (default 2), for money. Values are FixedPoint integers counting units of 10**-N,
+                     kept within the signed 64-bit range, with products and quotients rounded half to even.
+
+A backend's functions are bound when it is created, so using one costs no type checks per calculation.
+Only the float backend is loaded up front; the others import fractions or decimal when they are first chosen.
+The batch functions above always work in floats.
+'''
+
+BACKENDS = ('float', 'int', 'fraction', 'decimal', 'fixed')
+
+# Backends already created, by full name (e.g. 'decimal:50'), so choosing one again reuses it and its decimal context
+_backends = {'float': Operation}
+
+def numeric_backend(name: str) -> type:
+
+    # The backend called name, e.g. 'fraction' or 'decimal:50'
+    name = name.lower()
+    backend = _backends.get(name)
+    if backend is not None:
+        return backend
+
+    kind, separator, argument = name.partition(':')
+    create = {'int': _int_backend, 'fraction': _fraction_backend, 'decimal': _decimal_backend, 'fixed': _fixed_backend}.get(kind)
+    if create is None or (separator and kind not in ('decimal', 'fixed')):
+        raise ValueError(f"Unsupported numeric backend: '{name}'. Available backends: {', '.join(BACKENDS)}")
+    if separator and not argument.isdigit():
+        raise ValueError(f"Invalid setting for the {kind} backend: '{argument}'. Please enter a whole number.")
+
+    backend = create(int(argument) if separator else None)
+    backend.name = name
+    _backends[name] = backend
+    return backend
+
+def _invalid_number(backend: str, text: str) -> ValueError:
+
+    return ValueError(f"Invalid number for the {backend} backend: '{text}'.")
+
+def _int_backend(_) -> type:
+
+    from fractions import Fraction
+
+    class IntOperation(Operation):
+
+        @staticmethod
+        def parse(text: str) -> int:
+            try:
+                return int(text)
+            except ValueError:
+                raise _invalid_number('int', text) from None
+
+        @staticmethod
+        def division(a: int, b: int):
+            # Exact division: the quotient when b divides a, otherwise the exact fraction
+            if b == 0:
+                raise ZeroDivisionError('Division by zero is not allowed.')
+            quotient, remainder = divmod(a, b)
+            return Fraction(a, b) if remainder else quotient
+
+    return IntOperation
+
+def _fraction_backend(_) -> type:
+
+    from fractions import Fraction
+
+    # Addition, subtraction, multiplication and division are the float ones: the operators work on fractions as they are
+    class FractionOperation(Operation):
+
+        @staticmethod
+        def parse(text: str) -> Fraction:
+            try:
+                return Fraction(text)
+            except (ValueError, ZeroDivisionError):
+                raise _invalid_number('fraction', text) from None
+
+    return FractionOperation
+
+def _decimal_backend(precision: int) -> type:
+
+    import decimal
+
+    if precision is not None and not 1 <= precision <= decimal.MAX_PREC:
+        raise ValueError(f'Decimal precision must be between 1 and {decimal.MAX_PREC} digits.')
+
+    context = decimal.Context(
+        prec=precision or 28,
+        rounding=decimal.ROUND_HALF_EVEN,
+        traps=[decimal.InvalidOperation, decimal.DivisionByZero, decimal.Overflow],
+    )
+
+    divide = context.divide
+
+    class DecimalOperation(Operation):
+
+        addition = staticmethod(context.add)
+        subtraction = staticmethod(context.subtract)
+        multiplication = staticmethod(context.multiply)
+
+        @staticmethod
+        def division(a: decimal.Decimal, b: decimal.Decimal) -> decimal.Decimal:
+            # Checked here, like Operation.division, because the context reports 0 / 0 as InvalidOperation rather than a ZeroDivisionError
+            if b == 0:
+                raise ZeroDivisionError('Division by zero is not allowed.')
+            return divide(a, b)
+
+        @staticmethod
+        def parse(text: str) -> decimal.Decimal:
+            try:
+                return context.create_decimal(text)
+            except decimal.InvalidOperation:
+                raise _invalid_number('decimal', text) from None
+
+    return DecimalOperation
+
+class FixedPoint(int):
+
+    '''
+    A fixed-point number, stored as the integer count of units of 10 ** -PLACES (e.g. cents for PLACES = 2).
+    It is an int, so the fixed backend works on it with integer arithmetic, and it prints (and converts to float) as its decimal value.
+    Each fixed backend has its own subclass with PLACES set.
+    '''
+
+    __slots__ = ()
+
+    PLACES = 2
+
+    def __str__(self) -> str:
+
+        sign = '-' if self < 0 else ''
+        whole, fraction = divmod(abs(int(self)), 10 ** self.PLACES)
+        return f'{sign}{whole}.{fraction:0{self.PLACES}d}' if self.PLACES else f'{sign}{whole}'
+
+    __repr__ = __str__
+
+    def __float__(self) -> float:
+
+        return int(self) / 10 ** self.PLACES
+
+# Most decimal places the fixed backend supports: 10 ** 18 is the largest power of ten below 2 ** 63
+MAX_FIXED_PLACES = 18
+
+def _fixed_backend(places: int) -> type:
+
+    import decimal
+
+    # Values are int64 counts of units, so 1 (10 ** places units) has to fit: at most 18 places
+    places = 2 if places is None else places
+    if places > MAX_FIXED_PLACES:
+        raise ValueError(f'Fixed point places must be between 0 and {MAX_FIXED_PLACES}.')
+    scale = 10 ** places
+    number_class = type(f'FixedPoint{places}', (FixedPoint,), {'__slots__': (), 'PLACES': places})
+    low, high = -2 ** 63, 2 ** 63
+
+    def fixed(units: int) -> FixedPoint:
+        if not low <= units < high:
+            raise OverflowError('Result is out of range for fixed point.')
+        return number_class(units)
+
+    def divide(numerator: int, denominator: int) -> int:
+        # numerator / denominator, rounded half to even
+        if denominator < 0:
+            numerator, denominator = -numerator, -denominator
+        quotient, remainder = divmod(numerator, denominator)
+        if 2 * remainder > denominator or (2 * remainder == denominator and quotient & 1):
+            quotient += 1
+        return quotient
+
+    class FixedPointOperation(Operation):
+
+        @staticmethod
+        def parse(text: str) -> FixedPoint:
+            # Plain amounts with at most places decimals, e.g. '-12.5', are converted with int(); anything else goes through Decimal and is rounded
+            whole, _, fraction = text.partition('.')
+            if len(fraction) <= places and (whole.lstrip('+-') or fraction):
+                try:
+                    return fixed(int(whole + fraction.ljust(places, '0')))
+                except (ValueError, OverflowError):
+                    pass
+            try:
+                return fixed(int(decimal.Decimal(text).scaleb(places).to_integral_value(decimal.ROUND_HALF_EVEN)))
+            except (decimal.InvalidOperation, ValueError, OverflowError):
+                raise _invalid_number('fixed', text) from None
+
+        @staticmethod
+        def addition(a: int, b: int) -> FixedPoint:
+            return fixed(a + b)
+
+        @staticmethod
+        def subtraction(a: int, b: int) -> FixedPoint:
+            return fixed(a - b)
+
+        @staticmethod
+        def multiplication(a: int, b: int) -> FixedPoint:
+            return fixed(divide(a * b, scale))
+
+        @staticmethod
+        def division(a: int, b: int) -> FixedPoint:
+            if b == 0:
+                raise ZeroDivisionError('Division by zero is not allowed.')
+            return fixed(divide(a * scale, b))
+
+    return FixedPointOperation
@@ -0,0 +1,166 @@
+import sys
+
+from abc import ABC, abstractmethod
+from io import StringIO
+
+'''
+Output sinks for the Calculator REPL. The REPL writes every line through a sink instead of calling print(), and reads its
+input through the sink too, since reading has to be ordered with the output (input() flushes standard output first):
+
+    TerminalSink : writes each line and flushes it, for a person at a terminal
+    BufferedSink : collects lines in a reusable buffer and writes them in blocks, for output to a file or pipe
+    MemorySink   : keeps all the output in memory, for embedding the calculator in another program
+    QuietSink    : writes nothing and keeps only the results
+
+Lines are formatted into one StringIO buffer per sink, which is emptied (not replaced) each time it is written out.
+'''
+
+# Characters BufferedSink collects before writing them out
+BUFFER_SIZE = 1 << 16
+
+SINKS = ('auto', 'terminal', 'buffered')
+
+class OutputSink(ABC):
+
+    '''
+    Where the Calculator writes its output. write() takes one line of text, like print(), and result() the text of one result,
+    shown as 'Result: TEXT'. read() shows the prompt and returns the next input line, raising EOFError at the end of the input.
+    '''
+
+    @abstractmethod
+    def write(self, text: str = '', end: str = '\n') -> None:
+
+        pass # pragma: no cover
+
+    def result(self, text: str) -> None:
+
+        self.write(f'Result: {text}\n')
+
+    def read(self, prompt: str) -> str:
+
+        self.write(prompt, end='')
+        return input('')
+
+    def flush(self) -> None:
+
+        pass
+
+    def close(self) -> None:
+
+        self.flush()
+
+class TerminalSink(OutputSink):
+
+    '''Writes and flushes every line, prompts included, to stream or else to whatever sys.stdout is at the time.'''
+
+    def __init__(self, stream=None) -> None:
+
+        self.stream = stream
+
+    def write(self, text: str = '', end: str = '\n') -> None:
+
+        stream = self.stream or sys.stdout
+        stream.write(text + end)
+        stream.flush()
+
+    def read(self, prompt: str) -> str:
+
+        # input() keeps line editing and history at a terminal, but it writes the prompt to sys.stdout, so with a stream of
+        # its own the sink writes the prompt there and reads the line from sys.stdin itself, as input() returns it
+        if self.stream is None:
+            return input(prompt)
+        self.write(prompt, end='')
+        line = sys.stdin.readline()
+        if not line:
+            raise EOFError
+        return line.rstrip('\n')
+
+class BufferedSink(OutputSink):
+
+    '''
+    Collects lines in a buffer and writes them to stream in blocks of about buffer_size characters, so a long session with
+    its output redirected makes a few large writes instead of one per line. Input is read from source (default sys.stdin)
+    without flushing the output first, so nothing is written until the buffer fills up or the sink is flushed or closed.
+    Don't use it when another program waits for each answer before sending the next line.
+    '''
+
+    def __init__(self, stream=None, buffer_size: int = BUFFER_SIZE, source=None) -> None:
+
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.source = source
+        self._buffer = StringIO()
+
+    def write(self, text: str = '', end: str = '\n') -> None:
+
+        buffer = self._buffer
+        buffer.write(text)
+        buffer.write(end)
+        if buffer.tell() >= self.buffer_size:
+            self._drain()
+
+    def read(self, prompt: str) -> str:
+
+        self.write(prompt, end='')
+        line = (self.source or sys.stdin).readline()
+        if not line:
+            raise EOFError
+        return line
+
+    def _drain(self) -> None:
+
+        buffer = self._buffer
+        if buffer.tell():
+            (self.stream or sys.stdout).write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+
+    def flush(self) -> None:
+
+        self._drain()
+        (self.stream or sys.stdout).flush()
+
+class MemorySink(OutputSink):
+
+    '''Keeps everything written, prompts included, for getvalue(). Input still comes from input().'''
+
+    def __init__(self) -> None:
+
+        self._buffer = StringIO()
+
+    def write(self, text: str = '', end: str = '\n') -> None:
+
+        self._buffer.write(text)
+        self._buffer.write(end)
+
+    def getvalue(self) -> str:
+
+        return self._buffer.getvalue()
+
+class QuietSink(OutputSink):
+
+    '''Writes nothing. The text of each result is kept in results.'''
+
+    def __init__(self) -> None:
+
+        self.results = []
+
+    def write(self, text: str = '', end: str = '\n') -> None:
+
+        pass
+
+    def result(self, text: str) -> None:
+
+        self.results.append(text)
+
+def make_sink(kind: str = 'auto') -> OutputSink:
+
+    # The sink for main.py --output: auto picks the terminal sink when a person is typing the input or reading the output,
+    # and the buffered sink only when both are redirected (e.g. 'python main.py | tee session.log' still shows each answer)
+    if kind == 'auto':
+        kind = 'terminal' if sys.stdin.isatty() or sys.stdout.isatty() else 'buffered'
+    if kind == 'terminal':
+        return TerminalSink()
+    if kind == 'buffered':
+        return BufferedSink()
+    raise ValueError(f"Unknown output: '{kind}'. Use one of: {', '.join(SINKS)}.")
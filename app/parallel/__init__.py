@@ -0,0 +1,152 @@
+import os
+import sys
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TextIO
+
+from app.batch import CHUNK_SIZE as OUTPUT_BUFFER_SIZE, evaluate_line
+from app.calculation import CalculationFactory
+
+'''
+Multiprocess evaluation of large calculation files.
+The input file is split into byte-range shards that start and end on line boundaries. Each shard is evaluated in a
+ProcessPoolExecutor worker, and the results are written back out in input order, exactly as run_batch would write them.
+
+The same can be done with a pool of threads (threads=True). Threads share the CalculationFactory registry, whose lookups are
+lock-free, so they scale on free-threaded Python builds; with the GIL, only one thread runs Python code at a time.
+evaluate_calculations is the thread-pool evaluator for (operation, a, b) triples that are already in memory.
+'''
+
+# Calculations per task for evaluate_calculations
+CALCULATIONS_PER_TASK = 4096
+
+# Bytes of input per shard
+CHUNK_SIZE = 16 << 20
+
+def shard_file(path: str, chunk_size: int = CHUNK_SIZE) -> list:
+
+    # Split the file into (start, end) byte ranges of about chunk_size bytes. Every range except the last ends just after a newline.
+    if chunk_size < 1:
+        raise ValueError('Chunk size must be at least 1 byte.')
+
+    size = os.path.getsize(path)
+    shards = []
+    start = 0
+    with open(path, 'rb') as file:
+        while start < size:
+            file.seek(min(start + chunk_size, size) - 1)
+            file.readline() # Move forward to the end of the line the boundary falls in
+            end = min(file.tell(), size)
+            shards.append((start, end))
+            start = end
+    return shards
+
+def evaluate_shard(path: str, start: int, end: int) -> tuple:
+
+    # Evaluate the lines in bytes [start, end) of the file.
+    # Returns (result text, [(line number within the shard, error message)], number of lines in the shard).
+    with open(path, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode()
+
+    # Universal newlines, as run_batch reads its input: \r\n and a lone \r end a line too. A shard always ends just after a \n,
+    # so a \r\n pair is never split between two shards.
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    if lines[-1] == '':
+        lines.pop() # The shard ends with a newline, which does not start another line
+
+    results = []
+    problems = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line or line.isspace():
+            continue
+        ok, text = evaluate_line(line)
+        if ok:
+            results.append(text)
+        else:
+            problems.append((line_number, text))
+
+    return ''.join(text + '\n' for text in results), problems, len(lines)
+
+def _init_worker(backend: str = 'float') -> None:
+
+    # Load the CalculationFactory registry once per worker process, rather than on the first shard it evaluates,
+    # and use the same numeric backend as the parent process
+    CalculationFactory.set_backend(backend)
+
+def evaluate_file(path: str, out: TextIO, errors: TextIO, workers: int = None, chunk_size: int = CHUNK_SIZE, threads: bool = False,
+                  shards: list = None) -> int:
+
+    # Evaluate every line of the file using a pool of worker processes (os.cpu_count() by default), or of threads if threads is True.
+    # Output is the same as run_batch: results in input order on out, and "line N: message" on errors. Returns the number of failed lines.
+    # Pass shards if shard_file has already been called for the file.
+
+    if shards is None:
+        shards = shard_file(path, chunk_size)
+    workers = workers or os.cpu_count() or 1
+    failed = 0
+    line_offset = 0
+
+    if threads:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(CalculationFactory.backend().name,))
+
+    with executor:
+
+        # Keep only a few shards in flight per worker, so finished-but-unwritten results cannot pile up in memory
+        pending = deque()
+        remaining = iter(shards)
+        for start, end in remaining:
+            pending.append(executor.submit(evaluate_shard, path, start, end))
+            if len(pending) >= 2 * workers:
+                break
+
+        while pending:
+            text, problems, line_count = pending.popleft().result()
+            shard = next(remaining, None)
+            if shard is not None:
+                pending.append(executor.submit(evaluate_shard, path, *shard))
+
+            out.write(text)
+            if problems:
+                errors.write(''.join(f'line {line_offset + line_number}: {message}\n' for line_number, message in problems))
+                failed += len(problems)
+            line_offset += line_count
+
+    out.flush()
+    errors.flush()
+    return failed
+
+def evaluate_calculations(calculations: list, workers: int = None, chunk_size: int = CALCULATIONS_PER_TASK) -> list:
+
+    # Evaluate (operation, a, b) triples with CalculationFactory.evaluate on a pool of threads (os.cpu_count() by default),
+    # chunk_size triples per task, and return the results in input order. The first error (e.g. ZeroDivisionError) is raised.
+    evaluate = CalculationFactory.evaluate
+
+    def evaluate_chunk(start: int) -> list:
+        return [evaluate(operation, a, b) for operation, a, b in calculations[start:start + chunk_size]]
+
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = []
+        for chunk in executor.map(evaluate_chunk, range(0, len(calculations), chunk_size)):
+            results.extend(chunk)
+    return results
+
+def parallel_main(path: str, workers: int, chunk_size: int = CHUNK_SIZE, threads: bool = False) -> int:
+
+    # Entry point for main.py --batch FILE --workers N [--threads]. Exit codes are the same as batch_main.
+
+    try:
+        shards = shard_file(path, chunk_size)
+    except (OSError, ValueError) as e:
+        print(f'Cannot open batch input: {e}', file=sys.stderr)
+        return 2
+
+    sys.stdout.flush()
+    with open(sys.stdout.fileno(), 'w', buffering=OUTPUT_BUFFER_SIZE, closefd=False) as out:
+        failed = evaluate_file(path, out, sys.stderr, workers, chunk_size, threads, shards)
+
+    return 1 if failed else 0
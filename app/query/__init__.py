@@ -0,0 +1,411 @@
+import heapq
+import itertools
+import math
+import operator
+import re
+import time
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from app.calculation import CalculationFactory
+
+'''
+Indexed queries over a calculation history, for the REPL commands
+
+    history where op=divide result>100 since 10m
+    history top 10 by result
+
+A query is a list of conditions. Each condition can count its matches from an index in O(log n) and list them without scanning,
+so a query starts from the condition with the fewest matches and checks the others only against those entries, reading just the values
+they test from the history columns. The REPL only shows the last page of matches: a query with one condition counts its matches from its
+index and reads only that page, newest first, while a query with several conditions costs O(candidates of its most selective one).
+
+Indexes are built the first time a query needs them and then kept up to date as entries are appended to the history.
+They only cover the entries a history keeps in memory. The entries a BoundedHistory has spilled to disk are read back and checked
+one chunk at a time by every query instead, so the memory a spilling history uses stays flat however many queries run.
+'''
+
+# Record fields (as in BaseHistory.record) that can be queried, and the history column each one is read from
+FIELDS = {
+    'a': (1, 'a'),
+    'b': (2, 'b'),
+    'result': (3, 'results'),
+    'timestamp': (4, 'timestamps'),
+}
+
+# Units for 'since' durations, in seconds
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Above this many new entries, an index is rebuilt from the columns instead of updated one entry at a time
+_REBUILD_THRESHOLD = 4096
+
+# Spilled entries read back at a time by a query
+_SCAN_CHUNK = 4096
+
+class SortedIndex:
+
+    '''
+    Entry positions ordered by the value of one field, for range lookups with bisect.
+    Keys are kept in one float64 array and positions in a parallel uint64 array. NaN values are left out, since they match no range.
+
+    Appending a key no smaller than the last one (e.g. a timestamp) is O(1). Other keys wait in a pending list
+    and are merged in by the next lookup, so a run of appends never pays for keeping the arrays sorted.
+    '''
+
+    def __init__(self, values: list = (), start: int = 0) -> None:
+
+        # values[i] is the key of the entry at position start + i
+        order = sorted((position for position, value in enumerate(values) if value == value), key=values.__getitem__)
+        self.keys = array('d', map(values.__getitem__, order))
+        self.positions = array('Q', (start + position for position in order))
+        self._pending = []
+
+    def add(self, key: float, position: int) -> None:
+
+        if key != key:
+            return
+        if self._pending or (self.keys and key < self.keys[-1]):
+            self._pending.append((key, position))
+        else:
+            self.keys.append(key)
+            self.positions.append(position)
+
+    def _merge(self) -> None:
+
+        # Merge the pending keys in: one insertion each when there are few of them, otherwise one sort of everything
+        pending = self._pending
+        if not pending:
+            return
+        self._pending = []
+        pending.sort()
+        if len(pending) <= 64:
+            for key, position in pending:
+                index = bisect_right(self.keys, key)
+                self.keys.insert(index, key)
+                self.positions.insert(index, position)
+            return
+        items = sorted([*zip(self.keys, self.positions), *pending])
+        self.keys = array('d', (key for key, _ in items))
+        self.positions = array('Q', (position for _, position in items))
+
+    def bounds(self, low: float = None, high: float = None, low_inclusive: bool = True, high_inclusive: bool = True) -> tuple:
+
+        # Return (start, stop) such that positions[start:stop] are the entries with low <(=) key <(=) high
+        self._merge()
+        start = 0 if low is None else (bisect_left if low_inclusive else bisect_right)(self.keys, low)
+        stop = len(self.keys) if high is None else (bisect_right if high_inclusive else bisect_left)(self.keys, high)
+        return start, max(start, stop)
+
+class HistoryIndex:
+
+    '''
+    Indexes over the entries one history keeps in memory: entry numbers for each op code, and a SortedIndex for each field in FIELDS.
+    An entry's number is its position plus the history's evicted count, so it does not change when a BoundedHistory drops older
+    entries. Dropped or spilled entries are left out of every result (resident() turns entry numbers back into positions), and once
+    they outnumber the entries still in memory, the indexes are built again without them.
+
+    Each index is built on first use, from the entries the index had seen at its last update(). update() brings every built
+    index up to date with the history, and starts again if the history has been cleared since.
+    '''
+
+    def __init__(self, history) -> None:
+
+        self.history = history
+        self.evicted = history.evicted
+        self.first = self.evicted + history.spilled
+        self._start = self.first
+        self._end = self.first
+        self._operations = None
+        self._sorted = {}
+
+    def update(self) -> None:
+
+        history = self.history
+        evicted = history.evicted
+        first = evicted + history.spilled
+        end = evicted + len(history)
+        new = max(self._end, first)
+        if (
+            end < self._end or first < self._start or end - new > _REBUILD_THRESHOLD or first - self._start > end - first
+            or (self._operations is None and not self._sorted)
+        ):
+            self._operations = None
+            self._sorted = {}
+            self._start = first
+        else:
+            for number in range(new, end):
+                record = history.record(number - evicted)
+                if self._operations is not None:
+                    self._operations.setdefault(record[0], array('Q')).append(number)
+                for field, index in self._sorted.items():
+                    index.add(record[FIELDS[field][0]], number)
+        self._end = end
+        self.first = first
+        self.evicted = evicted
+
+    @property
+    def spilled(self) -> int:
+
+        # Entries at the front of the history that are not indexed, and are read back by each query instead
+        return self.first - self.evicted
+
+    @property
+    def stale(self) -> bool:
+
+        # Whether the indexes may still hold entries that have been dropped or spilled since they were built
+        return self.first > self._start
+
+    def resident(self, numbers) -> list:
+
+        # The positions of the given entry numbers, leaving out the entries no longer in memory
+        first, evicted = self.first, self.evicted
+        if not first:
+            return list(numbers)
+        return [number - evicted for number in numbers if number >= first]
+
+    def spilled_records(self):
+
+        # (position, record) for each spilled entry, read back one chunk at a time
+        for start in range(0, self.spilled, _SCAN_CHUNK):
+            yield from enumerate(self.history.record_range(start, min(start + _SCAN_CHUNK, self.spilled)), start)
+
+    def _values(self, column: str) -> list:
+
+        # The values of one history column for the entries in memory, up to the last update()
+        start, stop = self.spilled, self._end - self.evicted
+        values = getattr(self.history, column)
+        if not start:
+            return values.tolist()[:stop]
+        return [values[position] for position in range(start, stop)]
+
+    def operation_positions(self, code: int) -> array:
+
+        # Numbers of the entries with op code code, in history order
+        if self._operations is None:
+            self._operations = {}
+            for number, op_code in enumerate(self._values('op_codes'), self.first):
+                self._operations.setdefault(op_code, array('Q')).append(number)
+        return self._operations.get(code, array('Q'))
+
+    def sorted_index(self, field: str) -> SortedIndex:
+
+        index = self._sorted.get(field)
+        if index is None:
+            index = self._sorted[field] = SortedIndex(self._values(FIELDS[field][1]), self.first)
+        return index
+
+class OperationCondition:
+
+    # op=NAME[,NAME...]: entries whose calculation type is one of the named operations
+
+    def __init__(self, names: list) -> None:
+
+        self.classes = [CalculationFactory.calculation_class(name) for name in names]
+        self.codes = frozenset()
+
+    def count(self, index: HistoryIndex) -> int:
+
+        # Also looks up the history's op codes for the named operations, which positions and matches then use
+        codes = index.history._codes
+        self.codes = frozenset(codes[calculation_class] for calculation_class in self.classes if calculation_class in codes)
+        return sum(len(index.operation_positions(code)) for code in self.codes)
+
+    def _numbers(self, index: HistoryIndex, limit: int = None) -> list:
+
+        # The numbers of the last limit matching entries in memory (all of them without a limit), one array per op code
+        numbers = []
+        for code in self.codes:
+            entries = index.operation_positions(code)
+            start = bisect_left(entries, index.first)
+            numbers.append(entries[start if limit is None else max(start, len(entries) - limit):])
+        return numbers
+
+    def positions(self, index: HistoryIndex) -> list:
+
+        # In history order
+        numbers = self._numbers(index)
+        return index.resident(numbers[0] if len(numbers) == 1 else sorted(itertools.chain(*numbers)))
+
+    def total(self, index: HistoryIndex) -> int:
+
+        return sum(map(len, self._numbers(index)))
+
+    def last(self, index: HistoryIndex, limit: int) -> list:
+
+        # Positions of the last limit matching entries in memory, in history order
+        return index.resident(sorted(itertools.chain(*self._numbers(index, limit)))[-limit:])
+
+    def check(self, index: HistoryIndex):
+
+        # Test of one position in memory, against the op code column
+        codes, op_codes = self.codes, index.history.op_codes
+        return lambda position: op_codes[position] in codes
+
+    def matches(self, index: HistoryIndex, record: tuple) -> bool:
+
+        return record[0] in self.codes
+
+class RangeCondition:
+
+    # FIELD>VALUE, FIELD>=VALUE, FIELD<VALUE, FIELD<=VALUE or FIELD=VALUE on a numeric field
+
+    def __init__(self, field: str, low: float = None, high: float = None, low_inclusive: bool = True, high_inclusive: bool = True) -> None:
+
+        self.field = field
+        self.low = low
+        self.high = high
+        self.low_inclusive = low_inclusive
+        self.high_inclusive = high_inclusive
+
+    def _bounds(self, index: HistoryIndex) -> tuple:
+
+        return index.sorted_index(self.field).bounds(self.low, self.high, self.low_inclusive, self.high_inclusive)
+
+    def count(self, index: HistoryIndex) -> int:
+
+        start, stop = self._bounds(index)
+        return stop - start
+
+    def _resident(self, index: HistoryIndex) -> list:
+
+        # Positions of the matching entries in memory, in order of value
+        start, stop = self._bounds(index)
+        return index.resident(index.sorted_index(self.field).positions[start:stop])
+
+    def positions(self, index: HistoryIndex) -> list:
+
+        # In history order
+        return sorted(self._resident(index))
+
+    def total(self, index: HistoryIndex) -> int:
+
+        return len(self._resident(index)) if index.stale else self.count(index)
+
+    def last(self, index: HistoryIndex, limit: int) -> list:
+
+        # Positions of the last limit matching entries in memory, in history order. The newest entries are checked first, for as
+        # many steps as there are matches, so a broad condition fills the page quickly; a narrow one then takes the newest matches.
+        history = index.history
+        steps = range(len(history) - 1, index.spilled - 1, -1)
+        budget = self.count(index)
+        found = list(itertools.islice(filter(self.check(index), itertools.islice(steps, budget)), limit))
+        if len(found) < limit and budget < len(steps):
+            found = heapq.nlargest(limit, self._resident(index))
+        return found[::-1]
+
+    def check(self, index: HistoryIndex):
+
+        # Test of one position in memory, against the field's column. NaN fails every comparison, so it never matches.
+        column = getattr(index.history, FIELDS[self.field][1])
+        low = -math.inf if self.low is None else self.low
+        high = math.inf if self.high is None else self.high
+        above = operator.ge if self.low_inclusive else operator.gt
+        below = operator.le if self.high_inclusive else operator.lt
+        return lambda position: above(column[position], low) and below(column[position], high)
+
+    def matches(self, index: HistoryIndex, record: tuple) -> bool:
+
+        value = record[FIELDS[self.field][0]]
+        if self.low is not None and not (value >= self.low if self.low_inclusive else value > self.low):
+            return False
+        if self.high is not None and not (value <= self.high if self.high_inclusive else value < self.high):
+            return False
+        return value == value
+
+_COMPARISON = re.compile(r'(?P<field>result|a|b)(?P<operator>>=|<=|>|<|=)(?P<value>.+)')
+_DURATION = re.compile(r'(?P<amount>\d+(?:\.\d+)?)(?P<unit>[smhd])')
+
+def parse_query(words: list, now: float = None) -> list:
+
+    # Turn the words after 'history where' into a list of conditions, e.g. ['op=divide', 'result>100', 'since', '10m']
+    if not words:
+        raise ValueError("Invalid query: add at least one condition, e.g. 'history where op=divide result>100 since 10m'.")
+
+    conditions = []
+    words = iter(words)
+    for word in words:
+        if word.startswith('op='):
+            conditions.append(OperationCondition(word[len('op='):].split(',')))
+        elif word == 'since':
+            duration = next(words, '')
+            match = _DURATION.fullmatch(duration)
+            if match is None:
+                raise ValueError(f"Invalid duration: '{duration}'. Use a number followed by s, m, h or d, e.g. 'since 10m'.")
+            seconds = float(match['amount']) * DURATIONS[match['unit']]
+            conditions.append(RangeCondition('timestamp', low=(time.time() if now is None else now) - seconds))
+        else:
+            match = _COMPARISON.fullmatch(word)
+            if match is None:
+                raise ValueError(f"Invalid condition: '{word}'. Use op=NAME, FIELD>VALUE (FIELD is result, a or b) or since DURATION.")
+            try:
+                value = float(match['value'])
+            except ValueError:
+                value = math.nan
+            if math.isnan(value):
+                raise ValueError(f"Invalid number in condition: '{word}'.")
+            operator = match['operator']
+            if operator == '=':
+                conditions.append(RangeCondition(match['field'], value, value))
+            elif operator.startswith('>'):
+                conditions.append(RangeCondition(match['field'], low=value, low_inclusive=operator == '>='))
+            else:
+                conditions.append(RangeCondition(match['field'], high=value, high_inclusive=operator == '<='))
+    return conditions
+
+def query_page(index: HistoryIndex, conditions: list, limit: int = None) -> tuple:
+
+    # (number of entries that meet every condition, positions of the last limit of them in history order, or all without a limit)
+    index.update()
+    conditions = sorted(conditions, key=lambda condition: condition.count(index))
+    first, rest = conditions[0], conditions[1:]
+    spilled = [
+        position for position, record in index.spilled_records()
+        if all(condition.matches(index, record) for condition in conditions)
+    ]
+
+    if not rest:
+        count = first.total(index)
+        positions = first.positions(index) if limit is None else first.last(index, limit)
+    else:
+        # Only the candidates of the most selective condition are checked, against the values the other conditions test
+        checks = [condition.check(index) for condition in rest]
+        check = checks[0] if len(checks) == 1 else lambda position: all(check(position) for check in checks)
+        if isinstance(first, OperationCondition):
+            positions = list(filter(check, first.positions(index)))
+            count = len(positions)
+        else:
+            matches = list(filter(check, first._resident(index)))
+            count = len(matches)
+            positions = sorted(matches if limit is None else heapq.nlargest(limit, matches))
+
+    count += len(spilled)
+    if limit is not None:
+        positions = positions[-limit:]
+        spilled = spilled[len(spilled) - max(0, limit - len(positions)):]
+    return count, spilled + positions
+
+def run_query(index: HistoryIndex, conditions: list) -> list:
+
+    # Positions of every entry that meets every condition, in history order
+    return query_page(index, conditions)[1]
+
+def top(index: HistoryIndex, count: int, field: str = 'result') -> list:
+
+    # Positions of the count entries with the largest value of field, largest first (the most recent first among equal values)
+    if field not in ('result', 'a', 'b'):
+        raise ValueError(f"Invalid field: '{field}'. Use result, a or b.")
+    index.update()
+    sorted_index = index.sorted_index(field)
+    start, stop = sorted_index.bounds()
+    largest = []
+    for i in reversed(range(start, stop)):
+        if len(largest) >= count:
+            break
+        if sorted_index.positions[i] >= index.first:
+            largest.append((sorted_index.keys[i], sorted_index.positions[i] - index.evicted))
+    if index.spilled:
+        column = FIELDS[field][0]
+        spilled = ((record[column], position) for position, record in index.spilled_records() if record[column] == record[column])
+        largest = heapq.nlargest(count, itertools.chain(largest, spilled))
+    return [position for _, position in largest]
@@ -0,0 +1,327 @@
+import math
+import os
+import sys
+
+from collections import deque
+from fractions import Fraction
+from typing import Iterable, Iterator, TextIO
+
+'''
+N-ary reductions over a stream of numbers: sum, product, mean, and scan (the running sum after each number).
+Numbers are whitespace-separated, any number per line, and are consumed as they are read, so memory use does not depend on the stream length.
+
+Sums are exact until the final rounding: ExactSum keeps the running total as a short list of non-overlapping floats (Shewchuk partials,
+the representation behind math.fsum), so adding a million numbers gives the correctly rounded sum of all of them, with no accumulated error.
+Because the partials are exact, sums of separately reduced chunks combine to exactly the same result in any grouping.
+Products keep a separate binary exponent, so they cannot overflow or underflow part-way through, and chunks are always combined in input order.
+
+A file (rather than a stream) is split into the same byte-range shards as the parallel batch mode, and reduced shard by shard,
+in this process or by several worker processes. The shard boundaries depend only on the chunk size, and shard results are combined
+in file order, so the result does not depend on the number of workers: products, which are rounded as they go, included.
+'''
+
+REDUCTIONS = ('sum', 'product', 'mean', 'scan')
+
+# Bytes of input per shard when reducing a file
+CHUNK_SIZE = 16 << 20
+
+# The part of an exact sum beyond the float range is kept as a whole number of these
+_OVERFLOW_UNIT = 1 << 1023
+
+class ExactSum:
+
+    '''
+    Exact running sum. Numbers are buffered, and every BUFFER_SIZE numbers the buffer is folded into the partials:
+    math.fsum gives the correctly rounded total, and fsum of what is left after subtracting it gives the next partial, until nothing is left.
+    value() is the correctly rounded sum of everything added. Infinities and NaN are summed separately, following IEEE rules.
+    A sum of finite numbers beyond the float range is carried in _overflow as a whole number of _OVERFLOW_UNITs, so it stays exact
+    (it may come back into range), and value() gives the infinity of its sign while it is out of range.
+    '''
+
+    __slots__ = ('partials', 'count', '_buffer', '_special', '_overflow')
+
+    BUFFER_SIZE = 4096
+
+    def __init__(self) -> None:
+
+        self.partials = []
+        self.count = 0
+        self._buffer = []
+        self._special = None
+        self._overflow = 0
+
+    def add(self, value: float) -> None:
+
+        self._buffer.append(value)
+        self.count += 1
+        if len(self._buffer) >= self.BUFFER_SIZE:
+            self._fold()
+
+    def extend(self, values: Iterable[float]) -> None:
+
+        buffer = self._buffer
+        before = len(buffer)
+        buffer.extend(values)
+        self.count += len(buffer) - before
+        if len(buffer) >= self.BUFFER_SIZE:
+            self._fold()
+
+    def merge(self, other: 'ExactSum') -> None:
+
+        # Add everything that was added to other
+        other._fold()
+        self._buffer.extend(other.partials)
+        self.count += other.count
+        self._overflow += other._overflow
+        if other._special is not None:
+            self._add_special(other._special)
+        self._fold()
+
+    def _fold(self) -> None:
+
+        values = self.partials + self._buffer
+        self._buffer = []
+        try:
+            total = math.fsum(values)
+        except (ValueError, OverflowError): # inf + -inf, or a running total that left the float range part-way through
+            total = math.nan
+        if not math.isfinite(total):
+            finite = []
+            for value in values:
+                if math.isfinite(value):
+                    finite.append(value)
+                else:
+                    self._add_special(value)
+            values = finite
+            try:
+                total = math.fsum(values)
+            except OverflowError:
+                self._carry(values)
+                return
+
+        partials = []
+        while total:
+            partials.append(total)
+            values.append(-total)
+            total = math.fsum(values)
+        self.partials = partials
+
+    def _carry(self, values: list) -> None:
+
+        # fsum gives up on finite numbers whose running total leaves the float range part-way through, even when the total comes
+        # back into range. Add them exactly as fractions instead: whole multiples of _OVERFLOW_UNIT go to _overflow, and the rest,
+        # which is in range, is split into partials greedily.
+        overflow, rest = divmod(sum(map(Fraction, values)), _OVERFLOW_UNIT)
+        self._overflow += overflow
+        partials = []
+        while rest:
+            partial = float(rest)
+            partials.append(partial)
+            rest -= Fraction(partial)
+        self.partials = partials
+
+    def _add_special(self, value: float) -> None:
+
+        self._special = value if self._special is None else self._special + value
+
+    def value(self) -> float:
+
+        self._fold()
+        if self._special is not None:
+            return self._special
+        if not self._overflow:
+            return math.fsum(self.partials)
+        exact = self._overflow * _OVERFLOW_UNIT + sum(map(Fraction, self.partials))
+        try:
+            return float(exact)
+        except OverflowError:
+            return math.inf if exact > 0 else -math.inf
+
+class ExactProduct:
+
+    '''
+    Running product kept as mantissa * 2 ** exponent, with the mantissa renormalized into [0.5, 1) after every step,
+    so a long product passes through values far beyond the float range and only the final value() can overflow (to inf) or underflow (to 0).
+    '''
+
+    __slots__ = ('mantissa', 'exponent', 'count')
+
+    def __init__(self) -> None:
+
+        self.mantissa = 1.0
+        self.exponent = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+
+        mantissa, exponent = math.frexp(value)
+        mantissa, shift = math.frexp(self.mantissa * mantissa)
+        self.mantissa = mantissa
+        self.exponent += exponent + shift
+        self.count += 1
+
+    def extend(self, values: Iterable[float]) -> None:
+
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: 'ExactProduct') -> None:
+
+        mantissa, shift = math.frexp(self.mantissa * other.mantissa)
+        self.mantissa = mantissa
+        self.exponent += other.exponent + shift
+        self.count += other.count
+
+    def value(self) -> float:
+
+        try:
+            return math.ldexp(self.mantissa, self.exponent)
+        except OverflowError:
+            return math.copysign(math.inf, self.mantissa)
+
+def accumulator_for(operation: str):
+
+    # A new accumulator for a reduction: sum and mean use ExactSum, product uses ExactProduct
+    if operation in ('sum', 'mean'):
+        return ExactSum()
+    if operation == 'product':
+        return ExactProduct()
+    raise ValueError(f"Unsupported reduction: '{operation}'. Available reductions: {', '.join(REDUCTIONS)}")
+
+def result_of(operation: str, accumulator) -> float:
+
+    if operation == 'mean':
+        if not accumulator.count:
+            raise ValueError('Cannot take the mean of no numbers.')
+        return accumulator.value() / accumulator.count
+    return accumulator.value()
+
+def parse_numbers(line: str, line_number: int) -> list:
+
+    try:
+        return [float(token) for token in line.split()]
+    except ValueError:
+        raise invalid_number(line, line_number) from None
+
+def invalid_number(line: str, line_number: int) -> ValueError:
+
+    # The error for the first token of line that is not a number
+    for token in line.split():
+        try:
+            float(token)
+        except ValueError:
+            return ValueError(f"line {line_number}: Invalid number: '{token}'")
+    return ValueError(f'line {line_number}: Invalid number') # pragma: no cover - only called for lines with a bad token
+
+def reduce_lines(operation: str, lines: Iterable[str]):
+
+    # Feed every number in lines into a new accumulator for operation, and return the accumulator
+    accumulator = accumulator_for(operation)
+    for line_number, line in enumerate(lines, start=1):
+        accumulator.extend(parse_numbers(line, line_number))
+    return accumulator
+
+def reduce_numbers(operation: str, lines: Iterable[str]) -> float:
+
+    # Reduce a stream of lines of numbers (e.g. an open file) to one result
+    return result_of(operation, reduce_lines(operation, lines))
+
+def scan_numbers(lines: Iterable[str]) -> Iterator[float]:
+
+    # Yield the running sum after each number. Each one is the correctly rounded sum of all the numbers up to that point.
+    total = ExactSum()
+    for line_number, line in enumerate(lines, start=1):
+        for value in parse_numbers(line, line_number):
+            total.add(value)
+            yield total.value()
+
+def reduce_shard(operation: str, path: str, start: int, end: int) -> tuple:
+
+    # Reduce the numbers in bytes [start, end) of the file. Returns (accumulator, number of lines, None),
+    # or (None, number of lines, (line number within the shard, line)) for the first line with a bad number.
+    with open(path, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode()
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n') # Universal newlines, as in evaluate_shard
+    if lines[-1] == '':
+        lines.pop()
+    accumulator = accumulator_for(operation)
+    for line_number, line in enumerate(lines, start=1):
+        try:
+            accumulator.extend([float(token) for token in line.split()])
+        except ValueError:
+            return None, len(lines), (line_number, line)
+    return accumulator, len(lines), None
+
+def reduce_shards(operation: str, path: str, shards: list, workers: int) -> Iterator[tuple]:
+
+    # The reduce_shard results of the shards, in file order: reduced in this process for one worker, otherwise by a process pool.
+    # The REPL only reduces in-process, so the process pool is imported here rather than with the module.
+    if workers == 1:
+        for start, end in shards:
+            yield reduce_shard(operation, path, start, end)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        # As in evaluate_file, only a few shards are in flight per worker
+        pending = deque()
+        remaining = iter(shards)
+        for start, end in remaining:
+            pending.append(executor.submit(reduce_shard, operation, path, start, end))
+            if len(pending) >= 2 * workers:
+                break
+
+        while pending:
+            result = pending.popleft().result()
+            shard = next(remaining, None)
+            if shard is not None:
+                pending.append(executor.submit(reduce_shard, operation, path, *shard))
+            yield result
+
+def reduce_file(operation: str, path: str, workers: int = None, chunk_size: int = CHUNK_SIZE) -> float:
+
+    # Reduce a file shard by shard with workers processes (os.cpu_count() by default, one reduces in this process).
+    # Shards are combined in file order, so every worker count gives the same result.
+    from app.parallel import shard_file
+
+    shards = shard_file(path, chunk_size)
+    workers = workers or os.cpu_count() or 1
+    total = accumulator_for(operation)
+    line_offset = 0
+    for accumulator, line_count, error in reduce_shards(operation, path, shards, workers):
+        if error is not None:
+            line_number, line = error
+            raise invalid_number(line, line_offset + line_number)
+        total.merge(accumulator)
+        line_offset += line_count
+    return result_of(operation, total)
+
+def reduce_main(operation: str, path: str, workers: int = 1, chunk_size: int = CHUNK_SIZE, out: TextIO = None) -> int:
+
+    # Entry point for main.py --reduce OPERATION FILE|-. Prints the result (for scan, one running sum per line).
+    # Exit codes: 0 on success, 1 for bad input, 2 if the input cannot be opened.
+    out = out or sys.stdout
+    if operation not in REDUCTIONS:
+        print(f"Unsupported reduction: '{operation}'. Available reductions: {', '.join(REDUCTIONS)}", file=sys.stderr)
+        return 2
+    try:
+        if path != '-' and operation != 'scan':
+            result = reduce_file(operation, path, workers, chunk_size)
+        else:
+            with (open(path) if path != '-' else open(sys.stdin.fileno(), closefd=False)) as source:
+                if operation == 'scan':
+                    out.writelines(f'{value}\n' for value in scan_numbers(source))
+                    return 0
+                result = reduce_numbers(operation, source)
+    except OSError as e:
+        print(f'Cannot open reduction input: {e}', file=sys.stderr)
+        return 2
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    print(result, file=out)
+    return 0
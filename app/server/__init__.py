@@ -0,0 +1,135 @@
+import asyncio
+
+from app.batch import evaluate_calculation
+from app.history import History
+
+'''
+asyncio TCP front end for the calculator.
+Clients send the same <operation> <num1> <num2> lines that Calculator.run accepts and get one line back per request:
+the calculation (e.g. "AddCalculation: 1.0 Add 2.0 = 3.0") or "Error: <message>". Blank lines are ignored.
+
+Requests can be pipelined: a client may send many lines without waiting, and the replies come back in the same order.
+Every connection has its own History, while the CalculationFactory registry (a class attribute) is shared by all of them.
+'''
+
+class CalculatorProtocol(asyncio.Protocol):
+
+    '''
+    One client connection. All complete lines in a chunk of received data are answered with a single write.
+    If the client stops reading its replies and the write buffer goes over the high-water mark, reading from that client is paused
+    until the buffer drains, so one slow client cannot make the server buffer without limit.
+    '''
+
+    def __init__(self, server: 'CalculatorServer') -> None:
+
+        self.server = server
+        self.history = History()
+        self.transport = None
+        self._buffer = b''
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+
+        self.transport = transport
+        transport.set_write_buffer_limits(high=self.server.write_buffer_limit)
+        self.server.connections.add(self)
+
+    def data_received(self, data: bytes) -> None:
+
+        *lines, self._buffer = (self._buffer + data).split(b'\n')
+        if len(self._buffer) > self.server.line_limit:
+            self.transport.write(b'Error: Line too long.\n')
+            self.transport.close()
+            return
+
+        replies = [self.reply(line) for line in lines if line.strip()]
+        if replies:
+            self.transport.write(''.join(replies).encode())
+
+    def eof_received(self) -> bool:
+
+        # Answer a last line that had no newline, then let the transport close
+        if self._buffer.strip():
+            self.transport.write(self.reply(self._buffer).encode())
+        self._buffer = b''
+        return False
+
+    def connection_lost(self, exc: Exception) -> None:
+
+        self.server.connections.discard(self)
+
+    def pause_writing(self) -> None:
+
+        # The client is not reading its replies fast enough, so stop reading its requests
+        self.transport.pause_reading()
+
+    def resume_writing(self) -> None:
+
+        self.transport.resume_reading()
+
+    def reply(self, line: bytes) -> str:
+
+        # Evaluate one request line and return the reply line, saving successful calculations to this connection's history
+        calc, error = evaluate_calculation(line.decode(errors='replace'))
+        if calc is None:
+            return f'Error: {error}\n'
+        self.history.append(calc, calc.result)
+        return f'{calc}\n'
+
+class CalculatorServer:
+
+    '''
+    Line-protocol calculator server. Usage:
+
+        server = CalculatorServer('127.0.0.1', 8765)
+        await server.start()
+        await server.serve_forever()
+    '''
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, write_buffer_limit: int = 64 * 1024, line_limit: int = 64 * 1024, backlog: int = 4096) -> None:
+
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.write_buffer_limit = write_buffer_limit
+        self.line_limit = line_limit
+        self.connections = set()
+        self._server = None
+
+    async def start(self) -> None:
+
+        # Start listening. With port 0 the OS picks a free port, which is then stored in self.port.
+        # The large accept backlog stops bursts of thousands of new connections from being dropped and retried.
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: CalculatorProtocol(self), self.host, self.port, backlog=self.backlog)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+
+        await self._server.serve_forever()
+
+    async def close(self) -> None:
+
+        # Stop accepting connections and close the open ones
+        self._server.close()
+        for connection in list(self.connections):
+            connection.transport.close()
+        await self._server.wait_closed()
+
+def serve_main(host: str, port: int) -> int:
+
+    # Entry point for main.py --serve
+
+    async def serve():
+        server = CalculatorServer(host, port)
+        await server.start()
+        print(f'Calculator server listening on {server.host}:{server.port}', flush=True)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print('\nKeyboard interrupt detected. Stopping server.')
+    return 0
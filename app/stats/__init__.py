@@ -0,0 +1,245 @@
+import json
+import time
+
+'''
+Per-stage timing for the calculator REPL. One iteration of the REPL is split into stages:
+
+    input    : reading the line
+    parse    : split and float parsing
+    create   : CalculationFactory.create_calculation
+    execute  : computing the result
+    format   : formatting the result line
+    output   : printing the result line
+    history  : appending to the history
+
+Each stage of each successful calculation is recorded in a latency histogram per (stage, operation), and errors are counted per stage.
+The REPL marks the end of each stage on a timer. With instrumentation off it uses NULL_TIMER, whose methods do nothing,
+so the cost of the hooks is one empty method call per stage.
+'''
+
+STAGES = ('input', 'parse', 'create', 'execute', 'format', 'output', 'history')
+
+class LatencyHistogram:
+
+    '''
+    HDR-style histogram of nanosecond latencies with log-linear buckets: values below 64 ns get a bucket each,
+    and every power of two above that is split into 32 buckets, so any recorded value is known to within about 3%
+    in constant memory (a few hundred counters for the whole range up to hours).
+    '''
+
+    SUB_BUCKETS = 32
+
+    def __init__(self) -> None:
+
+        self.counts = []
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @classmethod
+    def bucket_for(cls, value: int) -> int:
+
+        if value < 2 * cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - 6
+        return shift * cls.SUB_BUCKETS + (value >> shift)
+
+    @classmethod
+    def bucket_value(cls, bucket: int) -> int:
+
+        # Smallest value that falls in bucket
+        if bucket < 2 * cls.SUB_BUCKETS:
+            return bucket
+        shift = bucket // cls.SUB_BUCKETS - 1
+        return (bucket - shift * cls.SUB_BUCKETS) << shift
+
+    def record(self, value: int) -> None:
+
+        value = max(0, value)
+        bucket = self.bucket_for(value)
+        counts = self.counts
+        if bucket >= len(counts):
+            counts.extend([0] * (bucket + 1 - len(counts)))
+        counts[bucket] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction: float) -> int:
+
+        # Value at the given fraction (0-1) of the recorded values, as the top of its bucket (never above the largest value recorded)
+        if not self.count:
+            return 0
+        rank = max(1, round(fraction * self.count))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.max, self.bucket_value(bucket + 1) - 1)
+        return self.max # pragma: no cover - seen always reaches count
+
+    @property
+    def mean(self) -> float:
+
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> dict:
+
+        return {
+            'count': self.count,
+            'mean_ns': self.mean,
+            'min_ns': self.min or 0,
+            'p50_ns': self.percentile(0.50),
+            'p90_ns': self.percentile(0.90),
+            'p99_ns': self.percentile(0.99),
+            'max_ns': self.max,
+        }
+
+class StageTimer:
+
+    # Times the stages of one REPL iteration. The stage times are only recorded when the iteration finishes as a calculation.
+
+    __slots__ = ('_stats', '_clock', '_last', '_stages')
+
+    def __init__(self, stats: 'Instrumentation') -> None:
+
+        self._stats = stats
+        self._clock = time.perf_counter_ns
+        self._stages = []
+        self._last = self._clock()
+
+    def mark(self, stage: str) -> None:
+
+        # End the current stage
+        now = self._clock()
+        self._stages.append((stage, now - self._last))
+        self._last = now
+
+    def finish(self, operation: str) -> None:
+
+        for stage, elapsed in self._stages:
+            self._stats.record(stage, operation, elapsed)
+        self._stats.count('calculations', operation)
+
+    def fail(self, stage: str) -> None:
+
+        self._stats.count('errors', stage)
+
+class _NullTimer:
+
+    # Stands in for StageTimer when instrumentation is off
+
+    __slots__ = ()
+
+    def mark(self, stage: str) -> None:
+
+        pass
+
+    def finish(self, operation: str) -> None:
+
+        pass
+
+    def fail(self, stage: str) -> None:
+
+        pass
+
+NULL_TIMER = _NullTimer()
+
+class Instrumentation:
+
+    '''
+    Latency histograms per (stage, operation) and counters per (name, label), e.g. ('calculations', 'add') or ('errors', 'parse').
+    Usage, once per REPL iteration:
+
+        timer = stats.timer()
+        ... read input ...
+        timer.mark('input')
+        ...
+        timer.finish('add')
+    '''
+
+    def __init__(self) -> None:
+
+        self.histograms = {}
+        self.counters = {}
+
+    def timer(self) -> StageTimer:
+
+        return StageTimer(self)
+
+    def record(self, stage: str, operation: str, elapsed_ns: int) -> None:
+
+        histogram = self.histograms.get((stage, operation))
+        if histogram is None:
+            histogram = self.histograms[(stage, operation)] = LatencyHistogram()
+        histogram.record(elapsed_ns)
+
+    def count(self, name: str, label: str) -> None:
+
+        self.counters[(name, label)] = self.counters.get((name, label), 0) + 1
+
+    def reset(self) -> None:
+
+        self.histograms.clear()
+        self.counters.clear()
+
+    def _sorted_histograms(self) -> list:
+
+        # In stage order, then by operation
+        return sorted(self.histograms.items(), key=lambda item: (STAGES.index(item[0][0]) if item[0][0] in STAGES else len(STAGES), item[0]))
+
+    def rows(self) -> list:
+
+        # One row per (stage, operation): stage, operation, count, mean, p50, p99 and max in microseconds
+        return [
+            [stage, operation, f'{histogram.count}'] + [f'{value / 1000:,.2f}' for value in (histogram.mean, histogram.percentile(0.50), histogram.percentile(0.99), histogram.max)]
+            for (stage, operation), histogram in self._sorted_histograms()
+        ]
+
+    def to_json(self) -> str:
+
+        return json.dumps({
+            'stages': [
+                {'stage': stage, 'operation': operation, **histogram.summary()}
+                for (stage, operation), histogram in self._sorted_histograms()
+            ],
+            'counters': [
+                {'name': name, 'label': label, 'value': value}
+                for (name, label), value in sorted(self.counters.items())
+            ],
+        }, indent=2)
+
+    def to_prometheus(self) -> str:
+
+        # Prometheus text exposition format: the stage latencies as summaries in seconds, and the counters as counters
+        lines = [
+            '# HELP calculator_stage_latency_seconds Time spent in each stage of a REPL calculation.',
+            '# TYPE calculator_stage_latency_seconds summary',
+        ]
+        for (stage, operation), histogram in self._sorted_histograms():
+            labels = f'stage="{stage}",operation="{operation}"'
+            for quantile in (0.5, 0.9, 0.99):
+                lines.append(f'calculator_stage_latency_seconds{{{labels},quantile="{quantile}"}} {histogram.percentile(quantile) / 1e9:.9f}')
+            lines.append(f'calculator_stage_latency_seconds_sum{{{labels}}} {histogram.total / 1e9:.9f}')
+            lines.append(f'calculator_stage_latency_seconds_count{{{labels}}} {histogram.count}')
+
+        label_names = {'calculations': 'operation', 'errors': 'stage'}
+        for name in sorted({name for name, _ in self.counters}):
+            lines.append(f'# TYPE calculator_{name}_total counter')
+            for (counter, label), value in sorted(self.counters.items()):
+                if counter == name:
+                    lines.append(f'calculator_{name}_total{{{label_names.get(name, "label")}="{label}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+def format_table(headers: list, rows: list) -> str:
+
+    # Format rows as a plain-text table with one column per header
+    cells = [[str(header) for header in headers]] + [[str(cell) for cell in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in cells]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
@@ -0,0 +1,79 @@
+from app.calculation import CalculationFactory
+
+'''
+Parser for '<operation> <num1> <num2>' input lines, shared by the REPL and batch mode.
+
+parse_line returns (operation, num1, num2) for a good line, or an error code for a bad one, and never raises.
+A good line costs what split() and the backend's parse cost, with no other work per token. Raising and catching a ValueError
+for a malformed number is far slower than parsing a good one, and feeds with a lot of junk lines repeat the same junk (header rows,
+placeholders such as N/A), so the tokens the backend has rejected are remembered and a line holding one is rejected without parsing.
+The set of rejected tokens is bounded (cleared when full) and starts again when the numeric backend changes.
+'''
+
+# Error codes returned by parse_line
+WRONG_FIELD_COUNT = 1
+INVALID_NUMBER = 2
+
+# Largest number of rejected tokens remembered before they are forgotten
+MEMO_SIZE = 1 << 14
+
+class LineParser:
+
+    '''
+    Parses '<operation> <num1> <num2>' lines into (operation, num1, num2) tuples, with the numbers parsed by the current
+    numeric backend. Returns WRONG_FIELD_COUNT or INVALID_NUMBER instead of raising for a bad line.
+    '''
+
+    def __init__(self, memo_size: int = MEMO_SIZE) -> None:
+
+        self.memo_size = memo_size
+        # (backend, its parse function, the tokens it has rejected), replaced as a whole so that a thread never sees a mix of two
+        self._state = (None, None, set())
+
+    def parse(self, line: str):
+
+        parts = line.split()
+        if len(parts) != 3:
+            return WRONG_FIELD_COUNT
+
+        backend, parse, invalid = self._state
+        if CalculationFactory._backend is not backend:
+            backend, parse, invalid = self._switch_backend()
+        operation, text_1, text_2 = parts
+        if invalid and (text_1 in invalid or text_2 in invalid):
+            return INVALID_NUMBER
+        try:
+            return operation, parse(text_1), parse(text_2)
+        except (ValueError, ArithmeticError):
+            return self._reject(parse, invalid, text_1, text_2)
+
+    def _switch_backend(self) -> tuple:
+
+        # Tokens the previous backend rejected may be numbers now
+        backend = CalculationFactory.backend()
+        state = self._state = (backend, backend.parse, set())
+        return state
+
+    def _reject(self, parse, invalid: set, *tokens: str) -> int:
+
+        # Remember which of the tokens of a bad line are not numbers
+        for token in tokens:
+            try:
+                parse(token)
+            except (ValueError, ArithmeticError):
+                if len(invalid) >= self.memo_size:
+                    invalid.clear()
+                invalid.add(token)
+        return INVALID_NUMBER
+
+    def clear(self) -> None:
+
+        self._state = (None, None, set())
+
+# Shared by the REPL and batch mode
+_parser = LineParser()
+
+def parse_line(line: str):
+
+    # (operation, num1, num2) for a good line, WRONG_FIELD_COUNT or INVALID_NUMBER for a bad one
+    return _parser.parse(line)
@@ -0,0 +1,251 @@
+import re
+
+from typing import Iterator
+
+from app.calculation import CalculationFactory
+from app.operation import numeric_backend
+
+'''
+A workbook of named cells for what-if models in the REPL:
+
+    x = 5
+    y = add x 2
+    z = multiply y x
+
+A cell is a number, or a calculation of two operands that are numbers or the names of other cells. The references form a DAG:
+each cell keeps its value, and the cells that use it are kept as its dependents. Changing a cell recomputes that cell and its
+dependents, the cells downstream of it, in topological order (every cell after the cells it uses), and no others.
+A change that would make a cell depend on itself is refused and leaves the workbook as it was.
+Numbers are parsed by the numeric backend in use; set_backend() switches backends and parses them again, so cells never mix types.
+
+The graph is walked iteratively, so a chain of any length is fine.
+'''
+
+NAME = re.compile(r'[A-Za-z_]\w*')
+INVALID_CELL = 'Invalid cell. Use NAME = <operation> <operand1> <operand2> or NAME = <number>, where operands are numbers or cell names.'
+
+class Cell:
+
+    '''
+    One cell: a constant (operation None, operands (value,)), or operation applied to two operands, each a number or a cell name.
+    sources holds the text each operand was entered as, so numbers can be parsed again by another backend.
+    value is None, with error set to the reason, when the value cannot be computed.
+    '''
+
+    __slots__ = ('name', 'operation', 'operands', 'sources', 'calculation_class', 'value', 'error')
+
+    def __init__(self, name: str, operation: str, operands: tuple, calculation_class: type = None, sources: tuple = None) -> None:
+
+        self.name = name
+        self.operation = operation
+        self.operands = operands
+        self.sources = tuple(map(str, operands)) if sources is None else sources
+        self.calculation_class = calculation_class
+        self.value = None
+        self.error = None
+
+    @property
+    def references(self) -> tuple:
+
+        return tuple(operand for operand in self.operands if operand.__class__ is str)
+
+    def formula(self) -> str:
+
+        if self.operation is None:
+            return str(self.operands[0])
+        return ' '.join([self.operation, *map(str, self.operands)])
+
+    def __str__(self) -> str:
+
+        if self.operation is None:
+            return f'{self.name} = {self.value}'
+        if self.error is not None:
+            return f'{self.name} = {self.formula()}: {self.error}'
+        return f'{self.name} = {self.formula()} = {self.value}'
+
+class Workbook:
+
+    '''
+    Named cells with incremental recompute. set() defines or changes a cell and returns the cells it recomputed, in order.
+    '''
+
+    def __init__(self) -> None:
+
+        self._cells = {}
+
+        # Cell name -> the cells whose operands name it. A dict rather than a set, so cells are recomputed in a repeatable order.
+        self._dependents = {}
+
+    def __len__(self) -> int:
+
+        return len(self._cells)
+
+    def __contains__(self, name: str) -> bool:
+
+        return name in self._cells
+
+    def __getitem__(self, name: str) -> Cell:
+
+        cell = self._cells.get(name)
+        if cell is None:
+            raise KeyError(name)
+        return cell
+
+    def __iter__(self) -> Iterator[Cell]:
+
+        return iter(self._cells.values())
+
+    def value(self, name: str):
+
+        # The value of a cell. Raises ValueError if it has none.
+        cell = self[name]
+        if cell.error is not None:
+            raise ValueError(f"Cell '{name}' has no value: {cell.error}")
+        return cell.value
+
+    def set(self, name: str, formula: str) -> list:
+
+        # Define or change a cell from its formula text, e.g. 'add x 2' or '5'
+        if not NAME.fullmatch(name):
+            raise ValueError(f"Invalid cell name: '{name}'. Names start with a letter or _ and contain only letters, digits and _.")
+        tokens = formula.split()
+        if len(tokens) == 1:
+            value = self._operand(tokens[0])
+            if value.__class__ is str:
+                raise ValueError(INVALID_CELL)
+            return self._define(Cell(name, None, (value,), sources=(tokens[0],)))
+        if len(tokens) != 3:
+            raise ValueError(INVALID_CELL)
+
+        operation = tokens[0].lower()
+        calculation_class = CalculationFactory.calculation_class(operation)
+        operands = (self._operand(tokens[1]), self._operand(tokens[2]))
+        for reference in operands:
+            if reference.__class__ is str and reference not in self._cells:
+                raise ValueError(f"Unknown cell: '{reference}'.")
+        return self._define(Cell(name, operation, operands, calculation_class, (tokens[1], tokens[2])))
+
+    def set_backend(self, name: str) -> int:
+
+        # Switch every calculation to another numeric backend (see CalculationFactory.set_backend), parse the numbers in every cell
+        # again from the text they were entered as, and recompute every cell. Returns the number of cells recomputed.
+        # If the new backend cannot read one of the numbers, nothing is changed.
+        backend = numeric_backend(name)
+        operands = {}
+        for cell in self._cells.values():
+            parsed = []
+            for operand, source in zip(cell.operands, cell.sources):
+                if operand.__class__ is not str:
+                    try:
+                        operand = backend.parse(source)
+                    except (ValueError, ArithmeticError):
+                        raise ValueError(
+                            f"Cannot switch to the {backend.name} backend: it cannot read '{source}' in cell '{cell.name}'."
+                        ) from None
+                parsed.append(operand)
+            operands[cell.name] = tuple(parsed)
+
+        CalculationFactory.set_backend(name)
+        for cell in self._cells.values():
+            cell.operands = operands[cell.name]
+        return self.recompute_all()
+
+    def _operand(self, token: str):
+
+        # A number, parsed by the current backend, or else a cell name
+        try:
+            return CalculationFactory.backend().parse(token)
+        except (ValueError, ArithmeticError):
+            if NAME.fullmatch(token):
+                return token
+            raise ValueError(f"Invalid operand: '{token}'. Use a number or a cell name.") from None
+
+    def _define(self, cell: Cell) -> list:
+
+        name = cell.name
+        references = cell.references
+        if references and (name in references or not self._downstream_set(name).isdisjoint(references)):
+            raise ValueError(f"Cycle: cell '{name}' would depend on itself.")
+
+        old = self._cells.get(name)
+        if old is not None:
+            for reference in old.references:
+                self._dependents[reference].pop(name, None)
+        for reference in references:
+            self._dependents.setdefault(reference, {})[name] = None
+        self._cells[name] = cell
+
+        order = self._downstream(name)
+        for downstream in order:
+            self._evaluate(self._cells[downstream])
+        return order
+
+    def _downstream(self, name: str) -> list:
+
+        # name and every cell that depends on it, directly or not, in topological order: the reverse of the order
+        # in which an iterative depth-first search along the dependents finishes them
+        dependents = self._dependents
+        finished = []
+        visited = {name}
+        stack = [(name, iter(dependents.get(name, ())))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, iter(dependents.get(child, ()))))
+                    break
+            else:
+                stack.pop()
+                finished.append(node)
+        finished.reverse()
+        return finished
+
+    def _downstream_set(self, name: str) -> set:
+
+        # The cells that depend on name, directly or not (and name itself)
+        dependents = self._dependents
+        seen = {name}
+        stack = [name]
+        while stack:
+            for child in dependents.get(stack.pop(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return seen
+
+    def _evaluate(self, cell: Cell) -> None:
+
+        if cell.operation is None:
+            cell.value = cell.operands[0]
+            return
+
+        values = []
+        for operand in cell.operands:
+            if operand.__class__ is str:
+                source = self._cells[operand]
+                if source.error is not None:
+                    cell.value, cell.error = None, f"Cell '{operand}' has no value."
+                    return
+                operand = source.value
+            values.append(operand)
+
+        try:
+            cell.value, cell.error = cell.calculation_class(*values).result, None
+        except ZeroDivisionError:
+            cell.value, cell.error = None, 'Cannot divide by zero.'
+        except Exception as e:
+            cell.value, cell.error = None, f'An error occurred during calculation: {e}'
+
+    def recompute_all(self) -> int:
+
+        # Recompute every cell, in topological order (Kahn's algorithm). Returns the number of cells recomputed.
+        pending = {name: len(set(cell.references)) for name, cell in self._cells.items()}
+        ready = [name for name, count in pending.items() if count == 0]
+        for name in ready:
+            self._evaluate(self._cells[name])
+            for dependent in self._dependents.get(name, ()):
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    ready.append(dependent)
+        return len(ready)
@@ -1,8 +1,99 @@
-from app.calculator import Calculator
+import sys
+
+def parse_arguments(argv: list):
+
+    # Options for the non-interactive modes, and for the REPL:
+    #   python main.py --batch FILE|- [--workers N [--threads]] [--chunk-size BYTES]
+    #   python main.py --reduce sum|product|mean|scan FILE|- [--workers N] [--chunk-size BYTES]
+    #   python main.py --serve [--host HOST] [--port PORT]
+    #   python main.py --history FILE --output auto|terminal|buffered
+    #   python main.py --history-limit N|SIZE [--history-spill DIR]
+    #   --backend NAME chooses the number type for the REPL, batch and serve modes
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='main.py', description='Calculator. Without options, starts the interactive REPL.')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--batch', metavar='FILE', help="evaluate a file of calculations, or '-' for standard input")
+    mode.add_argument('--reduce', nargs=2, metavar=('OPERATION', 'FILE'), help="sum, product, mean or scan (running sum) of the numbers in a file, or '-' for standard input")
+    mode.add_argument('--serve', action='store_true', help='run the calculator as a TCP line-protocol server')
+    parser.add_argument('--workers', type=int, default=1, help='batch, reduce: number of worker processes (files only, default 1)')
+    parser.add_argument('--threads', action='store_true', help='batch: use worker threads instead of processes (for free-threaded Python)')
+    parser.add_argument('--chunk-size', type=int, default=16 << 20, help='batch, reduce: bytes of input per worker shard (default 16 MiB)')
+    parser.add_argument('--host', default='127.0.0.1', help='serve: address to listen on (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='serve: port to listen on (default 8765)')
+    parser.add_argument('--history', metavar='FILE', help='REPL: keep the calculation history in FILE, so it survives restarts')
+    parser.add_argument('--history-limit', metavar='N|SIZE',
+                        help='REPL: keep at most N calculations (or SIZE bytes of them, e.g. 64MB) of history in memory')
+    parser.add_argument('--history-spill', metavar='DIR',
+                        help='REPL, with --history-limit: move older calculations to compressed files in DIR instead of dropping them')
+    parser.add_argument('--output', choices=('auto', 'terminal', 'buffered'), default='auto',
+                        help='REPL: flush every line (terminal) or write in blocks (buffered); auto buffers only when input and output are both redirected')
+    parser.add_argument('--backend', default='float', help='numeric backend: float (default), int, fraction, decimal[:DIGITS] or fixed[:PLACES]')
+    args = parser.parse_args(argv)
+    if args.history_limit is not None and args.history is not None:
+        parser.error('--history-limit cannot be used with --history, which keeps the history in a file instead of memory')
+    if args.history_spill is not None and args.history_limit is None:
+        parser.error('--history-spill needs --history-limit')
+    return args
 
 # Start the REPL calculator
 if __name__ == '__main__':
 
-    # Create a Calculator object and start the calculator
-    calc = Calculator()
+    # python main.py add 3 4 prints just the result, importing as little as possible
+    if len(sys.argv) > 1 and not sys.argv[1].startswith('--'):
+        from app.cli import one_shot_main
+        sys.exit(one_shot_main(sys.argv[1:]))
+
+    history_path = None
+    history_limit = None
+    history_spill = None
+    output = 'auto'
+    if len(sys.argv) > 1 and sys.argv[1].startswith('--'):
+        args = parse_arguments(sys.argv[1:])
+        history_path = args.history
+        history_limit = args.history_limit
+        history_spill = args.history_spill
+        output = args.output
+
+        if args.backend != 'float':
+            from app.calculation import CalculationFactory
+            try:
+                CalculationFactory.set_backend(args.backend)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                sys.exit(2)
+
+        # python main.py --serve answers calculations from many TCP clients at once
+        if args.serve:
+            from app.server import serve_main
+            sys.exit(serve_main(args.host, args.port))
+
+        # python main.py --reduce OPERATION FILE|- reduces a whole stream of numbers to one result
+        if args.reduce is not None:
+            from app.reduction import reduce_main
+            sys.exit(reduce_main(*args.reduce, args.workers, args.chunk_size))
+
+        # python main.py --batch FILE|- evaluates a whole file (or standard input) without the REPL
+        if args.batch is not None:
+            if args.workers > 1 and args.batch != '-':
+                from app.parallel import parallel_main
+                sys.exit(parallel_main(args.batch, args.workers, args.chunk_size, args.threads))
+            from app.batch import batch_main
+            sys.exit(batch_main(args.batch))
+
+    from app.calculator import Calculator
+    from app.output import make_sink
+
+    # Create a Calculator object and start the calculator. A history file that cannot be opened or read, or a history limit
+    # that cannot be used, is reported like the other modes report bad input.
+    try:
+        # python main.py --history-limit N|SIZE keeps the memory used by the history flat however long the REPL runs
+        history = None
+        if history_limit is not None:
+            from app.history import BoundedHistory, parse_limit
+            history = BoundedHistory(*parse_limit(history_limit), spill_dir=history_spill)
+        calc = Calculator(history_path, make_sink(output), history)
+    except (ValueError, OSError) as e:
+        print(f'Cannot open the history: {e}', file=sys.stderr)
+        sys.exit(2)
     calc.run()
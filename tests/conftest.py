@@ -11,3 +11,9 @@ def setup_calculation_factory():
     CalculationFactory.register_calculation('divide')(DivideCalculation)
     CalculationFactory.register_calculation('multiply')(MultiplyCalculation)
     CalculationFactory.register_calculation('subtract')(SubtractCalculation)
+
+    # The result cache is opt-in, so every test starts without it
+    CalculationFactory.disable_cache()
+
+    # So does the float numeric backend
+    CalculationFactory.set_backend('float')
@@ -0,0 +1,114 @@
+import pytest
+import sys
+
+from io import StringIO
+
+from app.batch import batch_main, evaluate_line, run_batch
+from app.calculation import CalculationFactory
+
+# These tests verify the non-interactive batch mode (main.py --batch).
+
+@pytest.mark.parametrize(
+    'line, expected',
+    [
+        ('add 10 5', (True, 'AddCalculation: 10.0 Add 5.0 = 15.0')),
+        ('  DIVIDE 5 2\n', (True, 'DivideCalculation: 5.0 Divide 2.0 = 2.5')),
+        ('add 3', (False, 'Invalid input. Please follow the format: <operation> <num1> <num2>')),
+        ('add three 4', (False, 'Invalid input. Please follow the format: <operation> <num1> <num2>')),
+        ('divide 8 0', (False, 'Cannot divide by zero.')),
+    ],
+    ids=[
+        'batch_line_add',
+        'batch_line_mixed_case_with_whitespace',
+        'batch_line_wrong_number_of_inputs',
+        'batch_line_invalid_number',
+        'batch_line_division_by_zero',
+    ]
+)
+def test_evaluate_line(line, expected):
+
+    assert evaluate_line(line) == expected
+
+def test_evaluate_line_unknown_operation():
+
+    ok, message = evaluate_line('min 4 5')
+    assert not ok
+    assert message.startswith("Unsupported calculation type: 'min'. Available types: ")
+
+def test_evaluate_line_unexpected_error(monkeypatch):
+
+    def fail(self):
+        raise Exception('Unknown calculator error.')
+
+    monkeypatch.setattr('app.calculation.AddCalculation.execute', fail)
+    assert evaluate_line('add 3 4') == (False, 'An error occurred during calculation: Unknown calculator error.')
+
+def test_run_batch():
+
+    # Errors are reported with their line number and do not stop the rest of the job
+    source = StringIO('add 1 2\n\nbad line\ndivide 1 0\nmultiply 2 3\n   \nsubtract 5 1')
+    out = StringIO()
+    errors = StringIO()
+    failed = run_batch(source, out, errors, chunk_size=8)
+
+    assert failed == 2
+    assert out.getvalue() == '''AddCalculation: 1.0 Add 2.0 = 3.0
+MultiplyCalculation: 2.0 Multiply 3.0 = 6.0
+SubtractCalculation: 5.0 Subtract 1.0 = 4.0
+'''
+    assert errors.getvalue() == '''line 3: Invalid input. Please follow the format: <operation> <num1> <num2>
+line 4: Cannot divide by zero.
+'''
+
+def test_run_batch_backend():
+
+    # Operands are parsed by the current numeric backend, so a whole number is required by the int backend
+    CalculationFactory.set_backend('decimal')
+    assert evaluate_line('add 0.1 0.2') == (True, 'AddCalculation: 0.1 Add 0.2 = 0.3')
+    CalculationFactory.set_backend('int')
+    assert evaluate_line('divide 7 2') == (True, 'DivideCalculation: 7 Divide 2 = 7/2')
+    assert evaluate_line('add 0.5 1') == (False, 'Invalid input. Please follow the format: <operation> <num1> <num2>')
+
+def test_run_batch_empty():
+
+    out = StringIO()
+    errors = StringIO()
+    assert run_batch(StringIO(''), out, errors) == 0
+    assert out.getvalue() == ''
+    assert errors.getvalue() == ''
+
+@pytest.mark.parametrize(
+    'content, exit_code',
+    [
+        ('add 1 2\nmultiply 2 3\n', 0),
+        ('add 1 2\nmultiply 2\n', 1),
+    ],
+    ids=[
+        'batch_main_all_lines_ok',
+        'batch_main_with_failed_line',
+    ]
+)
+def test_batch_main_file(tmp_path, capfd, content, exit_code):
+
+    path = tmp_path / 'input.txt'
+    path.write_text(content)
+    assert batch_main(str(path)) == exit_code
+
+    out = capfd.readouterr().out
+    assert out.splitlines()[0] == 'AddCalculation: 1.0 Add 2.0 = 3.0'
+    assert 'Welcome' not in out
+
+def test_batch_main_stdin(tmp_path, capfd, monkeypatch):
+
+    path = tmp_path / 'input.txt'
+    path.write_text('subtract 3 2\n')
+    with open(path) as stdin:
+        monkeypatch.setattr(sys, 'stdin', stdin)
+        assert batch_main('-') == 0
+
+    assert capfd.readouterr().out == 'SubtractCalculation: 3.0 Subtract 2.0 = 1.0\n'
+
+def test_batch_main_missing_file(tmp_path, capfd):
+
+    assert batch_main(str(tmp_path / 'missing.txt')) == 2
+    assert 'Cannot open batch input:' in capfd.readouterr().err
@@ -0,0 +1,252 @@
+import json
+import pytest
+import runpy
+import sys
+
+from app.bench import allocated_bytes, time_call
+from app.bench import backends, calculation, dispatch, parallel, server, startup, suite, threads, tokenizer, workbook
+from app.calculation import CalculationFactory
+
+# These tests run each benchmark with tiny sizes, to make sure it works end-to-end.
+# They do not check the timings themselves, since those depend on the machine.
+
+def test_time_call():
+
+    calls = []
+    seconds = time_call(lambda: calls.append(1), repeat=4)
+    assert len(calls) == 4
+    assert seconds >= 0
+
+def test_allocated_bytes():
+
+    value, size = allocated_bytes(lambda: [0.5 * i for i in range(1000)])
+    assert len(value) == 1000
+    assert size > 0
+
+def test_calculation_benchmark(capsys):
+
+    results = calculation.run(count=50, renders=1)
+    assert set(results) == {'before', 'after'}
+    assert results['after']['bytes_per_object'] > 0
+
+    assert calculation.main(['--count', '20', '--renders', '1']) == 0
+    out = capsys.readouterr().out
+    assert 'bytes/object' in out
+    assert 'before' in out and 'after' in out
+
+def test_parallel_benchmark(tmp_path, capsys):
+
+    path = str(tmp_path / 'input.txt')
+    lines = parallel.generate_file(path, 1000)
+    assert lines == 10_000
+
+    results = parallel.run(path, max_workers=2, chunk_size=64 << 10)
+    assert [result['workers'] for result in results] == [1, 2]
+    assert results[0]['speedup'] == 1.0
+
+    assert parallel.main(['--size', '100', '--max-workers', '1']) == 0
+    assert parallel.main(['--file', path, '--max-workers', '1']) == 0
+    assert 'lines/s' in capsys.readouterr().out
+
+def test_make_workload():
+
+    workload = suite.make_workload(500, {'add': 1, 'divide': 3}, 'uniform', seed=1)
+    assert len(workload) == 500
+    assert {operation for operation, _, _ in workload} == {'add', 'divide'}
+    assert all(b != 0 for _, _, b in workload)
+    assert workload == suite.make_workload(500, {'add': 1, 'divide': 3}, 'uniform', seed=1)
+
+def test_make_workload_zipf_repeats():
+
+    # A Zipf workload is drawn from a small pool, so the same triples come up again and again
+    workload = suite.make_workload(2000, distribution='zipf', pool_size=50)
+    assert len(set(workload)) <= 50
+
+def test_make_workload_invalid_distribution():
+
+    with pytest.raises(ValueError, match="Unknown operand distribution: 'normal'"):
+        suite.make_workload(10, distribution='normal')
+
+@pytest.mark.parametrize(
+    'text, expected',
+    [
+        ('add=3,divide=1', {'add': 3.0, 'divide': 1.0}),
+        ('multiply', {'multiply': 1.0}),
+    ],
+    ids=[
+        'mix_with_weights',
+        'mix_default_weight',
+    ]
+)
+def test_parse_mix(text, expected):
+
+    assert suite.parse_mix(text) == expected
+
+def test_parse_mix_invalid():
+
+    with pytest.raises(ValueError, match="Unknown operation in op mix: 'power'"):
+        suite.parse_mix('add=1,power=2')
+
+def test_percentile():
+
+    values = list(range(1, 101))
+    assert suite.percentile(values, 0.5) == 50
+    assert suite.percentile(values, 0.99) == 99
+    assert suite.percentile([7], 0.99) == 7
+
+def test_run_suite():
+
+    results = suite.run_suite(size=200, history_sizes=(10, 20))
+    assert [result['benchmark'] for result in results] == [
+        'operation',
+        'factory+execute',
+        'factory.evaluate',
+        'repl_parse',
+        'str',
+        'display_history[10]',
+        'display_history[20]',
+    ]
+    assert results[-1]['ops'] == 3 * 20
+    for result in results:
+        assert result['ops_per_second'] > 0
+        assert result['p50_ns'] <= result['p99_ns']
+
+def test_suite_main(tmp_path, capsys, monkeypatch):
+
+    path = tmp_path / 'results.json'
+    assert suite.main(['--size', '50', '--history-sizes', '10', '--distribution', 'zipf', '--json', str(path)]) == 0
+    assert 'p99 us' in capsys.readouterr().out
+    assert len(json.loads(path.read_text())) == 6
+
+    assert suite.main(['--size', '50', '--history-sizes', '', '--mix', 'add=1', '--json', '-']) == 0
+    out = capsys.readouterr().out
+    assert json.loads(out[out.index('['):])[0]['benchmark'] == 'operation'
+
+    # python -m app.bench
+    monkeypatch.setattr(sys, 'argv', ['app.bench', '--size', '20', '--history-sizes', '5'])
+    with pytest.raises(SystemExit) as error_info:
+        runpy.run_module('app.bench', run_name='__main__')
+    assert error_info.value.code == 0
+
+def test_server_benchmark(capsys):
+
+    result = server.run(connections=20, requests=5)
+    assert result['requests'] == 100
+    assert result['errors'] == 0
+
+    assert server.main(['--connections', '5', '--requests', '2']) == 0
+    assert 'requests/s' in capsys.readouterr().out
+
+def test_server_benchmark_errors(monkeypatch):
+
+    # Error replies from the server make the load test fail
+    monkeypatch.setattr('app.server.evaluate_calculation', lambda line: (None, 'Unknown calculator error.'))
+    assert server.main(['--connections', '2', '--requests', '3']) == 1
+
+def test_raise_file_limit():
+
+    # Lower the soft limit a little, then check that raise_file_limit puts it back up
+    resource = pytest.importorskip('resource')
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (soft - 10, hard))
+    try:
+        server.raise_file_limit(soft)
+        assert resource.getrlimit(resource.RLIMIT_NOFILE)[0] == soft
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+def test_dispatch_benchmark(capsys):
+
+    results = dispatch.run(size=100, repeat=1)
+    assert [result['path'] for result in results] == [
+        'create_calculation+execute',
+        'evaluate',
+        'evaluate_code',
+        'unknown op: create_calculation',
+        'unknown op: evaluate',
+    ]
+    assert results[0]['speedup'] == 1.0
+
+    assert dispatch.main(['--size', '20', '--repeat', '1']) == 0
+    assert 'vs create+execute' in capsys.readouterr().out
+
+def test_backends_benchmark(capsys):
+
+    results = backends.run(size=50, repeat=1)
+    assert [result['backend'] for result in results] == list(backends.DEFAULT_BACKENDS)
+    assert results[0]['relative'] == 1.0
+    assert all(result['ops_per_second'] > 0 and result['parse_ns'] > 0 for result in results)
+    assert CalculationFactory.backend().name == 'float'
+
+    assert backends.main(['--size', '20', '--repeat', '1', '--backends', 'fixed,decimal:10']) == 0
+    output = capsys.readouterr().out
+    assert 'cost vs first' in output
+    assert 'decimal:10' in output
+
+def test_threads_benchmark(capsys, monkeypatch):
+
+    results = threads.run(size=100, max_workers=2, chunk_size=10, repeat=1)
+    assert [result['workers'] for result in results] == [1, 2]
+    assert results[0]['speedup'] == 1.0
+    assert all(result['ops_per_second'] > 0 for result in results)
+
+    assert threads.main(['--size', '50', '--max-workers', '2', '--repeat', '1']) == 0
+    output = capsys.readouterr().out
+    assert output.startswith('Python ')
+    assert 'speedup' in output
+
+    monkeypatch.delattr(sys, '_is_gil_enabled', raising=False)
+    assert threads.gil_enabled()
+    monkeypatch.setattr(sys, '_is_gil_enabled', lambda: False, raising=False)
+    assert not threads.gil_enabled()
+
+def test_tokenizer_benchmark(capsys):
+
+    lines = tokenizer.make_lines(200, 0.5, distinct=10)
+    assert len(lines) == 200
+    assert sum(line in tokenizer.JUNK for line in lines) > 50
+    assert tokenizer.count_good(lines, tokenizer.parse_with_exceptions) == 200 - sum(line in tokenizer.JUNK for line in lines)
+
+    results = tokenizer.run(size=100, junk_shares=(0.0, 0.3), distinct=(10, 1000), repeat=1)
+    assert [(result['distinct'], result['junk']) for result in results] == [(10, 0.0), (10, 0.3), (1000, 0.0), (1000, 0.3)]
+    assert all(result['speedup'] > 0 for result in results)
+
+    assert tokenizer.main(['--size', '50', '--junk', '0.2', '--distinct', '10,100', '--repeat', '1']) == 0
+    assert 'LineParser ns/line' in capsys.readouterr().out
+
+def test_workbook_benchmark(capsys):
+
+    book = workbook.build(50, 5)
+    assert len(book) == 50
+    result = workbook.run(size=200, inputs=10, edits=20, repeat=1)
+    assert result['cells'] == 200
+    assert result['cells_per_edit'] >= 1
+    assert result['speedup'] > 0
+
+    assert workbook.main(['--size', '100', '--inputs', '5', '--edits', '10', '--repeat', '1']) == 0
+    assert 'cells recomputed per edit' in capsys.readouterr().out
+
+def test_parse_importtime():
+
+    stderr = '''
+import time: self [us] | cumulative | imported package
+import time:       106 |        106 |   _operator
+import time:       356 |        461 | operator
+7.0
+'''
+    assert startup.parse_importtime(stderr) == [('_operator', 106, 106), ('operator', 356, 461)]
+
+def test_startup_benchmark(capsys):
+
+    result = startup.run(['add', '3', '4'], repeat=1)
+    assert result['best_ms'] > 0
+    assert result['modules'] == len(result['imports'])
+    assert 'app.cli' in [module for module, _, _ in result['imports']]
+
+    # The one-shot path does not import the calculation classes or the REPL
+    assert not {'app.calculation', 'app.calculator', 'app.history'} & {module for module, _, _ in result['imports']}
+
+    assert startup.main(['--repeat', '1', '--budget-ms', '100000']) == 0
+    assert 'OK: cold start is within budget.' in capsys.readouterr().out
+    assert startup.main(['--repeat', '1', '--budget-ms', '0']) == 1
+    assert 'FAIL: cold start is' in capsys.readouterr().out
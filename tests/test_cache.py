@@ -0,0 +1,121 @@
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from app.cache import LRUCache
+
+# These tests verify the LRU cache and its frequency-based admission policy.
+
+def test_cache_get_and_put():
+
+    cache = LRUCache(maxsize=2)
+    assert cache.get('a') is None
+    assert cache.get('a', 'missing') == 'missing'
+    assert cache.put('a', 1)
+    assert cache.get('a') == 1
+    assert 'a' in cache
+    assert len(cache) == 1
+
+def test_cache_put_existing_key():
+
+    cache = LRUCache(maxsize=1)
+    cache.put('a', 1)
+    assert cache.put('a', 2)
+    assert cache.get('a') == 2
+    assert cache.evictions == 0
+
+def test_cache_lru_eviction_without_admission():
+
+    # Without the admission policy, the least recently used entry is always evicted
+    cache = LRUCache(maxsize=2, admission=False)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    assert cache.put('c', 3)
+    assert 'a' in cache and 'c' in cache
+    assert 'b' not in cache
+    assert cache.evictions == 1
+
+def test_cache_admission_protects_hot_entries():
+
+    # A scan of keys that are each requested once should not flush out a key that is requested all the time
+    cache = LRUCache(maxsize=2)
+    hot_misses = 0
+    for i in range(100):
+        if cache.get('hot') is None:
+            hot_misses += 1
+            cache.put('hot', 'value')
+        for key in (f'scan-{i}-a', f'scan-{i}-b'):
+            if cache.get(key) is None:
+                cache.put(key, i)
+
+    assert hot_misses == 1
+    assert cache.rejections > 0
+
+def test_cache_admission_admits_popular_keys():
+
+    # A new key that becomes more popular than the LRU entry is let in
+    cache = LRUCache(maxsize=1)
+    cache.get('old')
+    cache.put('old', 1)
+    for _ in range(3):
+        cache.get('new')
+    assert cache.put('new', 2)
+    assert 'new' in cache and 'old' not in cache
+    assert cache.evictions == 1
+
+def test_cache_frequencies_age():
+
+    # Frequencies are halved every 10 * maxsize requests, so the table does not grow without limit
+    cache = LRUCache(maxsize=1)
+    for i in range(10):
+        cache.get(i)
+    assert cache._frequencies == {}
+    for _ in range(4):
+        cache.get('a')
+    for i in range(6):
+        cache.get(i)
+    assert cache._frequencies == {'a': 2}
+
+def test_cache_stats_and_clear():
+
+    cache = LRUCache(maxsize=4)
+    assert cache.stats()['hit_rate'] == 0.0
+    cache.get('a')
+    cache.put('a', 1)
+    cache.get('a')
+    cache.get('a')
+    assert cache.stats() == {
+        'hits': 2,
+        'misses': 1,
+        'evictions': 0,
+        'rejections': 0,
+        'size': 1,
+        'maxsize': 4,
+        'hit_rate': 2 / 3,
+    }
+    cache.clear()
+    assert len(cache) == 0
+
+def test_cache_shared_between_threads():
+
+    # Many threads reading and writing a small cache at once should leave it consistent
+    cache = LRUCache(16, admission=True)
+
+    def work(seed):
+        for i in range(2000):
+            key = (seed * 7 + i) % 40
+            if cache.get(key) is None:
+                cache.put(key, key)
+        return True
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(work, range(8)))
+    assert len(cache) <= 16
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == 8 * 2000
+
+def test_cache_invalid_size():
+
+    with pytest.raises(ValueError, match='Cache size must be at least 1.'):
+        LRUCache(maxsize=0)
@@ -1,5 +1,8 @@
 import pytest
+import sys
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 from unittest.mock import patch
 
@@ -567,3 +570,448 @@ def test_factory_duplicate_registration(operation):
                 return Operation.addition(self.a, self.b)
 
         assert f"Calculation type '{operation}' is already registered." in str(error_info.value)
+
+'''
+-----------------------------------------------------------------
+Slotted value objects with a cached result
+-----------------------------------------------------------------
+'''
+
+@patch.object(Operation, 'multiplication')
+def test_calculation_result_is_cached(mock):
+
+    # The arithmetic should run once, no matter how many times the result is used or the calculation is printed
+    mock.return_value = 20.0
+    calc = MultiplyCalculation(4.0, 5.0)
+    assert calc.result == 20.0
+    assert str(calc) == 'MultiplyCalculation: 4.0 Multiply 5.0 = 20.0'
+    assert str(calc) == 'MultiplyCalculation: 4.0 Multiply 5.0 = 20.0'
+    assert mock.call_count == 1
+
+def test_calculation_error_is_not_cached():
+
+    calc = DivideCalculation(1.0, 0.0)
+    for _ in range(2):
+        with pytest.raises(ZeroDivisionError):
+            calc.result
+
+@patch.object(Operation, 'addition')
+def test_calculation_from_result(mock):
+
+    calc = AddCalculation.from_result(3.0, 4.0, 7.0)
+    assert isinstance(calc, AddCalculation)
+    assert str(calc) == 'AddCalculation: 3.0 Add 4.0 = 7.0'
+    mock.assert_not_called()
+
+@pytest.mark.parametrize(
+    'calculation_class',
+    [AddCalculation, SubtractCalculation, MultiplyCalculation, DivideCalculation],
+)
+def test_calculation_has_no_instance_dict(calculation_class):
+
+    calc = calculation_class(1.0, 2.0)
+    assert not hasattr(calc, '__dict__')
+    with pytest.raises(AttributeError):
+        calc.c = 3.0
+
+@pytest.mark.parametrize('operand', ['a', 'b'])
+def test_calculation_operands_read_only(operand):
+
+    # The result is kept, so the operands cannot change under it
+    calc = AddCalculation(1.0, 2.0)
+    assert calc.result == 3.0
+    with pytest.raises(AttributeError):
+        setattr(calc, operand, 5.0)
+    assert calc.result == 3.0
+    assert hash(calc) == hash(AddCalculation(1.0, 2.0))
+
+def test_calculation_equality():
+
+    assert AddCalculation(1.0, 2.0) == AddCalculation(1.0, 2.0)
+    assert hash(AddCalculation(1.0, 2.0)) == hash(AddCalculation(1.0, 2.0))
+    assert AddCalculation(1.0, 2.0) != AddCalculation(2.0, 1.0)
+    assert AddCalculation(1.0, 2.0) != SubtractCalculation(1.0, 2.0)
+    assert len({AddCalculation(1.0, 2.0), AddCalculation(1.0, 2.0), DivideCalculation(1.0, 2.0)}) == 2
+
+'''
+-----------------------------------------------------------------
+Factory result cache
+-----------------------------------------------------------------
+'''
+
+@patch.object(Operation, 'addition')
+def test_factory_cache_reuses_calculation(mock):
+
+    # A repeated request returns the same object, so the arithmetic only runs once
+    mock.return_value = 7.0
+    CalculationFactory.enable_cache(16)
+    first = CalculationFactory.create_calculation('add', 3.0, 4.0)
+    second = CalculationFactory.create_calculation('ADD', 3.0, 4.0)
+    assert first is second
+    assert first.result == 7.0 and second.result == 7.0
+    assert mock.call_count == 1
+    assert CalculationFactory.cache_stats()['hits'] == 1
+    assert CalculationFactory.cache_stats()['misses'] == 1
+
+@pytest.mark.parametrize(
+    'a_1, b_1, a_2, b_2',
+    [
+        (1, 2, 1.0, 2.0),
+        (0.0, -1.0, -0.0, -1.0),
+    ],
+    ids=[
+        'factory_cache_int_and_float_operands',
+        'factory_cache_zero_and_negative_zero',
+    ]
+)
+def test_factory_cache_keeps_equal_operands_apart(a_1, b_1, a_2, b_2):
+
+    # Operands that compare equal but print or compute differently must not share a cache entry
+    CalculationFactory.enable_cache(16)
+    first = CalculationFactory.create_calculation('multiply', a_1, b_1)
+    second = CalculationFactory.create_calculation('multiply', a_2, b_2)
+    assert first is not second
+    assert str(first) != str(second)
+
+@patch.object(Operation, 'division', side_effect=ZeroDivisionError('Cannot divide by zero.'))
+def test_factory_cache_division_by_zero(mock_division):
+
+    # Division by zero outcomes are cached too: a hit raises the error again without dividing again
+    CalculationFactory.enable_cache(16)
+    for _ in range(3):
+        with pytest.raises(ZeroDivisionError, match='Cannot divide by zero.'):
+            CalculationFactory.create_calculation('divide', 1.0, 0.0).result
+    mock_division.assert_called_once_with(1.0, 0.0)
+    assert CalculationFactory.cache_stats()['hits'] == 2
+
+def test_result_error_kept():
+
+    # An arithmetic error is kept like a result, other errors are raised again on every access
+    calculation = DivideCalculation(1.0, 0.0)
+    with patch.object(Operation, 'division', side_effect=ZeroDivisionError('Cannot divide by zero.')) as mock_division:
+        for _ in range(2):
+            with pytest.raises(ZeroDivisionError):
+                calculation.result
+    assert mock_division.call_count == 1
+    calculation = DivideCalculation(1.0, 2.0)
+    with patch.object(Operation, 'division', side_effect=[TypeError('bad operand'), 0.5]) as mock_division:
+        with pytest.raises(TypeError):
+            calculation.result
+        assert calculation.result == 0.5
+    assert mock_division.call_count == 2
+
+def test_factory_cache_disabled():
+
+    assert CalculationFactory.cache_stats() is None
+    first = CalculationFactory.create_calculation('add', 3.0, 4.0)
+    assert first is not CalculationFactory.create_calculation('add', 3.0, 4.0)
+
+def test_factory_cache_unknown_type_and_reset():
+
+    CalculationFactory.enable_cache(16)
+    CalculationFactory.create_calculation('add', 3.0, 4.0)
+    with pytest.raises(ValueError):
+        CalculationFactory.create_calculation('min', 3.0, 4.0)
+    assert CalculationFactory.cache_stats()['size'] == 1
+
+    # Resetting the registry empties the cache, since cached objects may belong to types that are no longer registered
+    CalculationFactory.reset_calculations()
+    assert CalculationFactory.cache_stats()['size'] == 0
+
+'''
+-----------------------------------------------------------------
+Direct evaluation through the frozen dispatch table
+-----------------------------------------------------------------
+'''
+
+@pytest.mark.parametrize(
+    'calculation_type, a, b, expected',
+    [
+        ('add', 3.0, 4.0, 7.0),
+        ('subtract', 3.0, 4.0, -1.0),
+        ('multiply', 3.0, 4.0, 12.0),
+        ('divide', 3.0, 4.0, 0.75),
+        ('DIVIDE', 3.0, 4.0, 0.75),
+    ],
+    ids=[
+        'evaluate_add',
+        'evaluate_subtract',
+        'evaluate_multiply',
+        'evaluate_divide',
+        'evaluate_mixed_case',
+    ]
+)
+def test_factory_evaluate(calculation_type, a, b, expected):
+
+    assert CalculationFactory.evaluate(calculation_type, a, b) == expected
+
+def test_factory_evaluate_division_by_zero():
+
+    with pytest.raises(ZeroDivisionError, match='Division by zero is not allowed.'):
+        CalculationFactory.evaluate('divide', 1.0, 0.0)
+
+def test_factory_evaluate_unknown_type():
+
+    # The error text is the same as create_calculation's
+    with pytest.raises(ValueError) as error_info:
+        CalculationFactory.evaluate('modulo', 1.0, 2.0)
+    assert str(error_info.value) == "Unsupported calculation type: 'modulo'. Available types: add, divide, multiply, subtract"
+
+@patch.object(Calculation, '__init__')
+def test_factory_evaluate_creates_no_objects(init):
+
+    assert CalculationFactory.evaluate('multiply', 6.0, 7.0) == 42.0
+    init.assert_not_called()
+
+def test_factory_evaluate_code():
+
+    codes = CalculationFactory.operation_codes()
+    assert dict(codes) == {'add': 0, 'divide': 1, 'multiply': 2, 'subtract': 3}
+    assert CalculationFactory.evaluate_code(codes['subtract'], 10.0, 4.0) == 6.0
+    with pytest.raises(TypeError):
+        codes['modulo'] = 4
+
+def test_factory_evaluate_code_builds_table():
+
+    # evaluate_code works even before anything else has built the table
+    CalculationFactory.reset_calculations()
+    CalculationFactory.register_calculation('add')(AddCalculation)
+    assert CalculationFactory.evaluate_code(0, 1.0, 2.0) == 3.0
+
+def test_factory_dispatch_table_follows_registry():
+
+    # The table is only rebuilt when the registry changes
+    CalculationFactory.evaluate('add', 1.0, 2.0)
+    table = CalculationFactory._dispatch
+    CalculationFactory.evaluate('subtract', 1.0, 2.0)
+    assert CalculationFactory._dispatch is table
+
+    @CalculationFactory.register_calculation('average')
+    class AverageCalculation(Calculation):
+
+        __slots__ = ()
+
+        def execute(self) -> float:
+            return (self.a + self.b) / 2
+
+    assert CalculationFactory.evaluate('average', 1.0, 2.0) == 1.5
+    assert CalculationFactory._dispatch is not table
+
+    CalculationFactory.reset_calculations()
+    with pytest.raises(ValueError, match="Available types: $"):
+        CalculationFactory.evaluate('add', 1.0, 2.0)
+
+def test_factory_backend():
+
+    # Switching backend rebuilds the dispatch table with the backend's functions, and clears the result cache
+    CalculationFactory.enable_cache()
+    CalculationFactory.create_calculation('divide', 1, 3)
+    table = CalculationFactory._dispatch
+    backend = CalculationFactory.set_backend('fraction')
+    assert CalculationFactory.backend() is backend
+    assert CalculationFactory._dispatch is None
+    assert CalculationFactory.cache_stats()['size'] == 0
+
+    one, three = backend.parse('1'), backend.parse('3')
+    assert str(CalculationFactory.evaluate('divide', one, three)) == '1/3'
+    assert str(CalculationFactory.create_calculation('add', one, three)) == 'AddCalculation: 1 Add 3 = 4'
+    assert CalculationFactory._dispatch is not table
+
+    # Choosing the same backend again changes nothing
+    table = CalculationFactory._dispatch
+    assert CalculationFactory.set_backend('fraction') is backend
+    assert CalculationFactory._dispatch is table
+
+    assert CalculationFactory.set_backend('float') is Operation
+    assert CalculationFactory.evaluate('divide', 1.0, 4.0) == 0.25
+
+def test_factory_registry_snapshots():
+
+    # The registry is replaced, never changed in place, so a snapshot taken earlier stays as it was
+    snapshot = CalculationFactory._calculations
+    CalculationFactory.register_calculation('power')(AddCalculation)
+    assert 'power' not in snapshot
+    assert 'power' in CalculationFactory._calculations
+    with pytest.raises(TypeError):
+        CalculationFactory._calculations['root'] = AddCalculation
+
+def test_factory_registry_shared_between_threads():
+
+    # Readers evaluate while a writer keeps registering operations and switching backend. No reader should ever fail.
+    stop = threading.Event()
+
+    def read():
+        count = 0
+        while not stop.is_set() or count < 1000:
+            assert CalculationFactory.evaluate('add', 1.0, 2.0) == 3.0
+            assert CalculationFactory.calculation_class('multiply') is MultiplyCalculation
+            count += 1
+        return count
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        readers = [executor.submit(read) for _ in range(4)]
+        for i in range(200):
+            CalculationFactory.register_calculation(f'extra{i}')(AddCalculation)
+            CalculationFactory.set_backend('fraction' if i % 2 else 'float')
+        CalculationFactory.set_backend('float')
+        stop.set()
+        assert all(reader.result() >= 1000 for reader in readers)
+    assert len(CalculationFactory.operation_codes()) == 204
+
+def test_factory_tables_built_by_another_thread():
+
+    # A thread that finds the work already done by another thread (while it waited for the lock) uses that
+    table = CalculationFactory._build_dispatch()
+    assert CalculationFactory._build_dispatch() is table
+    assert CalculationFactory._load_plugin('add') is AddCalculation
+
+def test_factory_backend_unknown():
+
+    with pytest.raises(ValueError, match="Unsupported numeric backend: 'complex'"):
+        CalculationFactory.set_backend('complex')
+    assert CalculationFactory.backend() is Operation
+
+'''
+-----------------------------------------------------------------
+Plugin operations loaded through entry points
+-----------------------------------------------------------------
+'''
+
+PLUGIN_MODULES = {
+    'calc_plugin_power': '''
+from app.calculation import Calculation
+
+class PowerCalculation(Calculation):
+
+    __slots__ = ()
+
+    def execute(self) -> float:
+        return self.a ** self.b
+''',
+    'calc_plugin_modulo': '''
+from app.calculation import Calculation, CalculationFactory
+
+@CalculationFactory.register_calculation('modulo')
+class ModuloCalculation(Calculation):
+
+    __slots__ = ()
+
+    def execute(self) -> float:
+        return self.a % self.b
+''',
+    'calc_plugin_bad': '''
+NOT_A_CALCULATION = 42
+''',
+}
+
+@pytest.fixture
+def plugins(tmp_path, monkeypatch):
+
+    # Write the plugin modules to a directory on sys.path, and return entry points for them (not imported yet)
+    from importlib.metadata import EntryPoint
+
+    for name, source in PLUGIN_MODULES.items():
+        (tmp_path / f'{name}.py').write_text(source)
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    group = CalculationFactory.PLUGIN_GROUP
+    return [
+        EntryPoint('power', 'calc_plugin_power:PowerCalculation', group),
+        EntryPoint('Modulo', 'calc_plugin_modulo', group),
+        EntryPoint('bad', 'calc_plugin_bad:NOT_A_CALCULATION', group),
+        EntryPoint('missing', 'calc_plugin_missing:MissingCalculation', group),
+        EntryPoint('add', 'calc_plugin_power:PowerCalculation', group),
+    ]
+
+def test_plugins_are_loaded_lazily(plugins):
+
+    # Discovery only records names; each plugin module is imported when its operation is first requested
+    assert CalculationFactory.discover_plugins(plugins) == ['power', 'modulo', 'bad', 'missing']
+    assert 'calc_plugin_power' not in sys.modules
+
+    calc = CalculationFactory.create_calculation('power', 2.0, 10.0)
+    assert type(calc).__name__ == 'PowerCalculation'
+    assert calc.result == 1024.0
+    assert 'calc_plugin_power' in sys.modules
+    assert 'calc_plugin_modulo' not in sys.modules
+    assert CalculationFactory.calculation_type(type(calc)) == 'power'
+
+    # The built-in operation keeps its name
+    assert CalculationFactory.calculation_class('add') is AddCalculation
+
+def test_plugin_registering_itself(plugins):
+
+    # A plugin module may register its class itself when it is imported
+    CalculationFactory.discover_plugins(plugins)
+    assert CalculationFactory.evaluate('MODULO', 7.0, 4.0) == 3.0
+    assert CalculationFactory.operation_codes()['modulo'] == 2
+
+def test_plugin_names_in_error_message(plugins):
+
+    # Plugins are listed as available types without being imported
+    CalculationFactory.discover_plugins(plugins)
+    with pytest.raises(ValueError) as error_info:
+        CalculationFactory.create_calculation('cube', 1.0, 2.0)
+    assert str(error_info.value) == "Unsupported calculation type: 'cube'. Available types: add, bad, divide, missing, modulo, multiply, power, subtract"
+    assert 'calc_plugin_power' not in sys.modules
+
+@pytest.mark.parametrize(
+    'operation, message',
+    [
+        ('bad', "The plugin for calculation type 'bad' is not a Calculation class: calc_plugin_bad:NOT_A_CALCULATION"),
+        ('missing', "Could not load the plugin for calculation type 'missing': No module named 'calc_plugin_missing'"),
+    ],
+    ids=['plugin_not_a_calculation', 'plugin_missing_module']
+)
+def test_plugin_load_errors(plugins, operation, message):
+
+    CalculationFactory.discover_plugins(plugins)
+    with pytest.raises(ValueError) as error_info:
+        CalculationFactory.create_calculation(operation, 1.0, 2.0)
+    assert str(error_info.value) == message
+
+def test_plugins_reset(plugins):
+
+    # Resetting the registry forgets plugins too, without importing them
+    CalculationFactory.discover_plugins(plugins)
+    CalculationFactory.reset_calculations()
+    with pytest.raises(ValueError, match="Available types: $"):
+        CalculationFactory.create_calculation('power', 1.0, 2.0)
+    assert 'calc_plugin_power' not in sys.modules
+
+def test_plugin_replaced_by_registration(plugins):
+
+    # Registering a class under a plugin's name replaces the plugin
+    CalculationFactory.discover_plugins(plugins)
+    CalculationFactory.register_calculation('power')(MultiplyCalculation)
+    assert CalculationFactory.evaluate('power', 2.0, 10.0) == 20.0
+    assert 'calc_plugin_power' not in sys.modules
+
+def test_installed_plugins_discovered_on_first_miss(plugins, monkeypatch):
+
+    # Installed plugins are looked up the first time an operation is not registered, and only then
+    calls = []
+    monkeypatch.setattr('importlib.metadata.entry_points', lambda group: calls.append(group) or plugins)
+    monkeypatch.setattr(CalculationFactory, '_plugins_discovered', False)
+
+    assert CalculationFactory.evaluate('add', 1.0, 2.0) == 3.0
+    assert calls == []
+    assert CalculationFactory.evaluate('power', 3.0, 2.0) == 9.0
+    assert calls == ['calculator.operations']
+    with pytest.raises(ValueError, match='Unsupported calculation type'):
+        CalculationFactory.evaluate('cube', 1.0, 2.0)
+    assert calls == ['calculator.operations']
+
+def test_installed_plugins_discovered_again_after_reset(plugins, monkeypatch):
+
+    # A reset forgets the plugins found so far, so the next miss looks the installed ones up again
+    calls = []
+    monkeypatch.setattr('importlib.metadata.entry_points', lambda group: calls.append(group) or plugins)
+    monkeypatch.setattr(CalculationFactory, '_plugins_discovered', False)
+
+    assert CalculationFactory.evaluate('power', 3.0, 2.0) == 9.0
+    CalculationFactory.reset_calculations()
+    assert CalculationFactory._plugins_discovered is False
+    assert CalculationFactory.evaluate('power', 2.0, 3.0) == 8.0
+    assert calls == ['calculator.operations', 'calculator.operations']
@@ -6,6 +6,9 @@ from unittest.mock import patch
 
 from app.calculation import AddCalculation
 from app.calculator import Calculator
+from app.history import BoundedHistory, History
+from app.output import BufferedSink, MemorySink, QuietSink
+from app.reduction import reduce_main
 
 # This tests that the Calculator that the user sees works end-to-end
 
@@ -13,7 +16,7 @@ from app.calculator import Calculator
 # So, the parametrized testing here (test_calculator.py) is not intended to cover all cases, but rather demonstrate parametrized testing as a concept.
 # Testing in here (test_calculator.py) is primarily for testing the REPL structure and user interactions.
 
-def run_calc(monkeypatch, capsys, user_inputs):
+def run_calc(monkeypatch, capsys, user_inputs, history_path=None, history=None):
 
     # Simulate reading input from user, and return the output from the calculator app.
 
@@ -22,7 +25,7 @@ def run_calc(monkeypatch, capsys, user_inputs):
     for user_input in user_inputs:
         monkeypatch.setattr(sys, 'stdin', StringIO(user_input))
 
-    calc = Calculator()
+    calc = Calculator(history_path, history=history)
     with pytest.raises(SystemExit) as error_info:
         calc.run()
 
@@ -241,9 +244,35 @@ Usage:
         multiply  : Multiplies two numbers.
         divide    : Divides the first number by the second.
 
+    <reduction> <number1> <number2> ...
+    - Reduce any count of numbers to one result, e.g. 'sum 1 2 3'.
+    - Supported reductions:
+        sum       : Adds all the numbers, without rounding errors building up.
+        product   : Multiplies all the numbers.
+        mean      : Averages the numbers.
+        scan      : Shows the running sum after each number.
+    - '<reduction> from FILE' reduces the numbers in a file.
+
 Special Commands:
     help      : Display this help message.
     history   : Show the history of calculations.
+                'history tail N', 'history page K' and 'history range I J' show part of it.
+                'history where op=divide result>100 since 10m' finds calculations (fields: op, result, a, b),
+                'history top N by result' shows the N largest results (or a, b).
+                'history stats' shows the count, sum, mean, min, max and spread of the results.
+                'history export FILE [--format csv|jsonl|bin]' saves it to a file, and 'history import FILE' adds one back.
+    cache     : Show result cache statistics.
+                'cache on [SIZE]' turns the cache on, 'cache off' turns it off.
+    eval      : Evaluate an expression, e.g. 'eval 2 * (x + 1) / y where x=3 y=4'.
+                Supports + - * / and parentheses, and any operation called as e.g. add(x, 2).
+    cells     : Show the named cells. 'NAME = <operation> <operand1> <operand2>' (or 'NAME = <number>') sets a cell,
+                e.g. 'x = add 3 4' then 'y = multiply x 2'. Operands can name other cells,
+                and changing a cell recomputes only the cells that depend on it.
+    backend   : Show the numeric backend. 'backend NAME' switches to another one:
+                float (default), int, fraction, decimal[:DIGITS] or fixed[:PLACES].
+    stats     : Show how long each stage of a calculation takes.
+                'stats on' / 'stats off' turn timing on or off, 'stats reset' clears it,
+                'stats json [FILE]' and 'stats prometheus [FILE]' export it.
     exit      : Exit the calculator.
 
 Examples:
@@ -307,6 +336,378 @@ def test_display_history_with_entries(monkeypatch, capsys, inputs, expected):
     actual = run_calc(monkeypatch, capsys, inputs)
     check_result(actual, expected)
 
+def history_inputs(count):
+
+    # Inputs that put count additions (1 + 1, 1 + 2, ...) into the history
+    return [f'add 1 {i}' for i in range(1, count + 1)]
+
+def history_lines(numbers):
+
+    return '\n'.join(f'{i}. AddCalculation: 1.0 Add {float(i)} = {i + 1.0}' for i in numbers)
+
+@pytest.mark.parametrize(
+    'count, command, expected',
+    [
+        (5, 'history tail 2', 'Calculation History:\n' + history_lines([4, 5])),
+        (3, 'history tail 10', 'Calculation History:\n' + history_lines([1, 2, 3])),
+        (45, 'history page 1', 'Calculation History (page 1 of 3):\n' + history_lines(range(1, 21))),
+        (45, 'history page 3', 'Calculation History (page 3 of 3):\n' + history_lines(range(41, 46))),
+        (45, 'history page 4', 'Page 4 does not exist. The history has 3 pages.'),
+        (3, 'history page 2', 'Page 2 does not exist. The history has 1 page.'),
+        (0, 'history page 1', 'No calculations performed yet.'),
+        (6, 'history range 2 4', 'Calculation History:\n' + history_lines([2, 3, 4])),
+        (6, 'history range 5 9', 'Calculation History:\n' + history_lines([5, 6])),
+        (6, 'history range 7 9', 'Entry 7 does not exist. The history has 6 entries.'),
+        (1, 'history range 2 2', 'Entry 2 does not exist. The history has 1 entry.'),
+        (0, 'history tail 3', 'No calculations performed yet.'),
+        (3, 'history range 3 2', "Invalid history command. Use 'history', 'history tail N', 'history page K' or 'history range I J'."),
+        (3, 'history tail 0', "Invalid history command. Use 'history', 'history tail N', 'history page K' or 'history range I J'."),
+        (3, 'history tail x', "Invalid history command. Use 'history', 'history tail N', 'history page K' or 'history range I J'."),
+        (3, 'history page', "Invalid history command. Use 'history', 'history tail N', 'history page K' or 'history range I J'."),
+        (3, 'history head 2', "Invalid history command. Use 'history', 'history tail N', 'history page K' or 'history range I J'."),
+    ],
+    ids=[
+        'history_tail',
+        'history_tail_longer_than_history',
+        'history_first_page',
+        'history_last_page',
+        'history_page_too_large',
+        'history_page_too_large_single',
+        'history_page_empty',
+        'history_range',
+        'history_range_past_end',
+        'history_range_start_past_end',
+        'history_range_start_past_end_single',
+        'history_tail_empty',
+        'history_range_reversed',
+        'history_tail_zero',
+        'history_tail_not_a_number',
+        'history_page_missing_number',
+        'history_unknown_command',
+    ]
+)
+def test_display_history_part(monkeypatch, capsys, count, command, expected):
+
+    # Only the requested entries are shown, numbered as in the full history
+    actual = run_calc(monkeypatch, capsys, history_inputs(count) + [command, 'exit'])
+    results = ''.join(f'Result: AddCalculation: 1.0 Add {float(i)} = {i + 1.0}\n\n' for i in range(1, count + 1))
+    check_result(actual, results + expected)
+
+def test_display_history_page_renders_only_page(monkeypatch, capsys):
+
+    # Showing the last page renders the entries on that page and no others
+    calc = Calculator()
+    for i in range(1000):
+        calc.history.append(AddCalculation(1.0, float(i)), i + 1.0)
+    rendered = []
+    render = calc.history.render
+    monkeypatch.setattr(calc.history, 'render', lambda index: rendered.append(index) or render(index))
+    calc.display_history_part(['page', '50'])
+    assert rendered == list(range(980, 1000))
+    assert capsys.readouterr().out.splitlines()[-1] == '1000. AddCalculation: 1.0 Add 999.0 = 1000.0'
+
+QUERY_INPUTS = ['add 100 50', 'divide 900 3', 'multiply 2 3', 'divide 10 5', 'subtract 500 1']
+
+@pytest.mark.parametrize(
+    'command, expected',
+    [
+        (
+            'history where op=divide result>100',
+            'Matching Calculations (1):\n2. DivideCalculation: 900.0 Divide 3.0 = 300.0',
+        ),
+        (
+            'history where result>=150 since 10m',
+            '''
+Matching Calculations (3):
+1. AddCalculation: 100.0 Add 50.0 = 150.0
+2. DivideCalculation: 900.0 Divide 3.0 = 300.0
+5. SubtractCalculation: 500.0 Subtract 1.0 = 499.0
+'''.strip(),
+        ),
+        ('history where op=multiply b=4', 'No matching calculations.'),
+        (
+            'history top 2 by result',
+            '''
+Top 2 Calculations by result:
+5. SubtractCalculation: 500.0 Subtract 1.0 = 499.0
+2. DivideCalculation: 900.0 Divide 3.0 = 300.0
+'''.strip(),
+        ),
+        ('history top 1', 'Top 1 Calculations by result:\n5. SubtractCalculation: 500.0 Subtract 1.0 = 499.0'),
+        ('history top 1 by a', 'Top 1 Calculations by a:\n2. DivideCalculation: 900.0 Divide 3.0 = 300.0'),
+        ('history top 1 by op', "Invalid field: 'op'. Use result, a or b."),
+        ('history top 0', "Invalid count: '0'. Please enter a positive whole number."),
+        ('history top 2 with a', "Invalid history command. Use 'history top N' or 'history top N by FIELD'."),
+        ('history where result>x', "Invalid number in condition: 'result>x'."),
+        ('history where op=modulo', "Unsupported calculation type: 'modulo'. Available types: add, divide, multiply, subtract"),
+    ],
+    ids=[
+        'history_where_op_and_result',
+        'history_where_result_since',
+        'history_where_no_matches',
+        'history_top_by_result',
+        'history_top_default_field',
+        'history_top_by_operand',
+        'history_top_invalid_field',
+        'history_top_invalid_count',
+        'history_top_invalid_syntax',
+        'history_where_invalid_number',
+        'history_where_unknown_operation',
+    ]
+)
+def test_query_history(monkeypatch, capsys, command, expected):
+
+    actual = run_calc(monkeypatch, capsys, QUERY_INPUTS + [command, 'exit'])
+    assert actual.strip().endswith(f'{expected}\nExiting calculator. Goodbye!')
+
+def test_display_history_stats(monkeypatch, capsys):
+
+    actual = run_calc(monkeypatch, capsys, QUERY_INPUTS + ['history stats', 'exit'])
+    assert actual.strip().endswith('''
+operation  count  sum  mean   min  max  stdev
+---------  -----  ---  -----  ---  ---  -------
+add        1      150  150    150  150  0
+divide     2      302  151    2    300  149
+multiply   1      6    6      6    6    0
+subtract   1      499  499    499  499  0
+all        5      957  191.4  2    499  188.876
+Exiting calculator. Goodbye!''')
+
+def test_display_history_stats_empty(monkeypatch, capsys):
+
+    actual = run_calc(monkeypatch, capsys, ['history stats', 'exit'])
+    check_result(actual, 'No calculations performed yet.')
+
+def test_query_history_empty(monkeypatch, capsys):
+
+    actual = run_calc(monkeypatch, capsys, ['history top 3', 'exit'])
+    check_result(actual, 'No calculations performed yet.')
+
+def test_query_history_many_matches(monkeypatch, capsys):
+
+    # Only the most recent page of matches is shown
+    actual = run_calc(monkeypatch, capsys, history_inputs(45) + ['history where result>2', 'exit'])
+    assert 'Matching Calculations (showing the last 20 of 44):\n' + history_lines(range(26, 46)) in actual
+
+def test_persistent_history(monkeypatch, capsys, tmp_path):
+
+    # With a history file, the history from an earlier session is shown after a restart
+    path = tmp_path / 'history.bin'
+    run_calc(monkeypatch, capsys, ['add 3 4', 'divide 8 2', 'exit'], path)
+
+    actual = run_calc(monkeypatch, capsys, ['multiply 4 5', 'history', 'exit'], path)
+    expected = '''
+Result: MultiplyCalculation: 4.0 Multiply 5.0 = 20.0
+
+Calculation History:
+1. AddCalculation: 3.0 Add 4.0 = 7.0
+2. DivideCalculation: 8.0 Divide 2.0 = 4.0
+3. MultiplyCalculation: 4.0 Multiply 5.0 = 20.0
+'''.strip()
+    check_result(actual, expected)
+
+@pytest.mark.parametrize(
+    'inputs, expected',
+    [
+        (['add 1 1', 'history'], '1. AddCalculation: 1.0 Add 1.0 = 2.0'),
+        (['add 1 1', 'add 1 2', 'add 1 3', 'history'], '''(1 older calculation was dropped to stay within the history limit.)
+1. AddCalculation: 1.0 Add 2.0 = 3.0
+2. AddCalculation: 1.0 Add 3.0 = 4.0'''),
+        (['add 1 1', 'add 1 2', 'add 1 3', 'add 1 4', 'history'], '''(2 older calculations were dropped to stay within the history limit.)
+1. AddCalculation: 1.0 Add 3.0 = 4.0
+2. AddCalculation: 1.0 Add 4.0 = 5.0'''),
+        (['add 1 1', 'add 1 2', 'add 1 3', 'history tail 1'], '2. AddCalculation: 1.0 Add 3.0 = 4.0'),
+        (['add 1 1', 'add 1 2', 'add 1 3', 'history where result<4'], 'Matching Calculations (1):\n1. AddCalculation: 1.0 Add 2.0 = 3.0'),
+    ],
+    ids=['not_full', 'one_dropped', 'two_dropped', 'tail', 'query']
+)
+def test_bounded_history(monkeypatch, capsys, inputs, expected):
+
+    # A calculator given a BoundedHistory keeps only the latest calculations, and says how many were dropped
+    actual = run_calc(monkeypatch, capsys, inputs + ['exit'], history=BoundedHistory(2))
+    assert expected + '\nExiting calculator. Goodbye!' in actual
+
+def test_bounded_history_spill(monkeypatch, capsys, tmp_path):
+
+    # With a spill directory, every calculation is still shown, and the spilled segments are deleted on exit
+    history = BoundedHistory(1, spill_dir=tmp_path, segment_size=1)
+    actual = run_calc(monkeypatch, capsys, ['add 1 1', 'add 1 2', 'add 1 3', 'history', 'exit'], history=history)
+    assert '''Calculation History:
+1. AddCalculation: 1.0 Add 1.0 = 2.0
+2. AddCalculation: 1.0 Add 2.0 = 3.0
+3. AddCalculation: 1.0 Add 3.0 = 4.0''' in actual
+    assert list(tmp_path.iterdir()) == []
+
+@pytest.mark.parametrize(
+    'error',
+    [KeyboardInterrupt, EOFError],
+    ids=['persistent_history_keyboard_interrupt', 'persistent_history_eof']
+)
+def test_persistent_history_interrupted(monkeypatch, capsys, tmp_path, error):
+
+    # The history file is committed when the calculator is interrupted too
+    path = tmp_path / 'history.bin'
+    inputs = iter(['add 1 2'])
+
+    def interrupted_input(_):
+        for user_input in inputs:
+            return user_input
+        raise error()
+
+    monkeypatch.setattr('builtins.input', interrupted_input)
+    with pytest.raises(SystemExit):
+        Calculator(path).run()
+
+    actual = run_calc(monkeypatch, capsys, ['history', 'exit'], path)
+    assert '1. AddCalculation: 1.0 Add 2.0 = 3.0' in actual
+
+@pytest.mark.parametrize('file_format', ['csv', 'jsonl', 'bin'])
+def test_history_export_import(monkeypatch, capsys, tmp_path, file_format):
+
+    path = tmp_path / 'exported'
+    actual = run_calc(monkeypatch, capsys, ['add 1 2', 'multiply 2 3', f'history export {path} --format {file_format}', 'exit'])
+    assert f'Exported 2 entries to {path}.' in actual
+
+    actual = run_calc(monkeypatch, capsys, [f'history import {path} --format {file_format}', f'history import {path} --format {file_format}', 'history', 'exit'])
+    assert f'Imported 2 entries from {path}.\nImported 2 entries from {path}.' in actual
+    assert '4. MultiplyCalculation: 2.0 Multiply 3.0 = 6.0' in actual
+
+@pytest.mark.parametrize(
+    'command, expected',
+    [
+        ('history export', "Invalid history command. Use 'history export FILE' or 'history export FILE --format csv|jsonl|bin'."),
+        ('history import a b c', "Invalid history command. Use 'history import FILE' or 'history import FILE --format csv|jsonl|bin'."),
+        ('history export out.xml --format xml', "Unknown format: 'xml'. Use one of: csv, jsonl, bin."),
+        ('history export {tmp}/missing/out.csv', 'Could not write {tmp}/missing/out.csv: No such file or directory.'),
+        ('history import {tmp}/missing.csv', 'Could not read {tmp}/missing.csv: No such file or directory.'),
+    ],
+    ids=['export_no_file', 'import_bad_syntax', 'export_unknown_format', 'export_no_directory', 'import_missing_file']
+)
+def test_history_export_import_errors(monkeypatch, capsys, tmp_path, command, expected):
+
+    actual = run_calc(monkeypatch, capsys, ['add 1 2', command.format(tmp=tmp_path), 'exit'])
+    assert actual.strip().endswith(f'{expected.format(tmp=tmp_path)}\nExiting calculator. Goodbye!')
+
+def test_history_export_one_entry(monkeypatch, capsys, tmp_path):
+
+    actual = run_calc(monkeypatch, capsys, ['add 1 2', f'history export {tmp_path}/one.jsonl', f'history import {tmp_path}/one.jsonl', 'exit'])
+    assert f'Exported 1 entry to {tmp_path}/one.jsonl.\nImported 1 entry from {tmp_path}/one.jsonl.' in actual
+
+'''
+----------------------------------------------------------------
+Cells
+----------------------------------------------------------------
+'''
+
+def test_cells(monkeypatch, capsys):
+
+    actual = run_calc(monkeypatch, capsys, ['cells', 'x = 5', 'y = add x 2', 'z=multiply y x', 'x = 10', 'w = add 1 1', 'x = 1', 'cells', 'history', 'exit'])
+    check_result(actual, '''No cells defined yet.
+x = 5.0
+
+y = add x 2.0 = 7.0
+
+z = multiply y x = 35.0
+
+x = 10.0
+Recomputed 2 dependent cells.
+
+w = add 1.0 1.0 = 2.0
+
+x = 1.0
+Recomputed 2 dependent cells.
+
+Cells:
+x = 1.0
+y = add x 2.0 = 3.0
+z = multiply y x = 3.0
+w = add 1.0 1.0 = 2.0
+No calculations performed yet.''')
+
+@pytest.mark.parametrize(
+    'inputs, expected',
+    [
+        (['x = 1', 'y = add x 1', 'x = 2'], 'x = 2.0\nRecomputed 1 dependent cell.'),
+        (['x = 1', 'x = add x 1'], "Cycle: cell 'x' would depend on itself.\nType 'help' for more information."),
+        (['y = add x 1'], "Unknown cell: 'x'.\nType 'help' for more information."),
+        (['x = 1', 'y = divide x 0'], 'y = divide x 0.0: Cannot divide by zero.'),
+    ],
+    ids=['one_dependent', 'cycle', 'unknown_cell', 'division_by_zero']
+)
+def test_cell_messages(monkeypatch, capsys, inputs, expected):
+
+    actual = run_calc(monkeypatch, capsys, inputs + ['exit'])
+    assert actual.strip().endswith(f'{expected}\n\nExiting calculator. Goodbye!')
+
+'''
+----------------------------------------------------------------
+Output sinks
+----------------------------------------------------------------
+'''
+
+SINK_INPUTS = ['add 1 2', 'divide 1 0', 'sum 1 2 3', 'eval 2 * 3', 'history', 'exit']
+
+def test_buffered_sink_output(monkeypatch, capsys):
+
+    # A buffered session shows exactly what a terminal session shows, written out in one go when the calculator exits
+    expected = run_calc(monkeypatch, capsys, SINK_INPUTS)
+    monkeypatch.setattr('builtins.input', None)
+    stream = StringIO()
+    with pytest.raises(SystemExit):
+        Calculator(sink=BufferedSink(stream, source=StringIO('\n'.join(SINK_INPUTS) + '\n'))).run()
+    assert stream.getvalue().replace('>> ', '') == expected
+
+@pytest.mark.parametrize('error_input, message', [('', 'EOF detected.'), (None, 'Keyboard interrupt detected.')], ids=['buffered_eof', 'buffered_interrupt'])
+def test_buffered_sink_flushed_on_exit(error_input, message):
+
+    class Source:
+
+        lines = iter(['add 1 2\n'])
+
+        def readline(self):
+            for line in self.lines:
+                return line
+            if error_input is None:
+                raise KeyboardInterrupt
+            return error_input
+
+    stream = StringIO()
+    with pytest.raises(SystemExit):
+        Calculator(sink=BufferedSink(stream, source=Source())).run()
+    assert 'Result: AddCalculation: 1.0 Add 2.0 = 3.0' in stream.getvalue()
+    assert message in stream.getvalue()
+
+def test_buffered_sink_flushed_on_error(monkeypatch):
+
+    # An unexpected error ends the session, but the output buffered before it is still written out
+    def fail(*args):
+        raise RuntimeError('history is broken')
+
+    monkeypatch.setattr(History, 'append', fail)
+    stream = StringIO()
+    with pytest.raises(RuntimeError, match='history is broken'):
+        Calculator(sink=BufferedSink(stream, source=StringIO('add 1 2\n'))).run()
+    assert stream.getvalue().endswith('>> Result: AddCalculation: 1.0 Add 2.0 = 3.0\n\n')
+
+def test_memory_sink_output(monkeypatch):
+
+    inputs = iter(['add 1 2', 'exit'])
+    monkeypatch.setattr('builtins.input', lambda _: next(inputs))
+    sink = MemorySink()
+    with pytest.raises(SystemExit):
+        Calculator(sink=sink).run()
+    assert sink.getvalue().endswith('>> Result: AddCalculation: 1.0 Add 2.0 = 3.0\n\n>> Exiting calculator. Goodbye!\n')
+
+def test_quiet_sink_results(monkeypatch, capsys):
+
+    inputs = iter(SINK_INPUTS)
+    monkeypatch.setattr('builtins.input', lambda _: next(inputs))
+    sink = QuietSink()
+    with pytest.raises(SystemExit):
+        Calculator(sink=sink).run()
+    assert sink.results == ['AddCalculation: 1.0 Add 2.0 = 3.0', 'sum = 6.0', '6.0']
+    assert capsys.readouterr().out == ''
+
 '''
 ----------------------------------------------------------------
 Exit
@@ -358,3 +759,286 @@ def test_eof_error(monkeypatch, capsys):
     out = capsys.readouterr().out
     assert 'EOF detected. Exiting calculator. Goodbye!' in out
     assert error_info.value.code == 0
+
+'''
+----------------------------------------------------------------
+Stats
+----------------------------------------------------------------
+'''
+
+@pytest.mark.parametrize(
+    'inputs, expected',
+    [
+        (['stats'], "Stage timing is disabled. Type 'stats on' to enable it."),
+        (['stats on', 'stats'], 'Stage timing enabled.\nNo calculations timed yet.'),
+        (['stats on', 'stats on', 'stats off', 'stats json'], "Stage timing enabled.\nStage timing enabled.\nStage timing disabled.\nStage timing is disabled. Type 'stats on' to enable it."),
+        (['stats on', 'add 1 2', 'stats reset', 'stats'], 'Stage timing enabled.\nResult: AddCalculation: 1.0 Add 2.0 = 3.0\n\nStage timing reset.\nNo calculations timed yet.'),
+        (['stats on', 'stats json x y'], "Stage timing enabled.\nInvalid stats command. Use 'stats', 'stats on', 'stats off', 'stats reset', 'stats json [FILE]' or 'stats prometheus [FILE]'."),
+    ],
+    ids=[
+        'stats_disabled',
+        'stats_nothing_timed',
+        'stats_off',
+        'stats_reset',
+        'stats_invalid_command',
+    ]
+)
+def test_stats_commands(monkeypatch, capsys, inputs, expected):
+
+    actual = run_calc(monkeypatch, capsys, inputs + ['exit'])
+    check_result(actual, expected)
+
+def test_stats_table(monkeypatch, capsys):
+
+    # Every stage of every successful calculation is timed, per operation
+    actual = run_calc(monkeypatch, capsys, ['stats on', 'add 1 2', 'ADD 2 3', 'divide 1 2', 'stats', 'exit'])
+    table = actual.split('Result: DivideCalculation: 1.0 Divide 2.0 = 0.5\n\n')[1].splitlines()
+    assert table[0].split() == ['stage', 'operation', 'count', 'mean', 'us', 'p50', 'us', 'p99', 'us', 'max', 'us']
+    assert [row.split()[:3] for row in table[2:-1]] == [
+        [stage, operation, count]
+        for stage in ('input', 'parse', 'create', 'execute', 'format', 'output', 'history')
+        for operation, count in (('add', '2'), ('divide', '1'))
+    ]
+
+def test_stats_errors(monkeypatch, capsys):
+
+    # Failed calculations are counted per stage, and not timed
+    actual = run_calc(monkeypatch, capsys, ['stats on', 'add 1', 'add 1 x', 'modulo 1 2', 'divide 1 0', 'stats prometheus', 'exit'])
+    assert '''
+# HELP calculator_stage_latency_seconds Time spent in each stage of a REPL calculation.
+# TYPE calculator_stage_latency_seconds summary
+# TYPE calculator_errors_total counter
+calculator_errors_total{stage="create"} 1
+calculator_errors_total{stage="execute"} 1
+calculator_errors_total{stage="parse"} 2
+'''.strip() in actual
+
+@patch('app.calculation.AddCalculation.execute')
+def test_stats_unexpected_error(mock, monkeypatch, capsys):
+
+    mock.side_effect = Exception('Unexpected error')
+    actual = run_calc(monkeypatch, capsys, ['stats on', 'add 1 2', 'stats json', 'exit'])
+    assert '"name": "errors",\n      "label": "execute",\n      "value": 1' in actual
+
+@pytest.mark.parametrize(
+    'export, start',
+    [
+        ('json', '{\n  "stages": [\n    {\n      "stage": "input",\n      "operation": "add",\n      "count": 1,'),
+        ('prometheus', '# HELP calculator_stage_latency_seconds'),
+    ],
+    ids=['stats_json_file', 'stats_prometheus_file']
+)
+def test_stats_export_file(monkeypatch, capsys, tmp_path, export, start):
+
+    path = tmp_path / f'stats.{export}'
+    actual = run_calc(monkeypatch, capsys, ['stats on', 'add 1 2', f'stats {export} {path}', 'exit'])
+    assert f'Stage timing written to {path}.' in actual
+    assert path.read_text().startswith(start)
+
+def test_stats_export_file_error(monkeypatch, capsys, tmp_path):
+
+    path = tmp_path / 'missing' / 'stats.json'
+    actual = run_calc(monkeypatch, capsys, ['stats on', f'stats json {path}', 'exit'])
+    assert f'Could not write {path}: No such file or directory.' in actual
+
+'''
+----------------------------------------------------------------
+Numeric backends
+----------------------------------------------------------------
+'''
+
+@pytest.mark.parametrize(
+    'inputs, expected',
+    [
+        (['backend'], 'Numeric backend: float'),
+        (['backend fraction', 'divide 1 3', 'add 0.1 0.2', 'backend'], 'Numeric backend set to fraction.\nResult: DivideCalculation: 1 Divide 3 = 1/3\n\nResult: AddCalculation: 1/10 Add 1/5 = 3/10\n\nNumeric backend: fraction'),
+        (['backend int', 'multiply 12345678901234567 100000000001'], 'Numeric backend set to int.\nResult: MultiplyCalculation: 12345678901234567 Multiply 100000000001 = 1234567890135802378901234567\n'),
+        (['backend decimal:4', 'divide 2 3', 'eval x / 3 where x=1'], 'Numeric backend set to decimal:4.\nResult: DivideCalculation: 2 Divide 3 = 0.6667\n\nResult: 0.3333\n'),
+        (['backend fixed', 'multiply 19.99 3'], 'Numeric backend set to fixed.\nResult: MultiplyCalculation: 19.99 Multiply 3.00 = 59.97\n'),
+        (['backend int', 'add 1.5 2'], "Numeric backend set to int.\nInvalid input. Please follow the format: <operation> <num1> <num2>\nType 'help' for more information.\n"),
+        (['backend quaternion'], "Unsupported numeric backend: 'quaternion'. Available backends: float, int, fraction, decimal, fixed"),
+        (['backend int fraction'], "Invalid backend command. Use 'backend' or 'backend NAME'."),
+        (['x = 0.1', 'backend decimal', 'y = add x 0.2'], 'x = 0.1\n\nNumeric backend set to decimal.\ny = add x 0.2 = 0.3\n'),
+        (['x = 0.5', 'backend int'], "x = 0.5\n\nCannot switch to the int backend: it cannot read '0.5' in cell 'x'."),
+    ],
+    ids=[
+        'backend_show',
+        'backend_fraction',
+        'backend_int',
+        'backend_decimal',
+        'backend_fixed',
+        'backend_int_invalid_number',
+        'backend_unknown',
+        'backend_invalid_command',
+        'backend_workbook_parsed_again',
+        'backend_workbook_unreadable',
+    ]
+)
+def test_backend_commands(monkeypatch, capsys, inputs, expected):
+
+    actual = run_calc(monkeypatch, capsys, inputs + ['exit'])
+    check_result(actual, expected)
+
+def test_backend_history(monkeypatch, capsys):
+
+    # The history keeps numbers as doubles, whatever the backend
+    actual = run_calc(monkeypatch, capsys, ['backend fraction', 'divide 1 4', 'history', 'exit'])
+    check_result(actual, 'Numeric backend set to fraction.\nResult: DivideCalculation: 1 Divide 4 = 1/4\n\nCalculation History:\n1. DivideCalculation: 1.0 Divide 4.0 = 0.25')
+
+'''
+----------------------------------------------------------------
+Reductions
+----------------------------------------------------------------
+'''
+
+@pytest.mark.parametrize(
+    'inputs, expected',
+    [
+        (['sum 1 2 3.5'], 'Result: sum = 6.5'),
+        (['sum 1e100 1 -1e100'], 'Result: sum = 1.0'),
+        (['product 2 3 4'], 'Result: product = 24.0'),
+        (['mean 1 2 3 4'], 'Result: mean = 2.5'),
+        (['scan 1 2 3'], 'Result: scan of 3 numbers = 1.0, 3.0, 6.0'),
+        (['sum 1e308 1e308'], 'Result: sum = inf'),
+        (['mean 1e308 1e308'], 'Result: mean = inf'),
+        (['scan 1e308 1e308 -1e308'], 'Result: scan of 3 numbers = 1e+308, inf, 1e+308'),
+        (['sum'], "Invalid input. Please follow the format: sum <num1> <num2> ... or sum from FILE\nType 'help' for more information."),
+        (['mean 1 two'], "Invalid input. Please follow the format: mean <num1> <num2> ... or mean from FILE\nType 'help' for more information."),
+    ],
+    ids=[
+        'reduce_sum',
+        'reduce_sum_exact',
+        'reduce_product',
+        'reduce_mean',
+        'reduce_scan',
+        'reduce_sum_overflow',
+        'reduce_mean_overflow',
+        'reduce_scan_overflow',
+        'reduce_no_numbers',
+        'reduce_invalid_number',
+    ]
+)
+def test_reductions(monkeypatch, capsys, inputs, expected):
+
+    # Reductions take any count of numbers, and are not added to the history
+    actual = run_calc(monkeypatch, capsys, inputs + ['history', 'exit'])
+    check_result(actual, expected + '\n\nNo calculations performed yet.')
+
+def test_reduction_from_file(monkeypatch, capsys, tmp_path):
+
+    path = tmp_path / 'numbers.txt'
+    path.write_text('1 2\n\n3\n4 x\n')
+    actual = run_calc(monkeypatch, capsys, [f'sum from {path}', f'scan from {path}', 'exit'])
+    check_result(actual, "line 4: Invalid number: 'x'\nType 'help' for more information.\n\nline 4: Invalid number: 'x'\nType 'help' for more information.\n")
+
+    path.write_text('1 2\n\n3\n')
+    actual = run_calc(monkeypatch, capsys, [f'mean from {path}', f'scan from {path}', f'sum from {tmp_path / "missing.txt"}', 'exit'])
+    check_result(actual, f'Result: mean = 2.0\n\nResult: scan of 3 numbers = 1.0, 3.0, 6.0\n\nCould not read {tmp_path / "missing.txt"}: No such file or directory.')
+
+    # A file is reduced shard by shard, as by --reduce with any number of workers
+    path.write_text(''.join(f'{1 + i / 7919}\n' for i in range(3000)))
+    out = StringIO()
+    assert reduce_main('product', str(path), workers=2, out=out) == 0
+    actual = run_calc(monkeypatch, capsys, [f'product from {path}', 'exit'])
+    check_result(actual, f'Result: product = {out.getvalue().strip()}\n')
+
+'''
+----------------------------------------------------------------
+Cache
+----------------------------------------------------------------
+'''
+
+def test_cache_disabled(monkeypatch, capsys):
+
+    actual = run_calc(monkeypatch, capsys, ['cache', 'exit'])
+    check_result(actual, "Result cache is disabled. Type 'cache on' to enable it.")
+
+def test_cache_statistics(monkeypatch, capsys):
+
+    actual = run_calc(monkeypatch, capsys, ['cache on 8', 'add 1 2', 'add 1 2', 'cache', 'cache off', 'exit'])
+    expected = '''
+Result cache enabled (size 8).
+Result: AddCalculation: 1.0 Add 2.0 = 3.0
+
+Result: AddCalculation: 1.0 Add 2.0 = 3.0
+
+Result Cache:
+    hits       : 1
+    misses     : 1
+    hit rate   : 50.0%
+    evictions  : 0
+    rejections : 0
+    size       : 1/8
+Result cache disabled.
+'''.strip()
+    check_result(actual, expected)
+
+@pytest.mark.parametrize(
+    'inputs, expected',
+    [
+        (['cache on', 'exit'], 'Result cache enabled (size 1024).'),
+        (['cache on many', 'exit'], 'Invalid cache size. Please enter a positive whole number.'),
+        (['cache on 0', 'exit'], 'Invalid cache size. Please enter a positive whole number.'),
+        (['cache clear', 'exit'], "Invalid cache command. Use 'cache', 'cache on [SIZE]' or 'cache off'."),
+        (['cache on 8 16', 'exit'], "Invalid cache command. Use 'cache', 'cache on [SIZE]' or 'cache off'."),
+    ],
+    ids=[
+        'cache_on_default_size',
+        'cache_on_invalid_size',
+        'cache_on_zero_size',
+        'cache_unknown_command',
+        'cache_on_too_many_arguments',
+    ]
+)
+def test_cache_commands(monkeypatch, capsys, inputs, expected):
+
+    actual = run_calc(monkeypatch, capsys, inputs)
+    check_result(actual, expected)
+
+'''
+----------------------------------------------------------------
+Expressions
+----------------------------------------------------------------
+'''
+
+@pytest.mark.parametrize(
+    'inputs, expected',
+    [
+        (['eval 1 + 2 * 3', 'exit'], 'Result: 7.0\n'),
+        (['eval 2 * (x + 1) / y where x=3 y=4', 'exit'], 'Result: 2.0\n'),
+        (['eval add(x, multiply(x, 2)) where x=2', 'eval add(x, multiply(x, 2)) where x=5', 'exit'], 'Result: 6.0\n\nResult: 15.0\n'),
+        (['eval x / (y - 2) where x=1 y=2', 'exit'], 'Cannot divide by zero.\n'),
+        (['eval 1 +', 'exit'], "Invalid expression: unexpected end of expression.\nType 'help' for more information.\n"),
+        (['eval x where y', 'exit'], "Invalid variable binding: 'y'. Please use NAME=VALUE.\nType 'help' for more information.\n"),
+        (['eval x where x=abc', 'exit'], "Invalid value for variable 'x': 'abc'.\nType 'help' for more information.\n"),
+        (['eval x + y where x=1', 'exit'], "Missing value for variable 'y'.\nType 'help' for more information.\n"),
+        (['eval ' + ' + '.join(['x'] * 1000) + ' where x=1', 'exit'], 'Result: 1000.0\n'),
+        (['eval ' + '(' * 1000 + '1' + ')' * 1000, 'exit'], "Invalid expression: nested more than 100 levels deep.\nType 'help' for more information.\n"),
+    ],
+    ids=[
+        'eval_constant_expression',
+        'eval_with_variables',
+        'eval_repeated_formula',
+        'eval_division_by_zero',
+        'eval_invalid_expression',
+        'eval_invalid_binding',
+        'eval_invalid_binding_value',
+        'eval_missing_variable',
+        'eval_long_expression',
+        'eval_deeply_nested',
+    ]
+)
+def test_eval(monkeypatch, capsys, inputs, expected):
+
+    actual = run_calc(monkeypatch, capsys, inputs)
+    check_result(actual, expected)
+
+@pytest.mark.parametrize('error', [RecursionError, SyntaxError])
+def test_eval_too_complex(monkeypatch, capsys, error):
+
+    # Any expression the parser or the Python compiler cannot cope with is reported, and the REPL carries on
+    def compile_expression(source):
+        raise error
+    monkeypatch.setattr('app.calculator.compile_expression', compile_expression)
+    actual = run_calc(monkeypatch, capsys, ['eval 1 + 2', 'exit'])
+    check_result(actual, "Invalid expression: the expression is too long or nested too deeply.\nType 'help' for more information.\n")
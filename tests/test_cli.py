@@ -0,0 +1,56 @@
+import pytest
+
+from app.calculation import AddCalculation, CalculationFactory
+from app.cli import one_shot_main
+
+# These tests verify the one-shot mode: python main.py <operation> <num1> <num2>
+
+@pytest.mark.parametrize(
+    'argv, expected',
+    [
+        (['add', '3', '4'], '7.0'),
+        (['subtract', '3', '4'], '-1.0'),
+        (['MULTIPLY', '2.5', '4'], '10.0'),
+        (['divide', '1', '4'], '0.25'),
+    ],
+    ids=[
+        'one_shot_add',
+        'one_shot_subtract',
+        'one_shot_case_insensitive',
+        'one_shot_divide',
+    ]
+)
+def test_one_shot(capsys, argv, expected):
+
+    # Only the result is printed
+    assert one_shot_main(argv) == 0
+    assert capsys.readouterr().out == f'{expected}\n'
+
+@pytest.mark.parametrize(
+    'argv, status, error',
+    [
+        (['divide', '1', '0'], 1, 'Cannot divide by zero.'),
+        (['add', '1'], 2, 'Usage: main.py <operation> <num1> <num2>'),
+        (['add', '1', 'x'], 2, 'Invalid input. Please follow the format: <operation> <num1> <num2>'),
+        (['modulo', '1', '2'], 2, "Unsupported calculation type: 'modulo'. Available types: add, divide, multiply, subtract"),
+    ],
+    ids=[
+        'one_shot_division_by_zero',
+        'one_shot_wrong_number_of_inputs',
+        'one_shot_invalid_number',
+        'one_shot_unknown_operation',
+    ]
+)
+def test_one_shot_errors(capsys, argv, status, error):
+
+    assert one_shot_main(argv) == status
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert captured.err == f'{error}\n'
+
+def test_one_shot_registered_operation(capsys):
+
+    # Operations that are not built in are looked up in the CalculationFactory registry
+    CalculationFactory.register_calculation('plus')(type('PlusCalculation', (AddCalculation,), {}))
+    assert one_shot_main(['plus', '1', '2']) == 0
+    assert capsys.readouterr().out == '3.0\n'
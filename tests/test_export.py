@@ -0,0 +1,179 @@
+import math
+import pytest
+import tracemalloc
+
+from app.calculation import AddCalculation, DivideCalculation, MultiplyCalculation, SubtractCalculation
+from app.export import export_history, file_chunks, format_for, history_chunks, import_history
+from app.history import History, PersistentHistory
+
+# These tests verify streaming history export and import in the csv, jsonl and bin formats.
+
+ENTRIES = [
+    (AddCalculation, 3.0, 4.0, 7.0, 1.0),
+    (SubtractCalculation, 0.1, 0.2, 0.1 - 0.2, 2.5),
+    (MultiplyCalculation, 1e300, 1e300, math.inf, 3.0),
+    (DivideCalculation, 1.0, 3.0, 1 / 3, 1700000000.123456),
+    (AddCalculation, -0.0, 5e-324, 5e-324, 5.0),
+]
+
+def make_history(history=None):
+
+    history = History() if history is None else history
+    history.extend(ENTRIES)
+    return history
+
+def entries_of(history):
+
+    return [entry for chunk in history_chunks(history, 2) for entry in chunk]
+
+@pytest.mark.parametrize('file_format', ['csv', 'jsonl', 'bin'])
+@pytest.mark.parametrize('persistent', [False, True], ids=['memory', 'persistent'])
+def test_export_import_round_trip(tmp_path, file_format, persistent):
+
+    # Every number comes back exactly, whichever history store and format is used
+    source = make_history(PersistentHistory(tmp_path / 'source.bin') if persistent else None)
+    path = str(tmp_path / f'history.{file_format}')
+    assert export_history(source, path, chunk_size=2) == 5
+
+    target = History()
+    target.append(AddCalculation(1.0, 1.0), timestamp=0.0)
+    assert import_history(target, path, chunk_size=2) == 5
+    assert entries_of(target) == [(AddCalculation, 1.0, 1.0, 2.0, 0.0)] + ENTRIES
+    assert target.statistics().count == 6
+    source.close()
+
+def test_export_replaces_file(tmp_path):
+
+    path = str(tmp_path / 'history.bin')
+    export_history(make_history(), path)
+    export_history(History(), path)
+    assert import_history(History(), path) == 0
+
+def test_export_formats(tmp_path):
+
+    history = History()
+    history.extend(ENTRIES[:1])
+    export_history(history, str(tmp_path / 'history.csv'))
+    export_history(history, str(tmp_path / 'history.txt'), 'jsonl')
+    assert (tmp_path / 'history.csv').read_bytes().decode() == 'operation,a,b,result,timestamp\r\nadd,3.0,4.0,7.0,1.0\r\n'
+    assert (tmp_path / 'history.txt').read_text() == '{"operation": "add", "a": 3.0, "b": 4.0, "result": 7.0, "timestamp": 1.0}\n'
+
+@pytest.mark.parametrize(
+    'path, file_format, expected',
+    [
+        ('history.jsonl', None, 'jsonl'),
+        ('HISTORY.BIN', None, 'bin'),
+        ('history.txt', None, 'csv'),
+        ('history', None, 'csv'),
+        ('history.csv', 'bin', 'bin'),
+    ],
+    ids=['jsonl_extension', 'bin_extension', 'other_extension', 'no_extension', 'explicit']
+)
+def test_format_for(path, file_format, expected):
+
+    assert format_for(path, file_format) == expected
+
+def test_format_for_unknown():
+
+    with pytest.raises(ValueError, match="Unknown format: 'xml'. Use one of: csv, jsonl, bin."):
+        format_for('history.xml', 'xml')
+
+def test_import_creates_no_calculations(tmp_path, monkeypatch):
+
+    path = str(tmp_path / 'history.jsonl')
+    export_history(make_history(), path)
+    monkeypatch.setattr(AddCalculation, '__init__', None)
+    assert import_history(History(), path) == 5
+
+@pytest.mark.parametrize(
+    'name, content, message',
+    [
+        ('bad.csv', 'a,b\n', "'{path}' is not a history export: the first line must be operation,a,b,result,timestamp."),
+        ('empty.csv', '', "'{path}' is not a history export: the first line must be operation,a,b,result,timestamp."),
+        ('bad.csv', 'operation,a,b,result,timestamp\nadd,1,2,3,4\nadd,1,x,3,4\n', "Invalid entry on line 3 of '{path}'."),
+        ('bad.csv', 'operation,a,b,result,timestamp\nadd,1,2,3\n', "Invalid entry on line 2 of '{path}'."),
+        ('bad.csv', 'operation,a,b,result,timestamp\npower,1,2,3,4\n', "Invalid entry on line 2 of '{path}'."),
+        ('bad.jsonl', '{"operation": "add", "a": 1, "b": 2, "result": 3, "timestamp": 4}\n\nnot json\n', "Invalid entry on line 3 of '{path}'."),
+        ('bad.jsonl', '{"operation": "add", "a": 1}\n', "Invalid entry on line 1 of '{path}'."),
+        ('bad.jsonl', '[1, 2]\n', "Invalid entry on line 1 of '{path}'."),
+        ('bad.bin', 'short', "'{path}' is not a calculator history file."),
+        ('bad.bin', 'x' * 5000, "'{path}' is not a calculator history file."),
+    ],
+    ids=[
+        'csv_wrong_header',
+        'csv_empty',
+        'csv_bad_number',
+        'csv_missing_field',
+        'csv_unknown_operation',
+        'jsonl_not_json',
+        'jsonl_missing_field',
+        'jsonl_not_object',
+        'bin_too_short',
+        'bin_bad_magic',
+    ]
+)
+def test_import_invalid_file(tmp_path, name, content, message):
+
+    path = tmp_path / name
+    path.write_text(content)
+    with pytest.raises(ValueError) as error_info:
+        import_history(History(), str(path))
+    assert str(error_info.value) == message.format(path=path)
+
+def test_import_blank_lines(tmp_path):
+
+    path = tmp_path / 'history.csv'
+    path.write_text('operation,a,b,result,timestamp\n\nadd,1,2,3,4\n\n')
+    history = History()
+    assert import_history(history, str(path)) == 1
+    assert history.record(0) == (0, 1.0, 2.0, 3.0, 4.0)
+
+def test_own_history_file(tmp_path):
+
+    # A persistent history cannot be exported over, or imported from, its own file
+    path = tmp_path / 'history.bin'
+    with PersistentHistory(path) as history:
+        make_history(history)
+        for transfer in (export_history, import_history):
+            with pytest.raises(ValueError, match='is the file this history is kept in.'):
+                transfer(history, str(path))
+        assert len(history) == 5
+
+def test_file_chunks(tmp_path):
+
+    path = str(tmp_path / 'history.bin')
+    export_history(make_history(), path)
+    assert [len(chunk) for chunk in file_chunks(path, chunk_size=2)] == [2, 2, 1]
+
+@pytest.mark.parametrize('file_format', ['csv', 'jsonl', 'bin'])
+def test_export_import_constant_memory(tmp_path, file_format):
+
+    # Peak memory while exporting or importing depends on the chunk size, not on the number of entries
+    history = History()
+    for _ in range(4000):
+        history.extend(ENTRIES)
+    path = str(tmp_path / f'history.{file_format}')
+
+    def peak(function):
+        tracemalloc.start()
+        try:
+            function()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    small = History()
+    small.extend(ENTRIES * 400)
+    small_peak = peak(lambda: export_history(small, path, chunk_size=500))
+    assert peak(lambda: export_history(history, path, chunk_size=500)) < 2 * small_peak + 100_000
+
+    class Counter:
+
+        count = 0
+
+        def extend(self, entries):
+            self.count += len(entries)
+
+    counter = Counter()
+    assert peak(lambda: import_history(counter, path, chunk_size=500)) < 2 * small_peak + 100_000
+    assert counter.count == 20000
@@ -0,0 +1,232 @@
+import math
+import pytest
+
+from unittest.mock import patch
+
+from app.calculation import AddCalculation, Calculation, CalculationFactory, DivideCalculation
+from app.expression import (
+    MAX_DEPTH, Apply, CompiledExpression, Constant, Variable, compile_expression, evaluate_expression, expression_cache_stats, parse_expression, tokenize,
+)
+from app.operation import Operation
+
+# These tests verify the expression parser, constant folding, the compiler and the compiled-expression cache.
+
+@pytest.mark.parametrize(
+    'source, expected',
+    [
+        ('1 + 2 * 3', 7.0),
+        ('(1 + 2) * 3', 9.0),
+        ('10 - 4 - 3', 3.0),
+        ('24 / 4 / 2', 3.0),
+        ('-2 * -3', 6.0),
+        ('+2 - -3', 5.0),
+        ('1.5e2 + .5', 150.5),
+        ('add(1, multiply(2, 3))', 7.0),
+        ('SUBTRACT(10, 4) / 2', 3.0),
+    ],
+    ids=[
+        'expression_precedence',
+        'expression_parentheses',
+        'expression_left_associative_subtraction',
+        'expression_left_associative_division',
+        'expression_unary_minus',
+        'expression_unary_plus',
+        'expression_number_formats',
+        'expression_calculation_calls',
+        'expression_calculation_call_mixed_case',
+    ]
+)
+def test_constant_expressions(source, expected):
+
+    assert evaluate_expression(source) == expected
+
+def test_constant_folding():
+
+    # Constant subexpressions are folded away, and the rest is built from the registered Calculation types
+    tree = parse_expression('x * (2 + 3) - 8 / 4')
+    assert repr(tree) == "Apply(SubtractCalculation, Apply(MultiplyCalculation, Variable('x'), Constant(5.0)), Constant(2.0))"
+    assert isinstance(tree, Apply)
+    assert isinstance(tree.right, Constant)
+    assert isinstance(tree.left.left, Variable)
+
+def test_negative_zero():
+
+    assert math.copysign(1, evaluate_expression('-0')) == -1
+    assert math.copysign(1, evaluate_expression('-x', x=0.0)) == -1
+
+def test_division_by_zero_is_not_folded():
+
+    # A fold that fails is left for evaluation time
+    tree = parse_expression('1 / 0')
+    assert isinstance(tree, Apply)
+    assert tree.calculation_class is DivideCalculation
+    with pytest.raises(ZeroDivisionError):
+        evaluate_expression('1 / 0')
+    with pytest.raises(ZeroDivisionError):
+        evaluate_expression('x / (y - 2)', x=1, y=2)
+
+@pytest.mark.parametrize(
+    'source, message',
+    [
+        ('', 'Invalid expression: the expression is empty.'),
+        ('   ', 'Invalid expression: the expression is empty.'),
+        ('1 +', 'Invalid expression: unexpected end of expression.'),
+        ('(1 + 2', 'Invalid expression: unexpected end of expression.'),
+        ('2x', "Invalid expression: unexpected 'x' at position 1."),
+        ('1 % 2', "Invalid expression: unexpected '%' at position 2."),
+        (') + 1', "Invalid expression: unexpected ')' at position 0."),
+        ('add(1 2)', "Invalid expression: unexpected '2' at position 6."),
+        ('add(1, 2, 3)', "Invalid expression: unexpected ',' at position 8."),
+        ('max(1, 2)', "Unsupported calculation type: 'max'. Available types: add, divide, multiply, subtract"),
+    ],
+    ids=[
+        'expression_empty',
+        'expression_blank',
+        'expression_missing_operand',
+        'expression_unclosed_parenthesis',
+        'expression_implicit_multiplication',
+        'expression_unknown_symbol',
+        'expression_unexpected_parenthesis',
+        'expression_call_missing_comma',
+        'expression_call_too_many_arguments',
+        'expression_call_unknown_operation',
+    ]
+)
+def test_invalid_expressions(source, message):
+
+    with pytest.raises(ValueError) as error_info:
+        parse_expression(source)
+    assert str(error_info.value) == message
+
+def test_long_expression():
+
+    # A long flat expression compiles to one statement per operation, not to thousands of nested calls
+    compiled = compile_expression(' + '.join(['x'] * 5000))
+    assert compiled(x=1.0) == 5000.0
+    assert evaluate_expression(' - '.join(['x'] * 3000) + ' * y', x=2.0, y=0.5) == 2.0 - 2999 * 2.0 + 1.0
+
+def test_long_unary_minus():
+
+    # Signs are read in a loop, so a long run of them does not recurse
+    assert evaluate_expression('-' * 5000 + 'x', x=3.0) == 3.0
+    assert evaluate_expression('-' * 5001 + '2') == -2.0
+
+def test_deep_nesting():
+
+    assert evaluate_expression('(' * MAX_DEPTH + 'x + 1' + ')' * MAX_DEPTH, x=1.0) == 2.0
+    assert evaluate_expression('add(' * MAX_DEPTH + 'x' + ', 1)' * MAX_DEPTH, x=0.0) == MAX_DEPTH
+    with pytest.raises(ValueError, match=f'Invalid expression: nested more than {MAX_DEPTH} levels deep.'):
+        parse_expression('(' * (MAX_DEPTH + 1) + '1' + ')' * (MAX_DEPTH + 1))
+    with pytest.raises(ValueError, match=f'Invalid expression: nested more than {MAX_DEPTH} levels deep.'):
+        parse_expression('(' * 100_000)
+
+def test_tokenize():
+
+    assert tokenize(' add(x1, 2.5)') == [
+        ('name', 'add', 1),
+        ('symbol', '(', 4),
+        ('name', 'x1', 5),
+        ('symbol', ',', 7),
+        ('number', '2.5', 9),
+        ('symbol', ')', 12),
+    ]
+
+def test_compiled_expression_bindings():
+
+    compiled = compile_expression('2 * (x + 1) / y')
+    assert isinstance(compiled, CompiledExpression)
+    assert compiled.variables == ('x', 'y')
+    assert compiled(x=3, y=4) == 2.0
+    assert compiled(3, 4) == 2.0
+    assert compiled(3, y=4) == 2.0
+    assert compiled(x=3, y=4, z=5) == 2.0
+    assert repr(compiled) == "CompiledExpression('2 * (x + 1) / y')"
+
+    # A variable used more than once is still a single parameter
+    assert compile_expression('x * x + x').variables == ('x',)
+    assert evaluate_expression('x * x + x', x=3) == 12.0
+
+@pytest.mark.parametrize(
+    'args, bindings, message',
+    [
+        ((), {'x': 1}, "Missing value for variable 'y'."),
+        ((1,), {}, "Missing value for variable 'y'."),
+        ((1, 2, 3), {}, 'Expected 2 values but got 3.'),
+    ],
+    ids=[
+        'compiled_missing_keyword',
+        'compiled_missing_positional',
+        'compiled_too_many_values',
+    ]
+)
+def test_compiled_expression_invalid_bindings(args, bindings, message):
+
+    with pytest.raises(ValueError) as error_info:
+        compile_expression('x + y')(*args, **bindings)
+    assert str(error_info.value) == message
+
+def test_variable_names_are_safe():
+
+    # Variables named like Python keywords or like the generated names still work
+    assert evaluate_expression('lambda + _c0 * _f0', **{'lambda': 1, '_c0': 2, '_f0': 3}) == 7.0
+
+@patch.object(Operation, 'multiplication')
+def test_compiled_expression_calls_operations_directly(mock):
+
+    # Evaluation calls the Operation function itself, without creating Calculation objects
+    mock.return_value = 42.0
+    with patch.object(Calculation, '__init__') as init:
+        assert compile_expression('x * y')(x=6, y=7) == 42.0
+        init.assert_not_called()
+    mock.assert_called_once_with(6, 7)
+
+def test_compiled_expression_cache():
+
+    # A repeated formula with different values is served from the cache without parsing again
+    source = 'a * 3 + b * 5 + 0.25'
+    compiled = compile_expression(source)
+    hits = expression_cache_stats()['hits']
+    with patch('app.expression._Parser') as parser:
+        assert compile_expression(source) is compiled
+        assert compile_expression(source)(a=1, b=2) == 13.25
+        parser.assert_not_called()
+    assert expression_cache_stats()['hits'] == hits + 2
+
+def test_compiled_expression_cache_registry_change():
+
+    # Changing the registry makes cached expressions compile again against the new registry
+    compiled = compile_expression('add(p, q)')
+
+    @CalculationFactory.register_calculation('power')
+    class PowerCalculation(AddCalculation):
+
+        __slots__ = ()
+
+        @classmethod
+        def operation(cls):
+            return lambda a, b: a ** b
+
+    recompiled = compile_expression('add(p, q)')
+    assert recompiled is not compiled
+    assert recompiled(p=1, q=2) == 3.0
+    assert evaluate_expression('power(2, x)', x=10) == 1024.0
+
+def test_expression_backend():
+
+    # Constants are parsed, and cached expressions compiled again, in the current numeric backend
+    assert evaluate_expression('1 / 3 + -x', x=1.0) == 1 / 3 - 1
+    CalculationFactory.set_backend('fraction')
+    backend = CalculationFactory.backend()
+    assert str(evaluate_expression('1 / 3 + -x', x=backend.parse('1'))) == '-2/3'
+    CalculationFactory.set_backend('fixed')
+    assert str(evaluate_expression('0.10 * 3 - x', x=CalculationFactory.backend().parse('0.05'))) == '0.25'
+
+def test_calculation_default_operation():
+
+    # Calculation types that do not override operation() are evaluated by creating and executing a calculation
+    class HalfCalculation(Calculation):
+
+        def execute(self) -> float:
+            return (self.a + self.b) / 2
+
+    assert HalfCalculation.operation()(3, 5) == 4.0
@@ -0,0 +1,694 @@
+import math
+import pytest
+import statistics
+import tracemalloc
+
+from array import array
+
+import app.history
+
+from app.calculation import AddCalculation, CalculationFactory, DivideCalculation, MultiplyCalculation, SubtractCalculation
+from app.history import HEADER_SIZE, RECORD, BaseHistory, BoundedHistory, History, PersistentHistory, RunningStats, parse_limit
+
+# These tests verify the columnar History store used by the Calculator.
+
+def make_history():
+
+    # Build a history with one calculation of each type
+    history = History()
+    history.append(AddCalculation(3.0, 4.0))
+    history.append(SubtractCalculation(3.0, 2.0))
+    history.append(MultiplyCalculation(4.0, 5.0), 20.0)
+    history.append(DivideCalculation(8.0, 2.0), 4.0)
+    return history
+
+def test_history_empty():
+
+    history = History()
+    assert len(history) == 0
+    assert list(history) == []
+    assert list(history.lines()) == []
+
+def test_history_render():
+
+    # Rendering from the columns should match str() of the original calculation
+    history = make_history()
+    assert list(history.lines()) == [
+        'AddCalculation: 3.0 Add 4.0 = 7.0',
+        'SubtractCalculation: 3.0 Subtract 2.0 = 1.0',
+        'MultiplyCalculation: 4.0 Multiply 5.0 = 20.0',
+        'DivideCalculation: 8.0 Divide 2.0 = 4.0',
+    ]
+
+@pytest.mark.parametrize(
+    'start, stop, expected',
+    [
+        (1, 3, ['SubtractCalculation: 3.0 Subtract 2.0 = 1.0', 'MultiplyCalculation: 4.0 Multiply 5.0 = 20.0']),
+        (3, None, ['DivideCalculation: 8.0 Divide 2.0 = 4.0']),
+        (2, 100, ['MultiplyCalculation: 4.0 Multiply 5.0 = 20.0', 'DivideCalculation: 8.0 Divide 2.0 = 4.0']),
+        (10, 20, []),
+    ],
+    ids=[
+        'history_lines_slice',
+        'history_lines_to_end',
+        'history_lines_past_end',
+        'history_lines_out_of_range',
+    ]
+)
+def test_history_lines_part(start, stop, expected):
+
+    assert list(make_history().lines(start, stop)) == expected
+
+@pytest.mark.parametrize(
+    'index, calculation_class, a, b',
+    [
+        (0, AddCalculation, 3.0, 4.0),
+        (3, DivideCalculation, 8.0, 2.0),
+        (-2, MultiplyCalculation, 4.0, 5.0),
+    ],
+    ids=[
+        'history_first_entry',
+        'history_last_entry',
+        'history_negative_index',
+    ]
+)
+def test_history_getitem(index, calculation_class, a, b):
+
+    calc = make_history()[index]
+    assert isinstance(calc, calculation_class)
+    assert calc.a == a
+    assert calc.b == b
+
+def test_history_iter():
+
+    assert [repr(calc) for calc in make_history()] == [
+        'AddCalculation(a=3.0, b=4.0)',
+        'SubtractCalculation(a=3.0, b=2.0)',
+        'MultiplyCalculation(a=4.0, b=5.0)',
+        'DivideCalculation(a=8.0, b=2.0)',
+    ]
+
+def test_history_columns():
+
+    # The columns should be readable through the buffer protocol without copying
+    history = make_history()
+    history.append(AddCalculation(1.0, 1.0))
+    assert history.operation_types == (AddCalculation, SubtractCalculation, MultiplyCalculation, DivideCalculation)
+    assert list(history.op_codes) == [0, 1, 2, 3, 0]
+    assert history.a.tolist() == [3.0, 3.0, 4.0, 8.0, 1.0]
+    assert history.b.tolist() == [4.0, 2.0, 5.0, 2.0, 1.0]
+    assert history.results.tolist() == [7.0, 1.0, 20.0, 4.0, 2.0]
+    assert history.results.format == 'd'
+    assert history.results.readonly
+    assert array('d', history.results.tobytes()) == array('d', [7.0, 1.0, 20.0, 4.0, 2.0])
+
+def test_history_timestamps(monkeypatch):
+
+    # Entries are timestamped when appended, unless a timestamp is given
+    monkeypatch.setattr(app.history.time, 'time', lambda: 1000.0)
+    history = History()
+    history.append(AddCalculation(1.0, 1.0))
+    history.append(AddCalculation(1.0, 2.0), timestamp=5.0)
+    assert history.timestamps.tolist() == [1000.0, 5.0]
+    assert history.record(1) == (0, 1.0, 2.0, 3.0, 5.0)
+
+def test_history_append_while_viewed():
+
+    # An array cannot grow while a view of it is held, so the view has to be released first
+    history = make_history()
+    with history.results as view:
+        with pytest.raises(BufferError):
+            history.append(AddCalculation(1.0, 1.0))
+        assert len(view) == 4
+    history.append(AddCalculation(1.0, 1.0), 2.0)
+    assert history.render(-1) == 'AddCalculation: 1.0 Add 1.0 = 2.0'
+
+def test_history_extend():
+
+    history = make_history()
+    history.extend([(AddCalculation, 1.0, 1.0, 2.0, 5.0), (type('NewCalculation', (AddCalculation,), {}), 2.0, 2.0, 4.0, 6.0)])
+    history.extend([])
+    assert len(history) == 6
+    assert history.render(4) == 'AddCalculation: 1.0 Add 1.0 = 2.0'
+    assert history.record_range(4, 10) == [(0, 1.0, 1.0, 2.0, 5.0), (4, 2.0, 2.0, 4.0, 6.0)]
+    assert history.statistics().total == 38.0
+
+def test_history_clear():
+
+    history = make_history()
+    history.clear()
+    assert len(history) == 0
+
+@pytest.mark.parametrize('persistent', [False, True], ids=['history_exact_backend', 'persistent_history_exact_backend'])
+def test_history_exact_backend_numbers(tmp_path, persistent):
+
+    # The history stores doubles: exact numbers are rounded, and integers beyond the float range are stored as infinity
+    CalculationFactory.set_backend('int')
+    history = PersistentHistory(str(tmp_path / 'history.bin')) if persistent else History()
+    history.append(DivideCalculation(1, 3))
+    history.append(MultiplyCalculation(10 ** 200, -10 ** 200))
+    history.append(AddCalculation(2, 3))
+    assert list(history.lines()) == [
+        'DivideCalculation: 1.0 Divide 3.0 = 0.3333333333333333',
+        'MultiplyCalculation: 1e+200 Multiply -1e+200 = -inf',
+        'AddCalculation: 2.0 Add 3.0 = 5.0',
+    ]
+    history.close()
+
+@pytest.mark.parametrize('persistent', [False, True], ids=['history_extend_huge_numbers', 'persistent_history_extend_huge_numbers'])
+def test_history_extend_huge_numbers(tmp_path, persistent):
+
+    # Like append, extend stores integers beyond the float range as infinity
+    history = PersistentHistory(str(tmp_path / 'history.bin')) if persistent else History()
+    history.extend([(AddCalculation, 1, 2, 3, 1.0), (MultiplyCalculation, 10 ** 200, -10 ** 200, -10 ** 400, 2.0)])
+    history.extend([(AddCalculation, 10 ** 400, 1, 10 ** 400, 3.0)])
+    assert list(history.lines()) == [
+        'AddCalculation: 1.0 Add 2.0 = 3.0',
+        'MultiplyCalculation: 1e+200 Multiply -1e+200 = -inf',
+        'AddCalculation: inf Add 1.0 = inf',
+    ]
+    assert [record[4] for record in history.record_range(0, 3)] == [1.0, 2.0, 3.0]
+    assert history.statistics(MultiplyCalculation).total == -math.inf
+    history.close()
+
+def test_base_history_is_abstract():
+
+    with pytest.raises(TypeError):
+        BaseHistory()
+
+def test_history_too_many_types():
+
+    # Op codes are uint8, so only 256 different calculation types fit
+    history = History()
+    for i in range(256):
+        history.append(type(f'Dummy{i}Calculation', (AddCalculation,), {})(1.0, 2.0))
+    with pytest.raises(ValueError, match='History supports at most 256 different calculation types.'):
+        history.append(type('OneTooManyCalculation', (AddCalculation,), {})(1.0, 2.0))
+    assert len(history) == 256
+
+'''
+----------
+Statistics
+----------
+'''
+
+def test_running_stats():
+
+    values = [1e9 + 4, 1e9 + 7, 1e9 + 13, 1e9 + 16, -3.5]
+    aggregate = RunningStats()
+    assert aggregate.summary() == {'count': 0, 'sum': 0.0, 'mean': 0.0, 'min': None, 'max': None, 'variance': 0.0, 'stdev': 0.0}
+    for value in values:
+        aggregate.add(value)
+    summary = aggregate.summary()
+    assert summary['count'] == 5
+    assert summary['sum'] == sum(values)
+    assert summary['mean'] == pytest.approx(statistics.fmean(values))
+    assert (summary['min'], summary['max']) == (-3.5, 1e9 + 16)
+    assert summary['variance'] == pytest.approx(statistics.pvariance(values))
+    assert summary['stdev'] == pytest.approx(statistics.pstdev(values))
+
+def test_running_stats_no_cancellation():
+
+    # Large numbers close together: a sum of squares would lose the variance entirely
+    aggregate = RunningStats()
+    for value in (1e9 + 4, 1e9 + 7, 1e9 + 13, 1e9 + 16):
+        aggregate.add(value)
+    assert aggregate.variance == 22.5
+
+def test_history_statistics():
+
+    history = make_history()
+    history.append(AddCalculation(1.0, 1.0))
+    results = [7.0, 1.0, 20.0, 4.0, 2.0]
+    assert history.statistics().summary() == pytest.approx({
+        'count': 5, 'sum': 34.0, 'mean': 6.8, 'min': 1.0, 'max': 20.0,
+        'variance': statistics.pvariance(results), 'stdev': statistics.pstdev(results),
+    })
+    by_type = history.statistics_by_type()
+    assert list(by_type) == [AddCalculation, SubtractCalculation, MultiplyCalculation, DivideCalculation]
+    assert (by_type[AddCalculation].count, by_type[AddCalculation].total, by_type[AddCalculation].mean) == (2, 9.0, 4.5)
+    assert history.statistics(AddCalculation) is by_type[AddCalculation]
+    assert history.statistics(type('OtherCalculation', (AddCalculation,), {})).count == 0
+
+    history.clear()
+    assert history.statistics().count == 0
+    assert history.statistics_by_type() == {}
+    history.append(DivideCalculation(1.0, 4.0))
+    assert history.statistics(DivideCalculation).total == 0.25
+
+def test_history_statistics_constant_time(monkeypatch):
+
+    # Queries never read the entries back
+    history = make_history()
+    monkeypatch.setattr(history, 'record', None)
+    assert history.statistics().count == 4
+    assert history.statistics(MultiplyCalculation).max == 20.0
+
+def test_history_statistics_infinite_result(tmp_path):
+
+    # Results beyond the float range are counted as the infinity the history stores
+    CalculationFactory.set_backend('int')
+    history = PersistentHistory(str(tmp_path / 'history.bin'))
+    history.append(MultiplyCalculation(10 ** 200, 10 ** 200))
+    history.append(AddCalculation(2, 3))
+    assert history.statistics().max == math.inf
+    assert history.statistics(AddCalculation).total == 5.0
+    assert isinstance(history.statistics(AddCalculation).total, float)
+    history.close()
+
+def test_calculation_format():
+
+    assert DivideCalculation.format(1, 2, 0.5) == 'DivideCalculation: 1 Divide 2 = 0.5'
+
+'''
+-----------------
+PersistentHistory
+-----------------
+'''
+
+def fill(history):
+
+    # Append one calculation of each type, with fixed timestamps
+    history.append(AddCalculation(3.0, 4.0), timestamp=1.0)
+    history.append(SubtractCalculation(3.0, 2.0), timestamp=2.0)
+    history.append(MultiplyCalculation(4.0, 5.0), 20.0, timestamp=3.0)
+    history.append(DivideCalculation(8.0, 2.0), 4.0, timestamp=4.0)
+
+def test_persistent_history_reopen(tmp_path):
+
+    # Everything appended is there after closing and reopening the file
+    path = tmp_path / 'history.bin'
+    with PersistentHistory(path) as history:
+        assert len(history) == 0
+        fill(history)
+
+    history = PersistentHistory(path)
+    assert len(history) == 4
+    assert list(history.lines()) == list(make_history().lines())
+    assert history.operation_types == (AddCalculation, SubtractCalculation, MultiplyCalculation, DivideCalculation)
+    assert repr(history[-1]) == 'DivideCalculation(a=8.0, b=2.0)'
+    assert history[-1].result == 4.0
+    assert history.record(0) == (0, 3.0, 4.0, 7.0, 1.0)
+
+    # New types can still be added after reopening
+    history.append(AddCalculation(1.0, 1.0), timestamp=5.0)
+    history.close()
+    assert len(PersistentHistory(path)) == 5
+
+def test_persistent_history_statistics(tmp_path):
+
+    # A reopened file's aggregates are built on the first query, from the entries already in it, then kept up to date
+    path = tmp_path / 'history.bin'
+    with PersistentHistory(path) as history:
+        fill(history)
+        assert history.statistics().total == 32.0
+
+    history = PersistentHistory(path)
+    history.append(AddCalculation(1.0, 1.0), timestamp=5.0)
+    assert history.statistics().count == 5
+    assert history.statistics().total == 34.0
+    assert history.statistics(AddCalculation).count == 2
+    history.append(AddCalculation(1.0, 2.0), timestamp=6.0)
+    assert history.statistics(AddCalculation).total == 12.0
+    history.clear()
+    assert history.statistics().count == 0
+    history.close()
+
+def test_persistent_history_columns(tmp_path):
+
+    history = PersistentHistory(tmp_path / 'history.bin')
+    fill(history)
+    assert list(history.op_codes) == [0, 1, 2, 3]
+    assert list(history.a) == [3.0, 3.0, 4.0, 8.0]
+    assert list(history.b) == [4.0, 2.0, 5.0, 2.0]
+    assert list(history.results) == [7.0, 1.0, 20.0, 4.0]
+    assert list(history.timestamps) == [1.0, 2.0, 3.0, 4.0]
+    assert len(history.results) == 4
+    assert history.results[-1] == 4.0
+
+    # The raw records can be read through the buffer protocol without copying
+    with history.records as records:
+        assert records.readonly
+        assert len(records) == 4 * RECORD.size
+        assert RECORD.unpack_from(records, RECORD.size) == (1, 3.0, 2.0, 1.0, 2.0)
+    history.close()
+
+@pytest.mark.parametrize(
+    'index',
+    [4, -5],
+    ids=['persistent_history_index_too_large', 'persistent_history_index_too_small']
+)
+def test_persistent_history_index_error(tmp_path, index):
+
+    history = PersistentHistory(tmp_path / 'history.bin')
+    fill(history)
+    with pytest.raises(IndexError, match='history index out of range'):
+        history[index]
+    with pytest.raises(IndexError):
+        history.results[index]
+    history.close()
+
+def test_persistent_history_group_commit(tmp_path):
+
+    # Entries only become visible in the file once a commit_every-sized group is complete, or on flush
+    path = tmp_path / 'history.bin'
+    history = PersistentHistory(path, commit_every=3, commit_interval=3600)
+    history.append(AddCalculation(1.0, 1.0))
+    history.append(AddCalculation(1.0, 2.0))
+    assert len(PersistentHistory(path)) == 0
+    history.append(AddCalculation(1.0, 3.0))
+    assert len(PersistentHistory(path)) == 3
+
+    history.append(AddCalculation(1.0, 4.0))
+    history.flush()
+    assert len(PersistentHistory(path)) == 4
+    assert PersistentHistory(path).render(3) == 'AddCalculation: 1.0 Add 4.0 = 5.0'
+
+def test_persistent_history_commit_interval(tmp_path):
+
+    # With a commit_interval of 0 every append is committed immediately
+    path = tmp_path / 'history.bin'
+    history = PersistentHistory(path, commit_every=1000, commit_interval=0)
+    history.append(AddCalculation(1.0, 1.0))
+    assert len(PersistentHistory(path)) == 1
+
+def test_persistent_history_crash(tmp_path):
+
+    # An uncommitted entry, even fully written to the file, is not part of the history after a crash
+    path = tmp_path / 'history.bin'
+    history = PersistentHistory(path, commit_every=2, commit_interval=3600)
+    fill(history)
+    history.append(AddCalculation(9.0, 9.0))
+    history._mmap.flush()
+    del history
+
+    reopened = PersistentHistory(path)
+    assert len(reopened) == 4
+    assert reopened.render(-1) == 'DivideCalculation: 8.0 Divide 2.0 = 4.0'
+
+def test_persistent_history_extend(tmp_path, monkeypatch):
+
+    # A bulk load grows the file as often as it needs to, registers new types, and commits like append
+    monkeypatch.setattr(app.history, '_MIN_CAPACITY', RECORD.size * 3)
+    path = tmp_path / 'history.bin'
+    history = PersistentHistory(path, commit_every=5)
+    history.extend([(AddCalculation, float(i), 1.0, i + 1.0, float(i)) for i in range(20)])
+    history.extend([])
+    history.extend([(DivideCalculation, 1.0, 4.0, 0.25, 20.0)])
+    assert len(history) == 21
+    assert history.record_range(19, 30) == [(0, 19.0, 1.0, 20.0, 19.0), (1, 1.0, 4.0, 0.25, 20.0)]
+    assert history.record_range(30, 40) == []
+    assert history.statistics(DivideCalculation).total == 0.25
+    history.close()
+    assert len(PersistentHistory(path)) == 21
+
+def test_persistent_history_extend_after_reopen(tmp_path):
+
+    # Aggregates of a reopened file are caught up on the first query, bulk-loaded entries included
+    path = tmp_path / 'history.bin'
+    with PersistentHistory(path) as history:
+        fill(history)
+    history = PersistentHistory(path)
+    history.extend([(AddCalculation, 1.0, 1.0, 2.0, 5.0)])
+    assert history.statistics().count == 5
+    assert history.statistics(AddCalculation).total == 9.0
+    history.close()
+
+def test_persistent_history_extend_unregistered_type(tmp_path):
+
+    history = PersistentHistory(tmp_path / 'history.bin')
+    with pytest.raises(ValueError, match="Calculation class 'LocalCalculation' is not registered."):
+        history.extend([(type('LocalCalculation', (AddCalculation,), {}), 1.0, 2.0, 3.0, 0.0)])
+    assert len(history) == 0
+    history.close()
+
+def test_persistent_history_grow(tmp_path, monkeypatch):
+
+    # The file grows as needed, and is trimmed to the entries it holds on close
+    monkeypatch.setattr(app.history, '_MIN_CAPACITY', RECORD.size * 3)
+    path = tmp_path / 'history.bin'
+    history = PersistentHistory(path)
+    for i in range(100):
+        history.append(AddCalculation(float(i), 1.0))
+    history.close()
+    history.close()
+    assert path.stat().st_size == HEADER_SIZE + 100 * RECORD.size
+
+    history = PersistentHistory(path)
+    assert list(history.a) == [float(i) for i in range(100)]
+    history.append(AddCalculation(1.0, 1.0))
+    assert history.render(100) == 'AddCalculation: 1.0 Add 1.0 = 2.0'
+
+def test_persistent_history_clear(tmp_path):
+
+    path = tmp_path / 'history.bin'
+    with PersistentHistory(path) as history:
+        fill(history)
+        history.clear()
+        assert len(history) == 0
+        assert len(PersistentHistory(path)) == 0
+    assert len(PersistentHistory(path)) == 0
+
+@pytest.mark.parametrize(
+    'content, message',
+    [
+        (b'not a history file', 'is not a calculator history file.'),
+        (b'NOTHIST!' + bytes(HEADER_SIZE), 'is not a calculator history file.'),
+        (app.history.HEADER.pack(b'CALCHIST', 2, RECORD.size, 0, 0) + bytes(HEADER_SIZE), r'uses an unsupported history format \(version 2\).'),
+        (app.history.HEADER.pack(b'CALCHIST', 1, 64, 0, 0) + bytes(HEADER_SIZE), r'uses an unsupported history format \(version 1\).'),
+    ],
+    ids=[
+        'persistent_history_short_file',
+        'persistent_history_bad_magic',
+        'persistent_history_bad_version',
+        'persistent_history_bad_record_size',
+    ]
+)
+def test_persistent_history_invalid_file(tmp_path, content, message):
+
+    path = tmp_path / 'history.bin'
+    path.write_bytes(content)
+    with pytest.raises(ValueError, match=message):
+        PersistentHistory(path)
+
+def test_persistent_history_unregistered_type(tmp_path):
+
+    # Types are stored by registered name, so a type that is not registered cannot be appended
+    history = PersistentHistory(tmp_path / 'history.bin')
+    with pytest.raises(ValueError, match="Calculation class 'UnregisteredCalculation' is not registered."):
+        history.append(type('UnregisteredCalculation', (AddCalculation,), {})(1.0, 2.0))
+    assert len(history) == 0
+
+def test_persistent_history_type_unregistered_on_reopen(tmp_path):
+
+    path = tmp_path / 'history.bin'
+    with PersistentHistory(path) as history:
+        fill(history)
+    CalculationFactory.reset_calculations()
+    CalculationFactory.register_calculation('add')(AddCalculation)
+    with pytest.raises(ValueError, match="Unsupported calculation type: 'subtract'."):
+        PersistentHistory(path)
+
+def test_persistent_history_op_table_too_large(tmp_path):
+
+    # The registered names of all the types in the file have to fit in the header
+    history = PersistentHistory(tmp_path / 'history.bin', commit_interval=0)
+    with pytest.raises(ValueError, match='Too many calculation types to store in the history file header.'):
+        for i in range(200):
+            calculation_class = type(f'Long{i}Calculation', (AddCalculation,), {})
+            CalculationFactory.register_calculation(f'a_rather_long_operation_name_{i}')(calculation_class)
+            history.append(calculation_class(1.0, 2.0))
+
+'''
+--------------
+BoundedHistory
+--------------
+'''
+
+def numbered(count, start=0):
+
+    # count additions start+i + 1, with timestamp start+i, as extend entries
+    return [(AddCalculation, float(i), 1.0, i + 1.0, float(i)) for i in range(start, start + count)]
+
+def test_bounded_history_drops_oldest():
+
+    # Without a spill directory the latest capacity entries are kept, and the statistics still cover every entry appended
+    history = BoundedHistory(3)
+    fill(history)
+    assert len(history) == 3
+    assert history.evicted == 1
+    assert list(history.lines()) == list(make_history().lines())[1:]
+    assert history.record(0) == (1, 3.0, 2.0, 1.0, 2.0)
+    assert history.record(-1) == (3, 8.0, 2.0, 4.0, 4.0)
+    assert history.statistics().count == 4
+    assert history.statistics().total == 32.0
+    history.append(AddCalculation(1.0, 1.0), timestamp=5.0)
+    assert [record[4] for record in history.record_range(0, 10)] == [3.0, 4.0, 5.0]
+
+def test_bounded_history_not_full():
+
+    history = BoundedHistory(10)
+    fill(history)
+    assert list(history.lines()) == list(make_history().lines())
+    assert history.evicted == 0
+    assert history.timestamps.tolist() == [1.0, 2.0, 3.0, 4.0]
+
+@pytest.mark.parametrize('spill', [False, True], ids=['bounded_history_columns', 'bounded_history_spilled_columns'])
+def test_bounded_history_columns(tmp_path, spill):
+
+    # The columns follow history order wherever the ring starts and whichever entries have spilled
+    history = BoundedHistory(4, spill_dir=tmp_path if spill else None, segment_size=3)
+    history.extend(numbered(10))
+    expected = numbered(10) if spill else numbered(4, start=6)
+    assert history.op_codes.tolist() == [0] * len(expected)
+    assert history.a.tolist() == [entry[1] for entry in expected]
+    assert list(history.b) == [1.0] * len(expected)
+    assert history.results.tolist() == [entry[3] for entry in expected]
+    assert history.timestamps.tolist() == [entry[4] for entry in expected]
+    assert len(history.results) == len(expected)
+    assert history.results[-1] == 10.0
+    history.close()
+
+def test_bounded_history_spill(tmp_path):
+
+    # Evicted entries go to compressed segment files, and every entry is still there, in order
+    history = BoundedHistory(4, spill_dir=tmp_path, segment_size=3)
+    history.extend(numbered(11))
+    segments = sorted(tmp_path.glob('history-*/*.seg'))
+    assert [path.name for path in segments] == ['00000000.seg', '00000001.seg']
+    assert len(history) == 11
+    assert history.evicted == 0
+    assert history.record_range(0, 11) == [(0, *entry[1:]) for entry in numbered(11)]
+    assert history.record(1) == (0, 1.0, 1.0, 2.0, 1.0)
+    assert history.record(-5) == (0, 6.0, 1.0, 7.0, 6.0)
+    assert history.statistics().count == 11
+
+    # Only the last segment read is kept in memory
+    assert history._cached[0] == 0
+    history.record(4)
+    assert history._cached[0] == 1
+
+    history.close()
+    history.close()
+    assert list(tmp_path.iterdir()) == []
+
+def test_bounded_history_close_drops_spilled(tmp_path):
+
+    # Closing deletes the segments and drops their entries, and the history goes on without spilling
+    history = BoundedHistory(4, spill_dir=tmp_path, segment_size=3)
+    history.extend(numbered(11))
+    history.record(0)
+    history.close()
+    assert list(tmp_path.iterdir()) == []
+    assert len(history) == 4
+    assert history.evicted == 7
+    assert history.spilled == 0
+    assert history.record_range(0, 10) == [(0, *entry[1:]) for entry in numbered(4, start=7)]
+    history.append(AddCalculation(1.0, 1.0), timestamp=20.0)
+    assert history.evicted == 8
+    assert [record[4] for record in history.record_range(0, 4)] == [8.0, 9.0, 10.0, 20.0]
+    assert history.statistics().count == 12
+
+def test_bounded_history_clear(tmp_path):
+
+    history = BoundedHistory(2, spill_dir=tmp_path, segment_size=2)
+    history.extend(numbered(7))
+    history.clear()
+    assert len(history) == 0
+    assert history.statistics().count == 0
+    assert list(tmp_path.glob('history-*/*.seg')) == []
+    history.extend(numbered(5))
+    assert [record[4] for record in history.record_range(0, 5)] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    history.close()
+
+    history = BoundedHistory(2)
+    history.extend(numbered(5))
+    history.clear()
+    assert history.evicted == 0
+    assert len(history) == 0
+
+@pytest.mark.parametrize('index', [3, -4], ids=['bounded_history_index_too_large', 'bounded_history_index_too_small'])
+def test_bounded_history_index_error(index):
+
+    history = BoundedHistory(3)
+    history.extend(numbered(5))
+    with pytest.raises(IndexError, match='history index out of range'):
+        history[index]
+
+def test_bounded_history_exact_backend_numbers():
+
+    CalculationFactory.set_backend('int')
+    history = BoundedHistory(2)
+    history.append(DivideCalculation(1, 3))
+    history.append(MultiplyCalculation(10 ** 200, -10 ** 200))
+    assert list(history.lines()) == [
+        'DivideCalculation: 1.0 Divide 3.0 = 0.3333333333333333',
+        'MultiplyCalculation: 1e+200 Multiply -1e+200 = -inf',
+    ]
+
+def test_bounded_history_extend_huge_numbers():
+
+    # As in append, integers too large for a double are stored as infinity, also in place of an evicted entry
+    history = BoundedHistory(1)
+    history.extend([(MultiplyCalculation, 10 ** 200, -10 ** 200, -10 ** 400, 1.0), (AddCalculation, 10 ** 400, 1, 10 ** 400 + 1, 2.0)])
+    assert len(history) == 1
+    assert history.evicted == 1
+    assert history.record(0) == (1, math.inf, 1.0, math.inf, 2.0)
+    assert history.statistics().count == 2
+
+@pytest.mark.parametrize(
+    'arguments, capacity',
+    [({'capacity': 5}, 5), ({'max_bytes': 1000}, 30), ({'max_bytes': 33}, 1)],
+    ids=['count', 'bytes', 'one_entry']
+)
+def test_bounded_history_capacity(arguments, capacity):
+
+    assert BoundedHistory(**arguments).capacity == capacity
+
+@pytest.mark.parametrize(
+    'arguments, message',
+    [
+        ({}, 'Give the history limit as either a number of entries or a number of bytes.'),
+        ({'capacity': 5, 'max_bytes': 1000}, 'Give the history limit as either a number of entries or a number of bytes.'),
+        ({'capacity': 0}, r'History limit is too small: it must hold at least one entry \(33 bytes\).'),
+        ({'max_bytes': 32}, r'History limit is too small: it must hold at least one entry \(33 bytes\).'),
+        ({'capacity': 5, 'segment_size': 0}, 'Spill segments must hold at least one entry.'),
+    ],
+    ids=['no_limit', 'two_limits', 'zero_capacity', 'budget_too_small', 'zero_segment']
+)
+def test_bounded_history_invalid(arguments, message):
+
+    with pytest.raises(ValueError, match=message):
+        BoundedHistory(**arguments)
+
+@pytest.mark.parametrize(
+    'text, expected',
+    [('100000', (100000, None)), ('64MB', (None, 64 << 20)), ('512k', (None, 512 << 10)), ('1GiB', (None, 1 << 30)), ('100B', (None, 100))],
+    ids=['count', 'megabytes', 'kilobytes', 'gibibytes', 'bytes']
+)
+def test_parse_limit(text, expected):
+
+    assert parse_limit(text) == expected
+
+@pytest.mark.parametrize('text', ['', '-5', '10X', '1.5M'])
+def test_parse_limit_invalid(text):
+
+    with pytest.raises(ValueError, match=f"Invalid history limit: '{text}'. Use a number of entries, or a size such as 64MB."):
+        parse_limit(text)
+
+@pytest.mark.parametrize('spill', [False, True], ids=['bounded_history_flat_memory', 'bounded_history_spill_flat_memory'])
+def test_bounded_history_flat_memory(tmp_path, spill):
+
+    # Memory use depends on the capacity and segment size, not on the number of entries appended
+    def peak(count):
+        history = BoundedHistory(1000, spill_dir=tmp_path if spill else None, segment_size=500)
+        tracemalloc.start()
+        try:
+            for i in range(count):
+                history.append(AddCalculation(float(i), 1.0), timestamp=float(i))
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            history.close()
+
+    assert peak(20000) < 2 * peak(2000) + 100_000
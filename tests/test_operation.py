@@ -1,9 +1,13 @@
+import decimal
+import math
 import pytest
 
+from array import array
+from fractions import Fraction
 from typing import Union
 from unittest.mock import patch
 
-from app.operation import Operation
+from app.operation import FixedPoint, Operation, numeric_backend
 
 # These tests verify the math itself in the operations.
 
@@ -267,3 +271,251 @@ def test_operation_invalid_input(calc_function, a, b):
 
     with pytest.raises(TypeError):
         calc_function(a, b)
+
+'''
+----------------------------------------------------------------
+Batch operations
+----------------------------------------------------------------
+'''
+
+@pytest.mark.parametrize(
+    'batch_function, scalar_function',
+    [
+        (Operation.batch_addition, Operation.addition),
+        (Operation.batch_subtraction, Operation.subtraction),
+        (Operation.batch_multiplication, Operation.multiplication),
+        (Operation.batch_division, Operation.division),
+    ],
+    ids=[
+        'batch_addition',
+        'batch_subtraction',
+        'batch_multiplication',
+        'batch_division',
+    ]
+)
+def test_batch_matches_scalar(batch_function, scalar_function):
+
+    # Every batch result should match the scalar operation on the same pair of operands
+    a = [2, 1, -5, -3, 0, 4, -8.7]
+    b = [5, -4, 10, -4, 2.5, 0.5, 3]
+    actual = batch_function(a, b)
+    assert isinstance(actual, array)
+    assert list(actual) == [scalar_function(x, y) for x, y in zip(a, b)]
+
+@pytest.mark.parametrize(
+    'a, b',
+    [
+        (array('d', [1.0, 2.0, 3.0]), array('d', [4.0, 5.0, 6.0])),
+        (memoryview(array('d', [1.0, 2.0, 3.0])), memoryview(array('d', [4.0, 5.0, 6.0]))),
+    ],
+    ids=[
+        'batch_array_operands',
+        'batch_memoryview_operands',
+    ]
+)
+def test_batch_buffer_operands(a, b):
+
+    assert list(Operation.batch_addition(a, b)) == [5.0, 7.0, 9.0]
+    assert list(Operation.batch_division(a, b)) == [0.25, 0.4, 0.5]
+
+def test_batch_length_mismatch():
+
+    with pytest.raises(ValueError, match='Operand sequences must be the same length'):
+        Operation.batch_addition([1, 2, 3], [1, 2])
+
+def test_batch_division_by_zero_nan():
+
+    # Zero divisors give NaN for that element only, instead of stopping the whole batch
+    actual = Operation.batch_division([1, 2, 3, 4], [2, 0, -0.0, 8])
+    assert actual[0] == 0.5
+    assert math.isnan(actual[1])
+    assert math.isnan(actual[2])
+    assert actual[3] == 0.5
+    assert list(Operation.zero_divisor_mask([2, 0, -0.0, 8])) == [0, 1, 1, 0]
+
+def test_batch_division_by_zero_raise():
+
+    with pytest.raises(ZeroDivisionError, match=r'Division by zero is not allowed \(element 2\)'):
+        Operation.batch_division([1, 2, 3], [1, 2, 0], zero_division='raise')
+
+def test_batch_division_invalid_policy():
+
+    with pytest.raises(ValueError, match="Unsupported zero_division policy: 'ignore'"):
+        Operation.batch_division([1], [1], zero_division='ignore')
+
+def test_batch_numpy_operands():
+
+    # NumPy arrays in should give NumPy arrays out
+    numpy = pytest.importorskip('numpy')
+    a = numpy.array([1.0, 2.0, 3.0])
+    b = numpy.array([4.0, 0.0, 6.0])
+    assert list(Operation.batch_multiplication(a, b)) == [4.0, 0.0, 18.0]
+    actual = Operation.batch_division(a, b)
+    assert isinstance(actual, numpy.ndarray)
+    assert actual[0] == 0.25 and numpy.isnan(actual[1]) and actual[2] == 0.5
+    assert list(Operation.zero_divisor_mask(b)) == [False, True, False]
+    with pytest.raises(ZeroDivisionError, match=r'\(element 1\)'):
+        Operation.batch_division(a, b, zero_division='raise')
+
+'''
+----------------------------------------------------------------
+Numeric backends
+----------------------------------------------------------------
+'''
+
+def test_float_backend_is_operation():
+
+    assert numeric_backend('float') is Operation
+    assert numeric_backend('FLOAT') is Operation
+    assert Operation.parse('1.5') == 1.5
+
+def test_backends_are_reused():
+
+    # Each backend (and its decimal context) is created once
+    assert numeric_backend('decimal:12') is numeric_backend('decimal:12')
+    assert numeric_backend('decimal:12') is not numeric_backend('decimal')
+    assert numeric_backend('decimal:12').name == 'decimal:12'
+
+@pytest.mark.parametrize(
+    'name, message',
+    [
+        ('double', "Unsupported numeric backend: 'double'. Available backends: float, int, fraction, decimal, fixed"),
+        ('int:3', "Unsupported numeric backend: 'int:3'."),
+        ('decimal:x', "Invalid setting for the decimal backend: 'x'. Please enter a whole number."),
+        ('fixed:', "Invalid setting for the fixed backend: ''. Please enter a whole number."),
+        ('decimal:0', 'Decimal precision must be between 1 and'),
+        ('fixed:19', 'Fixed point places must be between 0 and 18.'),
+        ('fixed:100', 'Fixed point places must be between 0 and 18.'),
+    ],
+    ids=[
+        'backend_unknown',
+        'backend_setting_not_supported',
+        'backend_setting_not_number',
+        'backend_setting_empty',
+        'backend_precision_zero',
+        'backend_too_many_places',
+        'backend_far_too_many_places',
+    ]
+)
+def test_numeric_backend_errors(name, message):
+
+    with pytest.raises(ValueError, match=message):
+        numeric_backend(name)
+
+@pytest.mark.parametrize(
+    'name, a, b, expected',
+    [
+        ('int', '12345678901234567890', '98765432109876543210', ['111111111011111111100', '-86419753208641975320', '1219326311370217952237463801111263526900', '13717421/109739369']),
+        ('int', '-12', '4', ['-8', '-16', '-48', '-3']),
+        ('fraction', '0.1', '1/3', ['13/30', '-7/30', '1/30', '3/10']),
+        ('decimal', '0.1', '0.2', ['0.3', '-0.1', '0.02', '0.5']),
+        ('decimal:5', '1', '3', ['4', '-2', '3', '0.33333']),
+        ('fixed', '10.25', '4', ['14.25', '6.25', '41.00', '2.56']),
+        ('fixed', '-0.05', '0.5', ['0.45', '-0.55', '-0.02', '-0.10']),
+        ('fixed:0', '7', '2', ['9', '5', '14', '4']),
+        ('fixed', '1', '-3', ['-2.00', '4.00', '-3.00', '-0.33']),
+    ],
+    ids=[
+        'int_large',
+        'int_exact_division',
+        'fraction',
+        'decimal',
+        'decimal_precision',
+        'fixed',
+        'fixed_half_even',
+        'fixed_no_places',
+        'fixed_negative_divisor',
+    ]
+)
+def test_backend_operations(name, a, b, expected):
+
+    backend = numeric_backend(name)
+    a, b = backend.parse(a), backend.parse(b)
+    actual = [str(operation(a, b)) for operation in (backend.addition, backend.subtraction, backend.multiplication, backend.division)]
+    assert actual == expected
+
+def test_int_backend_result_types():
+
+    backend = numeric_backend('int')
+    assert type(backend.division(9, 3)) is int
+    assert backend.division(10, 4) == Fraction(5, 2)
+
+@pytest.mark.parametrize('name', ['int', 'fraction', 'decimal', 'fixed'])
+def test_backend_division_by_zero(name):
+
+    backend = numeric_backend(name)
+    for a in ('1', '0'):
+        with pytest.raises(ZeroDivisionError):
+            backend.division(backend.parse(a), backend.parse('0'))
+
+@pytest.mark.parametrize(
+    'name, text',
+    [
+        ('int', '1.5'),
+        ('fraction', '1/0'),
+        ('fraction', 'x'),
+        ('decimal', 'one'),
+        ('fixed', 'one'),
+        ('fixed', '.'),
+        ('fixed', 'inf'),
+        ('fixed', '1e30'),
+    ],
+    ids=['int_fraction', 'fraction_zero_denominator', 'fraction_text', 'decimal_text', 'fixed_text', 'fixed_point_only', 'fixed_infinity', 'fixed_too_large']
+)
+def test_backend_invalid_numbers(name, text):
+
+    with pytest.raises(ValueError, match=f"Invalid number for the {name} backend: '{text}'."):
+        numeric_backend(name).parse(text)
+
+@pytest.mark.parametrize(
+    'text, units',
+    [
+        ('12', 1200),
+        ('-.5', -50),
+        ('5.', 500),
+        ('0.125', 12),
+        ('0.135', 14),
+        ('1e2', 10000),
+        ('-2.675', -268),
+    ],
+    ids=['fixed_whole', 'fixed_no_whole_part', 'fixed_no_fraction_digits', 'fixed_round_half_even_down', 'fixed_round_half_even_up', 'fixed_exponent', 'fixed_negative_rounding']
+)
+def test_fixed_backend_parse(text, units):
+
+    value = numeric_backend('fixed').parse(text)
+    assert isinstance(value, FixedPoint)
+    assert int(value) == units
+
+def test_fixed_point_number():
+
+    # Values print and convert to float as decimals, while the arithmetic works on integer units
+    backend = numeric_backend('fixed:3')
+    value = backend.parse('-1.5')
+    assert (str(value), repr(value), float(value), int(value)) == ('-1.500', '-1.500', -1.5, -1500)
+    assert str(backend.multiplication(backend.parse('0.001'), backend.parse('0.5'))) == '0.000'
+
+def test_fixed_backend_most_places():
+
+    # With the most places allowed, 1 is still in range
+    backend = numeric_backend('fixed:18')
+    assert str(backend.addition(backend.parse('1'), backend.parse('0.000000000000000001'))) == '1.000000000000000001'
+    assert str(backend.multiplication(backend.parse('2.5'), backend.parse('3'))) == '7.500000000000000000'
+
+def test_fixed_backend_range():
+
+    # Results stay within the signed 64-bit range of units
+    backend = numeric_backend('fixed')
+    largest = backend.parse('92233720368547758.07')
+    assert int(largest) == 2 ** 63 - 1
+    with pytest.raises(OverflowError, match='Result is out of range for fixed point.'):
+        backend.addition(largest, backend.parse('0.01'))
+    with pytest.raises(ValueError, match='Invalid number for the fixed backend'):
+        backend.parse('92233720368547758.08')
+
+def test_decimal_backend_uses_own_context():
+
+    # The backend's precision applies whatever the thread's decimal context is
+    backend = numeric_backend('decimal:3')
+    with decimal.localcontext(prec=50):
+        assert str(backend.division(backend.parse('2'), backend.parse('3'))) == '0.667'
+        assert str(backend.parse('1.23456')) == '1.23'
@@ -0,0 +1,155 @@
+import pytest
+import sys
+
+from io import StringIO
+
+from app.output import BufferedSink, MemorySink, OutputSink, QuietSink, TerminalSink, make_sink
+
+# These tests verify the output sinks the Calculator writes through.
+
+class CountingStream(StringIO):
+
+    # A stream that counts its write and flush calls
+
+    def __init__(self) -> None:
+
+        super().__init__()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, text: str) -> int:
+
+        self.writes += 1
+        return super().write(text)
+
+    def flush(self) -> None:
+
+        self.flushes += 1
+
+def test_terminal_sink_flushes_every_line():
+
+    stream = CountingStream()
+    sink = TerminalSink(stream)
+    sink.write('one')
+    sink.result('AddCalculation: 1.0 Add 2.0 = 3.0')
+    sink.write('{"a": 1}\n', end='')
+    assert stream.getvalue() == 'one\nResult: AddCalculation: 1.0 Add 2.0 = 3.0\n\n{"a": 1}\n'
+    assert (stream.writes, stream.flushes) == (3, 3)
+
+def test_terminal_sink_default_stream(capsys, monkeypatch):
+
+    # Without a stream it writes to whatever sys.stdout is when it writes, and reads with input()
+    sink = TerminalSink()
+    sink.write('hello')
+    assert capsys.readouterr().out == 'hello\n'
+    monkeypatch.setattr('builtins.input', lambda prompt: f'{prompt}typed')
+    assert sink.read('>> ') == '>> typed'
+
+def test_terminal_sink_read_with_stream(monkeypatch):
+
+    # With a stream the prompt goes to the stream, not to sys.stdout, and the line is read from sys.stdin
+    monkeypatch.setattr('builtins.input', lambda prompt: pytest.fail('input() called'))
+    monkeypatch.setattr(sys, 'stdin', StringIO('add 1 2\n'))
+    stream = CountingStream()
+    sink = TerminalSink(stream)
+    assert sink.read('>> ') == 'add 1 2'
+    assert (stream.getvalue(), stream.flushes) == ('>> ', 1)
+    with pytest.raises(EOFError):
+        sink.read('>> ')
+
+def test_buffered_sink_writes_blocks():
+
+    stream = CountingStream()
+    sink = BufferedSink(stream, buffer_size=20)
+    sink.write('0123456789')
+    assert stream.writes == 0
+    sink.write('abcdefghij')
+    assert (stream.writes, stream.getvalue()) == (1, '0123456789\nabcdefghij\n')
+
+    # The buffer is reused after it is written out
+    buffer = sink._buffer
+    sink.result('x')
+    assert sink._buffer is buffer
+    sink.flush()
+    sink.flush()
+    assert (stream.writes, stream.flushes) == (2, 2)
+    assert stream.getvalue().endswith('Result: x\n\n')
+    sink.close()
+    assert stream.flushes == 3
+
+def test_buffered_sink_read():
+
+    # Reading does not flush: the prompt is buffered like any other output
+    stream = CountingStream()
+    sink = BufferedSink(stream, source=StringIO('add 1 2\n'))
+    assert sink.read('>> ') == 'add 1 2\n'
+    with pytest.raises(EOFError):
+        sink.read('>> ')
+    assert stream.writes == 0
+    sink.flush()
+    assert stream.getvalue() == '>> >> '
+
+def test_buffered_sink_default_streams(capsys, monkeypatch):
+
+    monkeypatch.setattr(sys, 'stdin', StringIO('exit\n'))
+    sink = BufferedSink()
+    assert sink.read('>> ') == 'exit\n'
+    sink.close()
+    assert capsys.readouterr().out == '>> '
+
+def test_memory_sink(monkeypatch):
+
+    monkeypatch.setattr('builtins.input', lambda prompt: 'exit')
+    sink = MemorySink()
+    sink.write('hello')
+    assert sink.read('>> ') == 'exit'
+    sink.result('3.0')
+    sink.close()
+    assert sink.getvalue() == 'hello\n>> Result: 3.0\n\n'
+
+def test_quiet_sink(capsys):
+
+    sink = QuietSink()
+    sink.write('hello')
+    sink.result('AddCalculation: 1.0 Add 2.0 = 3.0')
+    sink.result('sum = 6.0')
+    assert sink.results == ['AddCalculation: 1.0 Add 2.0 = 3.0', 'sum = 6.0']
+    assert capsys.readouterr().out == ''
+
+@pytest.mark.parametrize(
+    'kind, stdin_isatty, stdout_isatty, expected',
+    [
+        ('auto', True, True, TerminalSink),
+        ('auto', True, False, TerminalSink),
+        ('auto', False, True, TerminalSink),
+        ('auto', False, False, BufferedSink),
+        ('terminal', False, False, TerminalSink),
+        ('buffered', True, True, BufferedSink),
+    ],
+    ids=['auto_terminal', 'auto_piped_output', 'auto_redirected_input', 'auto_redirected', 'terminal', 'buffered']
+)
+def test_make_sink(monkeypatch, kind, stdin_isatty, stdout_isatty, expected):
+
+    # Output piped to e.g. tee is still written line by line while a person types the input
+    monkeypatch.setattr(sys, 'stdin', StringIO())
+    monkeypatch.setattr(sys.stdin, 'isatty', lambda: stdin_isatty)
+    monkeypatch.setattr(sys, 'stdout', StringIO())
+    monkeypatch.setattr(sys.stdout, 'isatty', lambda: stdout_isatty)
+    assert type(make_sink(kind)) is expected
+
+def test_make_sink_unknown():
+
+    with pytest.raises(ValueError, match="Unknown output: 'loud'. Use one of: auto, terminal, buffered."):
+        make_sink('loud')
+
+def test_output_sink_is_abstract():
+
+    # A sink has to say where its lines go
+    with pytest.raises(TypeError):
+        OutputSink()
+
+    class IncompleteSink(OutputSink):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteSink()
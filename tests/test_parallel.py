@@ -0,0 +1,163 @@
+import pytest
+
+from io import StringIO
+
+from app.batch import run_batch
+from app.calculation import CalculationFactory
+from app.parallel import _init_worker, evaluate_calculations, evaluate_file, evaluate_shard, parallel_main, shard_file
+
+# These tests verify the multiprocess file evaluator. Its output should be exactly what run_batch gives for the same file.
+
+CONTENT = '''add 1 2
+subtract 10 4
+
+multiply 2 3
+divide 1 0
+divide 9 3
+not a calculation
+add 0.5 0.25
+'''
+
+@pytest.fixture
+def input_file(tmp_path):
+
+    path = tmp_path / 'input.txt'
+    path.write_text(CONTENT)
+    return str(path)
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 20, 1000])
+def test_shard_file_on_line_boundaries(input_file, chunk_size):
+
+    # Shards should cover the whole file, in order, and each one should end at the end of a line
+    shards = shard_file(input_file, chunk_size)
+    data = CONTENT.encode()
+    assert shards[0][0] == 0
+    assert shards[-1][1] == len(data)
+    for (_, end), (start, _) in zip(shards, shards[1:]):
+        assert end == start
+        assert data[end - 1:end] == b'\n'
+
+def test_shard_file_without_trailing_newline(tmp_path):
+
+    path = tmp_path / 'input.txt'
+    path.write_text('add 1 2\nadd 3 4')
+    assert shard_file(str(path), 4) == [(0, 8), (8, 15)]
+    assert evaluate_shard(str(path), 8, 15) == ('AddCalculation: 3.0 Add 4.0 = 7.0\n', [], 1)
+
+def test_shard_file_empty_and_invalid(tmp_path):
+
+    path = tmp_path / 'input.txt'
+    path.write_text('')
+    assert shard_file(str(path)) == []
+    with pytest.raises(ValueError, match='Chunk size must be at least 1 byte.'):
+        shard_file(str(path), 0)
+
+def test_evaluate_shard(input_file):
+
+    text, problems, line_count = evaluate_shard(input_file, 22, 58)
+    assert text == 'MultiplyCalculation: 2.0 Multiply 3.0 = 6.0\nDivideCalculation: 9.0 Divide 3.0 = 3.0\n'
+    assert problems == [(3, 'Cannot divide by zero.')]
+    assert line_count == 4
+
+@pytest.mark.parametrize(
+    'workers, chunk_size',
+    [
+        (1, 1000),
+        (2, 10),
+        (3, 1),
+    ],
+    ids=[
+        'parallel_one_worker_one_shard',
+        'parallel_two_workers',
+        'parallel_more_shards_than_in_flight',
+    ]
+)
+def test_evaluate_file_matches_batch(input_file, workers, chunk_size):
+
+    expected_out = StringIO()
+    expected_errors = StringIO()
+    expected_failed = run_batch(StringIO(CONTENT), expected_out, expected_errors)
+
+    out = StringIO()
+    errors = StringIO()
+    failed = evaluate_file(input_file, out, errors, workers=workers, chunk_size=chunk_size)
+
+    assert failed == expected_failed == 2
+    assert out.getvalue() == expected_out.getvalue()
+    assert errors.getvalue() == expected_errors.getvalue()
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 1000])
+def test_evaluate_file_newlines_match_batch(tmp_path, chunk_size):
+
+    # \r\n and lone \r line endings are read like run_batch reads them (universal newlines), wherever the shards fall
+    content = 'add 1 2\r\ndivide 1 0\rmultiply 2 3\n\r\nbad\radd 3 4\r'
+    path = tmp_path / 'input.txt'
+    path.write_bytes(content.encode())
+    expected_out, expected_errors = StringIO(), StringIO()
+    with open(path) as source:
+        expected_failed = run_batch(source, expected_out, expected_errors)
+
+    out, errors = StringIO(), StringIO()
+    assert evaluate_file(str(path), out, errors, workers=2, chunk_size=chunk_size, threads=True) == expected_failed == 2
+    assert out.getvalue() == expected_out.getvalue()
+    assert errors.getvalue() == expected_errors.getvalue()
+
+def test_init_worker():
+
+    # Workers load the registry up front; in the test process it is already loaded, so this only has to set the backend
+    _init_worker()
+    assert CalculationFactory.backend().name == 'float'
+    _init_worker('fraction')
+    assert CalculationFactory.backend().name == 'fraction'
+
+def test_evaluate_file_uses_backend(tmp_path):
+
+    # Workers evaluate in the parent's numeric backend
+    path = tmp_path / 'input.txt'
+    path.write_text('divide 1 3\nadd 0.1 0.2\n')
+    CalculationFactory.set_backend('fraction')
+    out = StringIO()
+    assert evaluate_file(str(path), out, StringIO(), workers=2, chunk_size=4) == 0
+    assert out.getvalue() == 'DivideCalculation: 1 Divide 3 = 1/3\nAddCalculation: 1/10 Add 1/5 = 3/10\n'
+
+def test_parallel_main(input_file, capfd):
+
+    assert parallel_main(input_file, workers=2, chunk_size=16) == 1
+    captured = capfd.readouterr()
+    assert captured.out.splitlines()[0] == 'AddCalculation: 1.0 Add 2.0 = 3.0'
+    assert 'line 5: Cannot divide by zero.' in captured.err
+
+def test_evaluate_file_with_threads(input_file):
+
+    expected_out = StringIO()
+    expected_errors = StringIO()
+    run_batch(StringIO(CONTENT), expected_out, expected_errors)
+
+    out = StringIO()
+    errors = StringIO()
+    assert evaluate_file(input_file, out, errors, workers=3, chunk_size=7, threads=True) == 2
+    assert out.getvalue() == expected_out.getvalue()
+    assert errors.getvalue() == expected_errors.getvalue()
+
+def test_parallel_main_threads(input_file, capfd):
+
+    assert parallel_main(input_file, workers=2, chunk_size=16, threads=True) == 1
+    assert capfd.readouterr().out.splitlines()[-1] == 'AddCalculation: 0.5 Add 0.25 = 0.75'
+
+@pytest.mark.parametrize('workers, chunk_size', [(1, 4096), (4, 3), (None, 1)], ids=['threads_one', 'threads_four', 'threads_default'])
+def test_evaluate_calculations(workers, chunk_size):
+
+    calculations = [('add', float(i), 1.0) if i % 2 else ('divide', float(i), 2.0) for i in range(50)]
+    expected = [CalculationFactory.evaluate(*calculation) for calculation in calculations]
+    assert evaluate_calculations(calculations, workers, chunk_size) == expected
+    assert evaluate_calculations([], workers, chunk_size) == []
+
+def test_evaluate_calculations_error():
+
+    with pytest.raises(ZeroDivisionError):
+        evaluate_calculations([('add', 1.0, 2.0), ('divide', 1.0, 0.0)], workers=2, chunk_size=1)
+
+def test_parallel_main_missing_file(tmp_path, capfd):
+
+    assert parallel_main(str(tmp_path / 'missing.txt'), workers=2) == 2
+    assert 'Cannot open batch input:' in capfd.readouterr().err
@@ -0,0 +1,390 @@
+import pytest
+
+import app.query
+
+from app.calculation import AddCalculation, DivideCalculation, MultiplyCalculation, SubtractCalculation
+from app.history import BoundedHistory, History, PersistentHistory
+from app.query import HistoryIndex, RangeCondition, SortedIndex, parse_query, query_page, run_query, top
+
+# These tests verify the history indexes and the queries answered from them.
+
+def make_history(history=None):
+
+    # Entries 0-5, with timestamps 100, 200, ... 600
+    history = History() if history is None else history
+    calculations = [
+        AddCalculation(100.0, 50.0),
+        DivideCalculation(900.0, 3.0),
+        MultiplyCalculation(2.0, 3.0),
+        DivideCalculation(10.0, 5.0),
+        SubtractCalculation(500.0, 1.0),
+        AddCalculation(float('nan'), 1.0),
+    ]
+    for i, calculation in enumerate(calculations):
+        history.append(calculation, timestamp=100.0 * (i + 1))
+    return history
+
+'''
+-----------
+SortedIndex
+-----------
+'''
+
+def test_sorted_index_build():
+
+    # Positions are ordered by value, ties in position order, and NaN values are left out
+    index = SortedIndex([3.0, 1.0, float('nan'), 3.0, 2.0])
+    assert index.keys.tolist() == [1.0, 2.0, 3.0, 3.0]
+    assert index.positions.tolist() == [1, 4, 0, 3]
+
+@pytest.mark.parametrize(
+    'keys',
+    [
+        [1.0, 2.0, 2.0, 5.0],
+        [5.0, 1.0, 2.0, 2.0],
+        [float(i % 7) for i in range(200)],
+    ],
+    ids=[
+        'sorted_index_in_order',
+        'sorted_index_few_out_of_order',
+        'sorted_index_many_out_of_order',
+    ]
+)
+def test_sorted_index_add(keys):
+
+    # Adding keys one at a time gives the same index as building it from all of them
+    index = SortedIndex()
+    for position, key in enumerate(keys):
+        index.add(key, position)
+    index.add(float('nan'), len(keys))
+    index.bounds()
+    expected = SortedIndex(keys)
+    assert index.keys == expected.keys
+    assert index.positions == expected.positions
+
+@pytest.mark.parametrize(
+    'low, high, low_inclusive, high_inclusive, expected',
+    [
+        (2.0, None, True, True, [1, 2, 4]),
+        (2.0, None, False, True, [4]),
+        (None, 2.0, True, True, [0, 1, 2]),
+        (None, 2.0, True, False, [0]),
+        (2.0, 2.0, True, True, [1, 2]),
+        (4.0, 1.0, True, True, []),
+        (None, None, True, True, [0, 1, 2, 4]),
+    ],
+    ids=[
+        'sorted_index_at_least',
+        'sorted_index_greater_than',
+        'sorted_index_at_most',
+        'sorted_index_less_than',
+        'sorted_index_equal',
+        'sorted_index_empty_range',
+        'sorted_index_everything',
+    ]
+)
+def test_sorted_index_bounds(low, high, low_inclusive, high_inclusive, expected):
+
+    index = SortedIndex([1.0, 2.0, 2.0, float('nan'), 3.0])
+    start, stop = index.bounds(low, high, low_inclusive, high_inclusive)
+    assert sorted(index.positions[start:stop]) == expected
+
+'''
+------------
+HistoryIndex
+------------
+'''
+
+@pytest.mark.parametrize(
+    'persistent',
+    [False, True],
+    ids=['history_index_history', 'history_index_persistent_history']
+)
+def test_history_index(tmp_path, persistent):
+
+    history = make_history(PersistentHistory(tmp_path / 'history.bin') if persistent else None)
+    index = HistoryIndex(history)
+    index.update()
+    assert index.operation_positions(1).tolist() == [1, 3]
+    assert index.operation_positions(9).tolist() == []
+    assert index.sorted_index('result').positions.tolist() == [3, 2, 0, 1, 4]
+    assert index.sorted_index('timestamp').keys.tolist() == [100.0, 200.0, 300.0, 400.0, 500.0, 600.0]
+
+    # New entries are added to the indexes already built
+    history.append(DivideCalculation(1.0, 4.0), timestamp=700.0)
+    index.update()
+    index.sorted_index('result').bounds()
+    assert index.operation_positions(1).tolist() == [1, 3, 6]
+    assert index.sorted_index('result').positions.tolist() == [6, 3, 2, 0, 1, 4]
+    assert index.sorted_index('timestamp').positions.tolist() == [0, 1, 2, 3, 4, 5, 6]
+
+def test_history_index_only_sorted():
+
+    # Only the indexes that have been built are kept up to date
+    history = make_history()
+    index = HistoryIndex(history)
+    index.update()
+    index.sorted_index('a')
+    history.append(AddCalculation(1000.0, 1.0))
+    index.update()
+    assert index.sorted_index('a').positions.tolist() == [2, 3, 0, 4, 1, 6]
+    assert index.operation_positions(0).tolist() == [0, 5, 6]
+
+def test_history_index_rebuild(monkeypatch):
+
+    # After many new entries, or after the history is cleared, the indexes are built again from the columns
+    monkeypatch.setattr(app.query, '_REBUILD_THRESHOLD', 3)
+    history = make_history()
+    index = HistoryIndex(history)
+    index.update()
+    assert index.operation_positions(0).tolist() == [0, 5]
+
+    for i in range(4):
+        history.append(AddCalculation(float(i), 1.0), timestamp=1000.0)
+    index.update()
+    assert index.operation_positions(0).tolist() == [0, 5, 6, 7, 8, 9]
+
+    history.clear()
+    history.append(SubtractCalculation(1.0, 1.0))
+    index.update()
+    assert index.operation_positions(0).tolist() == []
+    assert index.operation_positions(3).tolist() == [0]
+
+'''
+-------
+Queries
+-------
+'''
+
+@pytest.mark.parametrize(
+    'words, expected',
+    [
+        (['op=divide'], [1, 3]),
+        (['op=add,subtract'], [0, 4, 5]),
+        (['op=divide', 'result>100'], [1]),
+        (['result>=150'], [0, 1, 4]),
+        (['result<=6'], [2, 3]),
+        (['result<6'], [3]),
+        (['a=900'], [1]),
+        (['b>2', 'b<50'], [1, 2, 3]),
+        (['since', '5m'], [3, 4, 5]),
+        (['since', '1.5h', 'result>1000'], []),
+        (['op=add', 'a>0'], [0]),
+        (['op=add', 'a<=1000', 'b>=1', 'b<2'], []),
+        (['op=multiply', 'since', '10s'], []),
+    ],
+    ids=[
+        'query_op',
+        'query_several_ops',
+        'query_op_and_result',
+        'query_result_at_least',
+        'query_result_at_most',
+        'query_result_less_than',
+        'query_operand_equal',
+        'query_operand_range',
+        'query_since',
+        'query_since_and_result',
+        'query_nan_operand',
+        'query_nan_excluded_by_range',
+        'query_op_since',
+    ]
+)
+def test_run_query(words, expected):
+
+    # now is 700, so 'since 5m' means timestamps from 400 on
+    history = make_history()
+    assert run_query(HistoryIndex(history), parse_query(words, now=700.0)) == expected
+
+def test_run_query_checks_fewest_candidates(monkeypatch):
+
+    # Only the candidates of the most selective condition are checked, against the history columns rather than whole records
+    history = make_history()
+    read, checked = [], []
+    record, check = history.record, RangeCondition.check
+    monkeypatch.setattr(history, 'record', lambda position: read.append(position) or record(position))
+    monkeypatch.setattr(
+        RangeCondition, 'check', lambda self, index: lambda position, test=check(self, index): checked.append(position) or test(position)
+    )
+    assert run_query(HistoryIndex(history), parse_query(['op=divide', 'result>100', 'a>=900'])) == [1]
+    assert read == []
+    assert checked == [1]
+
+@pytest.mark.parametrize(
+    'words, limit, expected',
+    [
+        (['op=add'], 1, (2, [5])),
+        (['op=add,divide'], 3, (4, [1, 3, 5])),
+        (['result>0'], 2, (5, [3, 4])),
+        (['result>100'], 2, (3, [1, 4])),
+        (['result>1000'], 2, (0, [])),
+        (['result>100', 'a<600'], 1, (2, [4])),
+        (['op=divide', 'result>1'], 1, (2, [3])),
+        (['result>0'], None, (5, [0, 1, 2, 3, 4])),
+    ],
+    ids=[
+        'query_page_op',
+        'query_page_several_ops',
+        'query_page_broad_range',
+        'query_page_narrow_range',
+        'query_page_no_matches',
+        'query_page_two_ranges',
+        'query_page_op_and_range',
+        'query_page_no_limit',
+    ]
+)
+def test_query_page(words, limit, expected):
+
+    # The number of matches, and the last limit of them in history order
+    assert query_page(HistoryIndex(make_history()), parse_query(words), limit) == expected
+
+@pytest.mark.parametrize(
+    'words',
+    [['op=add'], ['result>0'], ['result>=1', 'b<=5']],
+    ids=['query_page_stale_op', 'query_page_stale_range', 'query_page_stale_two_conditions'],
+)
+def test_query_page_dropped_entries(words):
+
+    # Entries dropped from a BoundedHistory are neither counted nor shown
+    history = make_history(BoundedHistory(6))
+    index = HistoryIndex(history)
+    index.update()
+    expected = History()
+    for h in (history, expected):
+        for i in range(3):
+            h.append(AddCalculation(float(i), 1.0), timestamp=1000.0 + i)
+    conditions = parse_query(words)
+    positions = run_query(HistoryIndex(history), conditions)
+    assert query_page(index, conditions, 2) == (len(positions), positions[-2:])
+
+def test_parse_query_since_default_now(monkeypatch):
+
+    monkeypatch.setattr(app.query.time, 'time', lambda: 1000.0)
+    [condition] = parse_query(['since', '30s'])
+    assert isinstance(condition, RangeCondition)
+    assert (condition.field, condition.low, condition.high) == ('timestamp', 970.0, None)
+
+@pytest.mark.parametrize(
+    'words, message',
+    [
+        ([], 'Invalid query: add at least one condition'),
+        (['since'], "Invalid duration: ''."),
+        (['since', '10y'], "Invalid duration: '10y'."),
+        (['result!=3'], "Invalid condition: 'result!=3'."),
+        (['c>3'], "Invalid condition: 'c>3'."),
+        (['a>3x'], "Invalid number in condition: 'a>3x'."),
+        (['result=nan'], "Invalid number in condition: 'result=nan'."),
+        (['result>=NaN'], "Invalid number in condition: 'result>=NaN'."),
+        (['op=add', 'result>nan'], "Invalid number in condition: 'result>nan'."),
+        (['op=modulo'], "Unsupported calculation type: 'modulo'."),
+    ],
+    ids=[
+        'parse_query_empty',
+        'parse_query_missing_duration',
+        'parse_query_bad_duration',
+        'parse_query_bad_operator',
+        'parse_query_bad_field',
+        'parse_query_bad_number',
+        'parse_query_nan',
+        'parse_query_nan_upper_case',
+        'parse_query_nan_with_op',
+        'parse_query_unknown_operation',
+    ]
+)
+def test_parse_query_invalid(words, message):
+
+    with pytest.raises(ValueError, match=message):
+        parse_query(words)
+
+@pytest.mark.parametrize(
+    'count, field, expected',
+    [
+        (2, 'result', [4, 1]),
+        (10, 'result', [4, 1, 0, 2, 3]),
+        (1, 'a', [1]),
+        (2, 'b', [0, 3]),
+    ],
+    ids=[
+        'top_results',
+        'top_more_than_history',
+        'top_operand_a',
+        'top_operand_b',
+    ]
+)
+def test_top(count, field, expected):
+
+    assert top(HistoryIndex(make_history()), count, field) == expected
+
+def test_top_ties_most_recent_first():
+
+    history = History()
+    for a in (1.0, 2.0, 1.0):
+        history.append(AddCalculation(a, 1.0))
+    assert top(HistoryIndex(history), 3) == [1, 2, 0]
+
+def test_top_invalid_field():
+
+    with pytest.raises(ValueError, match="Invalid field: 'timestamp'. Use result, a or b."):
+        top(HistoryIndex(make_history()), 1, 'timestamp')
+
+def test_history_index_bounded_history():
+
+    # Dropping entries from a BoundedHistory does not move their numbers, so the indexes are kept; dropped entries are left out
+    history = make_history(BoundedHistory(6))
+    index = HistoryIndex(history)
+    index.update()
+    operations = index.operation_positions(1)
+    assert operations.tolist() == [1, 3]
+    assert run_query(index, parse_query(['op=add'])) == [0, 5]
+    assert top(index, 2) == [4, 1]
+    history.append(AddCalculation(1.0, 1.0), timestamp=700.0)
+    index.update()
+    assert index.operation_positions(1) is operations
+    assert index.sorted_index('timestamp').keys.tolist() == [200.0, 300.0, 400.0, 500.0, 600.0, 700.0]
+    assert run_query(index, parse_query(['op=add'])) == [4, 5]
+    assert run_query(index, parse_query(['op=divide', 'result>100'])) == [0]
+    assert top(index, 10) == [3, 0, 1, 5, 2]
+
+def test_history_index_drops_evicted_entries():
+
+    # Once the dropped entries outnumber the ones left, the indexes are built again from the entries in memory
+    history = make_history(BoundedHistory(4))
+    index = HistoryIndex(history)
+    index.update()
+    operations = index.operation_positions(0)
+    for i in range(6):
+        history.append(AddCalculation(float(i), 1.0), timestamp=1000.0)
+        index.update()
+        assert (index.operation_positions(0) is operations) == (i < 4)
+    assert index.operation_positions(0).tolist() == [7, 8, 9, 10, 11]
+    assert index.sorted_index('result').positions.tolist() == [8, 9, 10, 11]
+    assert run_query(index, parse_query(['op=add', 'a>2'])) == [1, 2, 3]
+
+@pytest.mark.parametrize(
+    'words',
+    [['op=divide'], ['result>5'], ['op=add', 'result<200'], ['op=add', 'since', '1m']],
+    ids=['spilled_op', 'spilled_range', 'spilled_two_conditions', 'spilled_since'],
+)
+def test_run_query_spilled_history(tmp_path, monkeypatch, words):
+
+    # Spilled entries are read back and checked instead of indexed, with the same results as for a History
+    monkeypatch.setattr(app.query, '_SCAN_CHUNK', 4)
+    history = BoundedHistory(3, spill_dir=tmp_path, segment_size=2)
+    expected = History()
+    for h in (history, expected):
+        make_history(h)
+        for i in range(5):
+            h.append(AddCalculation(float(i), 10.0), timestamp=1000.0 + i)
+    index = HistoryIndex(history)
+    positions = run_query(HistoryIndex(expected), parse_query(words, now=1050.0))
+    assert run_query(index, parse_query(words, now=1050.0)) == positions
+    assert query_page(index, parse_query(words, now=1050.0), 4) == (len(positions), positions[-4:])
+    assert len(index.sorted_index('result').keys) <= 3
+    history.close()
+
+def test_top_spilled_history(tmp_path):
+
+    history = make_history(BoundedHistory(2, spill_dir=tmp_path, segment_size=2))
+    history.append(AddCalculation(99.0, 1.0))
+    assert top(HistoryIndex(history), 3) == [4, 1, 0]
+    assert top(HistoryIndex(history), 10) == [4, 1, 0, 6, 2, 3]
+    history.close()
@@ -0,0 +1,325 @@
+import math
+import random
+import sys
+
+import pytest
+
+from io import StringIO
+
+from app.reduction import ExactProduct, ExactSum, accumulator_for, reduce_file, reduce_main, reduce_numbers, reduce_shard, scan_numbers
+
+# These tests verify the streaming reductions: exact sums, overflow-free products, and parallel results that do not depend on the worker count.
+
+CONTENT = '''1 2 3
+4
+
+0.5 0.25
+10
+'''
+
+@pytest.fixture
+def numbers_file(tmp_path):
+
+    path = tmp_path / 'numbers.txt'
+    path.write_text(CONTENT)
+    return str(path)
+
+'''
+-----
+Accumulators
+-----
+'''
+
+@pytest.mark.parametrize(
+    'values, expected',
+    [
+        ([], 0.0),
+        ([1e100, 1.0, -1e100], 1.0),
+        ([0.1] * 10, 1.0),
+        ([1e16, 1.0, 1.0], 1.0000000000000002e16),
+        ([math.inf, 1.0], math.inf),
+        ([-math.inf, 1.0], -math.inf),
+        ([1e308, 1e308], math.inf),
+        ([-1e308, -1e308, 1.0], -math.inf),
+        ([1e308, 1e308, -1e308], 1e308),
+        ([1e308, 1e308, -1e308, -1e308, 5e-324], 5e-324),
+        ([1e308, 1e308, math.inf], math.inf),
+        ([1e308, 1e308, -math.inf], -math.inf),
+        ([1e308] * 5000 + [-1e308] * 4999, 1e308),
+    ],
+    ids=[
+        'sum_empty',
+        'sum_cancellation',
+        'sum_tenths',
+        'sum_small_after_large',
+        'sum_infinity',
+        'sum_negative_infinity',
+        'sum_overflow',
+        'sum_negative_overflow',
+        'sum_back_in_range',
+        'sum_overflow_cancelled',
+        'sum_overflow_and_infinity',
+        'sum_overflow_and_negative_infinity',
+        'sum_overflow_across_folds',
+    ]
+)
+def test_exact_sum(values, expected):
+
+    total = ExactSum()
+    total.extend(values)
+    assert total.value() == expected
+    assert total.count == len(values)
+
+def test_exact_sum_nan():
+
+    total = ExactSum()
+    total.extend([math.inf, 1.0, -math.inf])
+    assert math.isnan(total.value())
+
+    total = ExactSum()
+    total.add(math.nan)
+    assert math.isnan(total.value())
+
+def test_exact_sum_overflow_stays_exact():
+
+    # A sum beyond the float range is infinite while it is out of range, but is kept exactly, so it can come back into range,
+    # whether the numbers are added one at a time or merged from other sums
+    total = ExactSum()
+    for value, expected in [(1e308, 1e308), (1e308, math.inf), (-1e308, 1e308), (-1e308, 0.0), (-1e308, -1e308)]:
+        total.add(value)
+        assert total.value() == expected
+
+    total, other = ExactSum(), ExactSum()
+    total.extend([1e308, 1e308])
+    other.extend([1.0, 1e308])
+    total.merge(other)
+    assert total.value() == math.inf
+    other = ExactSum()
+    other.extend([-1e308, -1e308, -1e308, 0.5])
+    total.merge(other)
+    assert total.value() == 1.5
+    assert total.count == 8
+
+def test_exact_sum_many_numbers():
+
+    # Folding the buffer into the partials every BUFFER_SIZE numbers should not lose anything
+    rng = random.Random(1)
+    values = [rng.uniform(-1, 1) * 10 ** rng.randint(-20, 20) for _ in range(3 * ExactSum.BUFFER_SIZE + 7)]
+    total = ExactSum()
+    for value in values:
+        total.add(value)
+    assert total.value() == math.fsum(values)
+    assert total.count == len(values)
+    assert len(total.partials) < 10
+
+@pytest.mark.parametrize('split', [0, 1, 500, 4095, 4096, 9999, 10000])
+def test_exact_sum_merge_is_exact(split):
+
+    # Any grouping of the numbers gives exactly the same sum
+    rng = random.Random(2)
+    values = [rng.uniform(-1, 1) * 10 ** rng.randint(-30, 30) for _ in range(10000)]
+    left = ExactSum()
+    left.extend(values[:split])
+    right = ExactSum()
+    right.extend(values[split:])
+    left.merge(right)
+    assert left.value() == math.fsum(values)
+    assert left.count == len(values)
+
+def test_exact_sum_merge_special():
+
+    left = ExactSum()
+    left.extend([math.inf])
+    right = ExactSum()
+    right.extend([1.0, -math.inf])
+    right.merge(ExactSum())
+    left.merge(right)
+    assert math.isnan(left.value())
+    assert left.count == 3
+
+@pytest.mark.parametrize(
+    'values, expected',
+    [
+        ([], 1.0),
+        ([2.0, 3.0, 0.5], 3.0),
+        ([1e200, 1e200, 1e-200, 1e-200], 1.0),
+        ([1e200, 1e200], math.inf),
+        ([-1e200, 1e200], -math.inf),
+        ([1e-200, 1e-200], 0.0),
+        ([5.0, 0.0, -2.0], -0.0),
+    ],
+    ids=[
+        'product_empty',
+        'product_simple',
+        'product_no_intermediate_overflow',
+        'product_overflow',
+        'product_negative_overflow',
+        'product_underflow',
+        'product_zero',
+    ]
+)
+def test_exact_product(values, expected):
+
+    product = ExactProduct()
+    product.extend(values)
+    assert product.value() == pytest.approx(expected)
+    assert math.copysign(1.0, product.value()) == math.copysign(1.0, expected)
+    assert product.count == len(values)
+
+def test_exact_product_merge():
+
+    left = ExactProduct()
+    left.extend([1e300, 4.0])
+    right = ExactProduct()
+    right.extend([1e-300, 0.25])
+    left.merge(right)
+    assert left.value() == pytest.approx(1.0)
+    assert left.count == 4
+
+def test_accumulator_for_unsupported():
+
+    with pytest.raises(ValueError, match="Unsupported reduction: 'median'. Available reductions: sum, product, mean, scan"):
+        accumulator_for('median')
+
+'''
+-----
+Streams
+-----
+'''
+
+@pytest.mark.parametrize(
+    'operation, expected',
+    [
+        ('sum', 20.75),
+        ('product', 30.0),
+        ('mean', 20.75 / 7),
+    ],
+    ids=['stream_sum', 'stream_product', 'stream_mean']
+)
+def test_reduce_numbers(operation, expected):
+
+    assert reduce_numbers(operation, StringIO(CONTENT)) == pytest.approx(expected)
+
+def test_reduce_numbers_errors():
+
+    with pytest.raises(ValueError, match="line 2: Invalid number: 'x'"):
+        reduce_numbers('sum', ['1 2', '3 x 4'])
+    with pytest.raises(ValueError, match='Cannot take the mean of no numbers.'):
+        reduce_numbers('mean', ['', '  '])
+
+def test_scan_numbers():
+
+    assert list(scan_numbers(StringIO(CONTENT))) == [1.0, 3.0, 6.0, 10.0, 10.5, 10.75, 20.75]
+    assert list(scan_numbers(['1e100 1 -1e100'])) == [1e100, 1e100, 1.0]
+    with pytest.raises(ValueError, match="line 1: Invalid number: 'two'"):
+        list(scan_numbers(['1 two']))
+
+'''
+-----
+Files and parallel reduction
+-----
+'''
+
+def test_reduce_shard(numbers_file):
+
+    accumulator, line_count, error = reduce_shard('sum', numbers_file, 8, 21)
+    assert accumulator.value() == 10.75
+    assert (line_count, error) == (3, None)
+    assert reduce_shard('sum', numbers_file, 0, 8)[1] == 2
+
+def test_reduce_shard_error(tmp_path):
+
+    path = tmp_path / 'numbers.txt'
+    path.write_text('1 2\n3 x\n4')
+    assert reduce_shard('product', str(path), 0, 11) == (None, 3, (2, '3 x'))
+
+@pytest.mark.parametrize('operation', ['sum', 'product', 'mean'])
+@pytest.mark.parametrize('workers', [1, 2, 3])
+def test_reduce_file_independent_of_workers(numbers_file, operation, workers):
+
+    # Shard boundaries come from the chunk size alone, so the worker count cannot change the result
+    expected = reduce_file(operation, numbers_file, workers=1, chunk_size=4)
+    assert reduce_file(operation, numbers_file, workers=workers, chunk_size=4) == expected
+    assert expected == pytest.approx(reduce_numbers(operation, StringIO(CONTENT)))
+
+def test_reduce_file_error_line_number(tmp_path):
+
+    path = tmp_path / 'numbers.txt'
+    path.write_text('1\n2\n3\n4 five\n6\n')
+    with pytest.raises(ValueError, match="line 4: Invalid number: 'five'"):
+        reduce_file('sum', str(path), workers=2, chunk_size=2)
+
+@pytest.mark.parametrize(
+    'operation, workers, expected',
+    [
+        ('sum', 1, '20.75\n'),
+        ('sum', 2, '20.75\n'),
+        ('product', 1, '30.0\n'),
+        ('scan', 2, '1.0\n3.0\n6.0\n10.0\n10.5\n10.75\n20.75\n'),
+    ],
+    ids=['main_sum', 'main_sum_parallel', 'main_product', 'main_scan']
+)
+def test_reduce_main(numbers_file, operation, workers, expected):
+
+    out = StringIO()
+    assert reduce_main(operation, numbers_file, workers, chunk_size=4, out=out) == 0
+    assert out.getvalue() == expected
+
+@pytest.mark.parametrize(
+    'operation, workers, expected',
+    [
+        ('sum', 1, 'inf\n'),
+        ('sum', 2, 'inf\n'),
+        ('mean', 1, 'inf\n'),
+        ('scan', 1, '1e+308\ninf\n'),
+    ],
+    ids=['main_sum_overflow', 'main_sum_overflow_parallel', 'main_mean_overflow', 'main_scan_overflow']
+)
+def test_reduce_main_overflow(tmp_path, operation, workers, expected):
+
+    # Finite numbers whose sum is beyond the float range give infinity, not an error
+    path = tmp_path / 'numbers.txt'
+    path.write_text('1e308\n1e308\n')
+    out = StringIO()
+    assert reduce_main(operation, str(path), workers, chunk_size=4, out=out) == 0
+    assert out.getvalue() == expected
+
+def test_reduce_main_product_independent_of_workers(tmp_path):
+
+    # Products are rounded as they go, so one worker has to reduce the same shards, in the same order, as several
+    rng = random.Random(0)
+    path = tmp_path / 'numbers.txt'
+    path.write_text(''.join(f'{rng.uniform(0.5, 1.5)!r}\n' for _ in range(5000)))
+    outputs = []
+    for workers in (1, 2):
+        out = StringIO()
+        assert reduce_main('product', str(path), workers, chunk_size=4096, out=out) == 0
+        outputs.append(out.getvalue())
+    assert outputs[0] == outputs[1]
+    with open(path) as file:
+        assert float(outputs[0]) == pytest.approx(reduce_numbers('product', file))
+
+def test_reduce_main_stdin(numbers_file, capfd, monkeypatch):
+
+    with open(numbers_file) as stdin:
+        monkeypatch.setattr(sys, 'stdin', stdin)
+        assert reduce_main('mean', '-', workers=4) == 0
+    assert float(capfd.readouterr().out) == pytest.approx(20.75 / 7)
+
+@pytest.mark.parametrize(
+    'operation, content, status, message',
+    [
+        ('median', '1\n', 2, "Unsupported reduction: 'median'. Available reductions: sum, product, mean, scan"),
+        ('sum', '1\nx\n', 1, "line 2: Invalid number: 'x'"),
+        ('mean', '', 1, 'Cannot take the mean of no numbers.'),
+        ('sum', None, 2, 'Cannot open reduction input:'),
+    ],
+    ids=['main_unsupported', 'main_invalid_number', 'main_mean_of_nothing', 'main_missing_file']
+)
+def test_reduce_main_errors(tmp_path, capfd, operation, content, status, message):
+
+    path = tmp_path / 'numbers.txt'
+    if content is not None:
+        path.write_text(content)
+    assert reduce_main(operation, str(path)) == status
+    assert message in capfd.readouterr().err
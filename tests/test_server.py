@@ -0,0 +1,150 @@
+import asyncio
+import pytest
+
+from app import server as server_module
+from app.server import CalculatorServer
+
+# These tests verify the asyncio TCP front end. Each test starts a server on a free port.
+
+def run_with_server(scenario, **options):
+
+    # Start a server, run scenario(server), and always shut the server down afterwards
+    async def main():
+        server = CalculatorServer('127.0.0.1', 0, **options)
+        await server.start()
+        try:
+            return await scenario(server)
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+async def request(server, payload: bytes, replies: int) -> list:
+
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    writer.write(payload)
+    await writer.drain()
+    lines = [(await reader.readline()).decode() for _ in range(replies)]
+    writer.close()
+    await writer.wait_closed()
+    return lines
+
+def test_server_replies_in_order():
+
+    # Pipelined requests are answered one line each, in the order they were sent
+    async def scenario(server):
+        return await request(server, b'add 1 2\n\ndivide 1 0\nmultiply 2 3\nfoo\n', 4)
+
+    assert run_with_server(scenario) == [
+        'AddCalculation: 1.0 Add 2.0 = 3.0\n',
+        'Error: Cannot divide by zero.\n',
+        'MultiplyCalculation: 2.0 Multiply 3.0 = 6.0\n',
+        'Error: Invalid input. Please follow the format: <operation> <num1> <num2>\n',
+    ]
+
+def test_server_last_line_without_newline():
+
+    async def scenario(server):
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        writer.write(b'subtract 5 1')
+        writer.write_eof()
+        reply = await reader.read()
+        writer.close()
+        return reply
+
+    assert run_with_server(scenario) == b'SubtractCalculation: 5.0 Subtract 1.0 = 4.0\n'
+
+def test_server_history_per_connection():
+
+    # Each connection keeps its own history
+    async def scenario(server):
+        first_reader, first_writer = await asyncio.open_connection(server.host, server.port)
+        second_reader, second_writer = await asyncio.open_connection(server.host, server.port)
+        first_writer.write(b'add 1 1\nadd 2 2\n')
+        second_writer.write(b'multiply 3 3\n')
+        for _ in range(2):
+            await first_reader.readline()
+        await second_reader.readline()
+
+        histories = sorted((list(connection.history.lines()) for connection in server.connections), key=len)
+        for writer in (first_writer, second_writer):
+            writer.close()
+            await writer.wait_closed()
+        return histories
+
+    assert run_with_server(scenario) == [
+        ['MultiplyCalculation: 3.0 Multiply 3.0 = 9.0'],
+        ['AddCalculation: 1.0 Add 1.0 = 2.0', 'AddCalculation: 2.0 Add 2.0 = 4.0'],
+    ]
+
+def test_server_line_too_long():
+
+    async def scenario(server):
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        writer.write(b'add ' + b'1' * 200)
+        reply = await reader.read()
+        writer.close()
+        return reply
+
+    assert run_with_server(scenario, line_limit=100) == b'Error: Line too long.\n'
+
+def test_server_backpressure():
+
+    # A client that sends requests but does not read the replies gets its reading paused once the write buffer is full
+    async def scenario(server):
+        reader, writer = await asyncio.open_connection(server.host, server.port, limit=1 << 20)
+        transport = writer.transport
+        transport.pause_reading() # The client stops reading replies
+        writer.write(b'add 1 2\n' * 200_000)
+        for _ in range(500):
+            await asyncio.sleep(0.01)
+            if any(not connection.transport.is_reading() for connection in server.connections):
+                break
+        paused = [not connection.transport.is_reading() for connection in server.connections]
+
+        # Once the client reads again, the server catches up and answers everything
+        transport.resume_reading()
+        replies = 0
+        while replies < 200_000:
+            line = await reader.readline()
+            assert line == b'AddCalculation: 1.0 Add 2.0 = 3.0\n'
+            replies += 1
+        writer.close()
+        await writer.wait_closed()
+        return paused, replies
+
+    paused, replies = run_with_server(scenario, write_buffer_limit=1024)
+    assert paused == [True]
+    assert replies == 200_000
+
+def test_server_serve_forever():
+
+    # serve_forever keeps answering until it is cancelled
+    async def scenario(server):
+        serving = asyncio.create_task(server.serve_forever())
+        replies = await request(server, b'add 2 2\n', 1)
+        serving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await serving
+        return replies
+
+    assert run_with_server(scenario) == ['AddCalculation: 2.0 Add 2.0 = 4.0\n']
+
+def test_serve_main(monkeypatch, capsys):
+
+    async def stop_immediately(self):
+        return None
+
+    monkeypatch.setattr(CalculatorServer, 'serve_forever', stop_immediately)
+    assert server_module.serve_main('127.0.0.1', 0) == 0
+    assert 'Calculator server listening on 127.0.0.1:' in capsys.readouterr().out
+
+def test_serve_main_keyboard_interrupt(monkeypatch, capsys):
+
+    def interrupt(coroutine):
+        coroutine.close()
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(server_module.asyncio, 'run', interrupt)
+    assert server_module.serve_main('127.0.0.1', 0) == 0
+    assert 'Keyboard interrupt detected. Stopping server.' in capsys.readouterr().out
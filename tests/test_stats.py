@@ -0,0 +1,147 @@
+import json
+import pytest
+
+from app.stats import NULL_TIMER, Instrumentation, LatencyHistogram, format_table
+
+# These tests verify the latency histograms and the per-stage instrumentation behind the 'stats' command.
+
+'''
+----------------
+LatencyHistogram
+----------------
+'''
+
+@pytest.mark.parametrize(
+    'value, bucket',
+    [
+        (0, 0),
+        (63, 63),
+        (64, 64),
+        (127, 95),
+        (128, 96),
+        (1000, 4 * 32 + (1000 >> 4)),
+    ],
+    ids=[
+        'bucket_zero',
+        'bucket_last_exact',
+        'bucket_first_shared',
+        'bucket_end_of_power',
+        'bucket_next_power',
+        'bucket_large',
+    ]
+)
+def test_histogram_buckets(value, bucket):
+
+    assert LatencyHistogram.bucket_for(value) == bucket
+    assert LatencyHistogram.bucket_value(bucket) <= value < LatencyHistogram.bucket_value(bucket + 1)
+
+def test_histogram_precision():
+
+    # Every value is within about 3% of the bottom of its bucket
+    for value in range(1, 1_000_000, 997):
+        low = LatencyHistogram.bucket_value(LatencyHistogram.bucket_for(value))
+        assert value - low <= value / 32
+
+def test_histogram_statistics():
+
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.record(value)
+    histogram.record(-5)
+    assert histogram.count == 1001
+    assert histogram.min == 0
+    assert histogram.max == 1000
+    assert histogram.mean == pytest.approx(500500 / 1001)
+    assert histogram.percentile(0) == 0
+    assert 500 <= histogram.percentile(0.5) <= 500 * 1.04
+    assert 990 <= histogram.percentile(0.99) <= 1000
+    assert histogram.percentile(1) == 1000
+
+def test_histogram_empty():
+
+    histogram = LatencyHistogram()
+    assert histogram.percentile(0.5) == 0
+    assert histogram.summary() == {'count': 0, 'mean_ns': 0.0, 'min_ns': 0, 'p50_ns': 0, 'p90_ns': 0, 'p99_ns': 0, 'max_ns': 0}
+
+'''
+---------------
+Instrumentation
+---------------
+'''
+
+def test_timer(monkeypatch):
+
+    # Each mark ends a stage, and the stage times are recorded under the operation when the timer finishes
+    clock = iter([100, 250, 1250, 1300])
+    monkeypatch.setattr('app.stats.time.perf_counter_ns', lambda: next(clock))
+    stats = Instrumentation()
+    timer = stats.timer()
+    timer.mark('input')
+    timer.mark('parse')
+    timer.mark('execute')
+    assert stats.histograms == {}
+    timer.finish('add')
+    assert stats.histograms[('input', 'add')].total == 150
+    assert stats.histograms[('parse', 'add')].total == 1000
+    assert stats.histograms[('execute', 'add')].total == 50
+    assert stats.counters == {('calculations', 'add'): 1}
+
+def test_null_timer():
+
+    # The stand-in timer accepts every call and records nothing
+    NULL_TIMER.mark('input')
+    NULL_TIMER.fail('parse')
+    NULL_TIMER.finish('add')
+
+def test_exports():
+
+    stats = Instrumentation()
+    stats.record('custom', 'add', 3000)
+    stats.record('execute', 'add', 1000)
+    stats.count('errors', 'parse')
+    stats.count('retries', 'x')
+
+    assert [row[:3] for row in stats.rows()] == [['execute', 'add', '1'], ['custom', 'add', '1']]
+    assert stats.rows()[0][3:] == ['1.00', '1.00', '1.00', '1.00']
+
+    exported = json.loads(stats.to_json())
+    assert exported['stages'][0] == {'stage': 'execute', 'operation': 'add', 'count': 1, 'mean_ns': 1000.0, 'min_ns': 1000, 'p50_ns': 1000, 'p90_ns': 1000, 'p99_ns': 1000, 'max_ns': 1000}
+    assert exported['counters'] == [{'name': 'errors', 'label': 'parse', 'value': 1}, {'name': 'retries', 'label': 'x', 'value': 1}]
+
+    assert stats.to_prometheus() == '''
+# HELP calculator_stage_latency_seconds Time spent in each stage of a REPL calculation.
+# TYPE calculator_stage_latency_seconds summary
+calculator_stage_latency_seconds{stage="execute",operation="add",quantile="0.5"} 0.000001000
+calculator_stage_latency_seconds{stage="execute",operation="add",quantile="0.9"} 0.000001000
+calculator_stage_latency_seconds{stage="execute",operation="add",quantile="0.99"} 0.000001000
+calculator_stage_latency_seconds_sum{stage="execute",operation="add"} 0.000001000
+calculator_stage_latency_seconds_count{stage="execute",operation="add"} 1
+calculator_stage_latency_seconds{stage="custom",operation="add",quantile="0.5"} 0.000003000
+calculator_stage_latency_seconds{stage="custom",operation="add",quantile="0.9"} 0.000003000
+calculator_stage_latency_seconds{stage="custom",operation="add",quantile="0.99"} 0.000003000
+calculator_stage_latency_seconds_sum{stage="custom",operation="add"} 0.000003000
+calculator_stage_latency_seconds_count{stage="custom",operation="add"} 1
+# TYPE calculator_errors_total counter
+calculator_errors_total{stage="parse"} 1
+# TYPE calculator_retries_total counter
+calculator_retries_total{label="x"} 1
+'''.lstrip()
+
+    stats.reset()
+    assert stats.rows() == []
+    assert stats.counters == {}
+
+'''
+------------
+format_table
+------------
+'''
+
+def test_format_table():
+
+    assert format_table(['name', 'value'], [['a', 1], ['long name', 22]]) == '''
+name       value
+---------  -----
+a          1
+long name  22
+'''.strip()
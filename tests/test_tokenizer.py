@@ -0,0 +1,86 @@
+import pytest
+
+from fractions import Fraction
+
+from app.calculation import CalculationFactory
+from app.tokenizer import INVALID_NUMBER, WRONG_FIELD_COUNT, LineParser, parse_line
+
+# These tests verify the line parser used by the REPL and batch mode.
+
+@pytest.mark.parametrize(
+    'line, expected',
+    [
+        ('add 1 2', ('add', 1.0, 2.0)),
+        ('  Multiply\t-1.5e3   +.5  \n', ('Multiply', -1500.0, 0.5)),
+        ('divide 1_000.5 -INFINITY', ('divide', 1000.5, float('-inf'))),
+        ('subtract 7. 1E-2', ('subtract', 7.0, 0.01)),
+        ('add ١٢ 3', ('add', 12.0, 3.0)),
+        ('', WRONG_FIELD_COUNT),
+        ('add 1', WRONG_FIELD_COUNT),
+        ('add 1 2 3', WRONG_FIELD_COUNT),
+        ('add x 2', INVALID_NUMBER),
+        ('add 1 1.2.3', INVALID_NUMBER),
+        ('add 1e 2', INVALID_NUMBER),
+        ('add 1__0 2', INVALID_NUMBER),
+        ('add -+1 2', INVALID_NUMBER),
+        ('add ٣x 1', INVALID_NUMBER),
+    ],
+    ids=[
+        'simple',
+        'whitespace_sign_exponent',
+        'underscore_infinity',
+        'trailing_point_exponent',
+        'non_ascii_digits',
+        'empty',
+        'too_few_fields',
+        'too_many_fields',
+        'not_a_number',
+        'two_points',
+        'empty_exponent',
+        'double_underscore',
+        'two_signs',
+        'non_ascii_junk',
+    ]
+)
+def test_parse_line(line, expected):
+
+    assert parse_line(line) == expected
+
+def test_parser_remembers_rejected_tokens(monkeypatch):
+
+    # Only the bad token of a bad line is remembered, and a line holding one is rejected without parsing it again
+    parser = LineParser()
+    assert parser.parse('add 2.5 N/A') == INVALID_NUMBER
+    assert parser._state[2] == {'N/A'}
+    calls = []
+    monkeypatch.setattr(parser, '_state', (parser._state[0], lambda token: calls.append(token) or float(token), parser._state[2]))
+    assert parser.parse('subtract N/A 1') == INVALID_NUMBER
+    assert parser.parse('subtract 3 1') == ('subtract', 3.0, 1.0)
+    assert calls == ['3', '1']
+
+def test_parser_memo_size():
+
+    # The rejected tokens are forgotten when there are memo_size of them, so the set never holds more
+    parser = LineParser(memo_size=2)
+    for i in range(10):
+        assert parser.parse(f'add x{i} y{i}') == INVALID_NUMBER
+        assert len(parser._state[2]) <= 2
+    assert parser._state[2] == {'x9', 'y9'}
+    parser.clear()
+    assert parser._state == (None, None, set())
+
+def test_parser_backends():
+
+    # Numbers are parsed by the current backend, and the tokens it rejected are forgotten when it changes
+    parser = LineParser()
+    assert parser.parse('add 1 3') == ('add', 1.0, 3.0)
+    CalculationFactory.set_backend('fraction')
+    assert parser.parse('add 1 3') == ('add', Fraction(1), Fraction(3))
+    assert type(parser.parse('add 1 3')[1]) is Fraction
+    assert parser.parse('add 1/3 x') == INVALID_NUMBER
+    assert parser.parse('add 1/0 1') == INVALID_NUMBER
+    assert parser._state[2] == {'x', '1/0'}
+    CalculationFactory.set_backend('float')
+    assert parser.parse('add 1/3 1') == INVALID_NUMBER
+    assert parser.parse('add 1 x') == INVALID_NUMBER
+    assert parser._state[2] == {'1/3', 'x'}
@@ -0,0 +1,171 @@
+import pytest
+
+from decimal import Decimal
+from fractions import Fraction
+
+from app.calculation import AddCalculation, CalculationFactory, MultiplyCalculation
+from app.workbook import INVALID_CELL, Workbook
+
+# These tests verify the workbook of named cells: dependencies, incremental recompute and cycle detection.
+
+@pytest.fixture
+def workbook():
+
+    # x -> y -> z, x -> z, and an unrelated cell u
+    workbook = Workbook()
+    workbook.set('x', '5')
+    workbook.set('y', 'add x 2')
+    workbook.set('z', 'multiply y x')
+    workbook.set('u', 'subtract 10 4')
+    return workbook
+
+def test_workbook_values(workbook):
+
+    assert [(cell.name, cell.value) for cell in workbook] == [('x', 5.0), ('y', 7.0), ('z', 35.0), ('u', 6.0)]
+    assert workbook.value('z') == 35.0
+    assert workbook['y'].calculation_class is AddCalculation
+    assert 'y' in workbook and 'w' not in workbook
+    assert len(workbook) == 4
+    with pytest.raises(KeyError):
+        workbook['w']
+
+def test_workbook_recomputes_downstream_only(workbook, monkeypatch):
+
+    # Changing x recomputes x, y and z, in topological order; u keeps its cached value
+    evaluated = []
+    evaluate = workbook._evaluate
+    monkeypatch.setattr(workbook, '_evaluate', lambda cell: evaluated.append(cell.name) or evaluate(cell))
+    assert workbook.set('x', '10') == ['x', 'y', 'z']
+    assert evaluated == ['x', 'y', 'z']
+    assert workbook.value('z') == 120.0
+
+    evaluated.clear()
+    assert workbook.set('y', 'add x x') == ['y', 'z']
+    assert workbook.value('z') == 200.0
+    assert workbook.set('u', '1') == ['u']
+    assert evaluated == ['y', 'z', 'u']
+
+def test_workbook_diamond_order():
+
+    # a -> b, a -> c, b and c -> d: d is recomputed once, after both b and c
+    workbook = Workbook()
+    workbook.set('a', '1')
+    workbook.set('c', 'multiply a 10')
+    workbook.set('b', 'add a 1')
+    workbook.set('d', 'add b c')
+    order = workbook.set('a', '2')
+    assert order[0] == 'a' and order[-1] == 'd' and sorted(order[1:3]) == ['b', 'c']
+    assert workbook.value('d') == 23.0
+
+def test_workbook_redefine_drops_old_dependency(workbook):
+
+    workbook.set('z', 'multiply u 2')
+    assert workbook.set('x', '1') == ['x', 'y']
+    assert workbook.set('u', '3') == ['u', 'z']
+    assert workbook.value('z') == 6.0
+
+@pytest.mark.parametrize(
+    'name, formula',
+    [('x', 'add x 1'), ('x', 'add z 1'), ('y', 'multiply 2 z')],
+    ids=['self_reference', 'long_cycle', 'short_cycle']
+)
+def test_workbook_cycle(workbook, name, formula):
+
+    before = [str(cell) for cell in workbook]
+    with pytest.raises(ValueError, match=f"Cycle: cell '{name}' would depend on itself."):
+        workbook.set(name, formula)
+    assert [str(cell) for cell in workbook] == before
+    assert workbook.set('x', '2') == ['x', 'y', 'z']
+
+@pytest.mark.parametrize(
+    'name, formula, message',
+    [
+        ('x', 'add 1', INVALID_CELL),
+        ('x', '', INVALID_CELL),
+        ('x', 'y', INVALID_CELL),
+        ('x', 'add w 1', "Unknown cell: 'w'."),
+        ('x', 'add 1 2$', "Invalid operand: '2$'. Use a number or a cell name."),
+        ('x', 'power 1 2', "Unsupported calculation type: 'power'. Available types: add, divide, multiply, subtract"),
+        ('1x', '1', "Invalid cell name: '1x'. Names start with a letter or _ and contain only letters, digits and _."),
+    ],
+    ids=['too_few_operands', 'empty', 'bare_reference', 'unknown_cell', 'invalid_operand', 'unknown_operation', 'invalid_name']
+)
+def test_workbook_invalid(workbook, name, formula, message):
+
+    with pytest.raises(ValueError) as error_info:
+        workbook.set(name, formula)
+    assert str(error_info.value) == message
+    assert workbook.value('x') == 5.0
+
+def test_workbook_errors_propagate(workbook):
+
+    # A cell without a value makes every cell downstream of it valueless too, until it is fixed
+    workbook.set('y', 'divide x 0')
+    assert str(workbook['y']) == 'y = divide x 0.0: Cannot divide by zero.'
+    assert str(workbook['z']) == "z = multiply y x: Cell 'y' has no value."
+    with pytest.raises(ValueError, match="Cell 'z' has no value: Cell 'y' has no value."):
+        workbook.value('z')
+    workbook.set('y', 'add x 1')
+    assert workbook.value('z') == 30.0
+
+def test_workbook_calculation_error(workbook, monkeypatch):
+
+    monkeypatch.setattr(MultiplyCalculation, 'execute', lambda self: 1 / 'x')
+    workbook.set('x', '1')
+    assert workbook['z'].error.startswith('An error occurred during calculation: ')
+
+def test_workbook_formula_text(workbook):
+
+    assert [cell.formula() for cell in workbook] == ['5.0', 'add x 2.0', 'multiply y x', 'subtract 10.0 4.0']
+    assert [str(cell) for cell in workbook] == ['x = 5.0', 'y = add x 2.0 = 7.0', 'z = multiply y x = 35.0', 'u = subtract 10.0 4.0 = 6.0']
+
+def test_workbook_backend():
+
+    CalculationFactory.set_backend('fraction')
+    workbook = Workbook()
+    workbook.set('third', 'divide 1 3')
+    workbook.set('x', 'add third 1/3')
+    assert workbook.value('x') == Fraction(2, 3)
+
+def test_workbook_set_backend(workbook):
+
+    # Numbers are parsed again from the text they were entered as, so cells set before and after the switch do not mix types
+    workbook.set('a', '0.1')
+    assert workbook.set_backend('decimal') == 5
+    workbook.set('b', 'add a 0.2')
+    assert workbook.value('b') == Decimal('0.3')
+    assert workbook.value('z') == Decimal(35)
+    assert workbook['u'].formula() == 'subtract 10 4'
+
+def test_workbook_set_backend_unreadable(workbook):
+
+    # A number the new backend cannot read leaves the backend and the workbook as they were
+    workbook.set('a', '0.5')
+    with pytest.raises(ValueError, match="Cannot switch to the int backend: it cannot read '0.5' in cell 'a'."):
+        workbook.set_backend('int')
+    assert CalculationFactory.backend().name == 'float'
+    assert workbook['x'].value.__class__ is float
+    assert workbook.value('a') == 0.5
+
+def test_workbook_long_chain():
+
+    # The graph is walked without recursion, so a long chain works
+    workbook = Workbook()
+    workbook.set('c0', '0')
+    for i in range(1, 5000):
+        workbook.set(f'c{i}', f'add c{i - 1} 1')
+    assert len(workbook.set('c0', '1')) == 5000
+    assert workbook.value('c4999') == 5000.0
+    with pytest.raises(ValueError, match='Cycle'):
+        workbook.set('c0', 'add c4999 1')
+
+def test_workbook_recompute_all(workbook, monkeypatch):
+
+    # Redefined cells can use cells defined after them, so the full recompute follows the dependencies, not the definition order
+    workbook.set('x', 'add u 1')
+    evaluated = []
+    evaluate = workbook._evaluate
+    monkeypatch.setattr(workbook, '_evaluate', lambda cell: evaluated.append(cell.name) or evaluate(cell))
+    assert workbook.recompute_all() == 4
+    assert evaluated == ['u', 'x', 'y', 'z']
+    assert workbook.value('z') == 63.0